@@ -1,13 +1,10 @@
-import os
-from flask import Flask
+import threading
+import time
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
 # Initialize extensions
 db = SQLAlchemy()
@@ -15,21 +12,103 @@ bcrypt = Bcrypt()
 jwt = JWTManager()
 mail = Mail()
 
+def init_migrate(app):
+    """Attach Flask-Migrate; only the `flask db` commands need it, and it pulls in Alembic"""
+    from flask_migrate import Migrate
+    Migrate(app, db, render_as_batch=True)
+
+_extension_lock = threading.Lock()
+
+def lazy_extension(name, factory):
+    """Get one of the current app's services, building it with `factory(app)` on first use"""
+    app = current_app._get_current_object()
+    extension = app.extensions.get(name)
+    if extension is None:
+        with _extension_lock:
+            extension = app.extensions.get(name)
+            if extension is None:
+                extension = app.extensions[name] = factory(app)
+    return extension
+
+def start_background_workers(app):
+    """Start the background workers enabled in the app's config, once
+
+    Servers start them at boot and any other app before its first request,
+    so CLI commands, migrations and benchmarks that only build the app never
+    start threads.
+    """
+    with _extension_lock:
+        if 'background_workers' in app.extensions:
+            return
+        app.extensions['background_workers'] = True
+
+    from app.services.worker import BackgroundWorker
+
+    # Deliver queued emails in the background
+    if app.config['EMAIL_OUTBOX_WORKER']:
+        from app.services.email_service import deliver_pending_emails
+        app.extensions['email_worker'] = BackgroundWorker(
+            app, 'email-outbox', deliver_pending_emails, app.config['EMAIL_OUTBOX_POLL_INTERVAL']
+        ).start()
+    
+    # Parse uploaded documents in the background
+    if app.config['DOCUMENT_WORKER']:
+        from app.services.document_service import process_pending_documents
+        app.extensions['document_worker'] = BackgroundWorker(
+            app, 'document-processing', process_pending_documents, app.config['DOCUMENT_POLL_INTERVAL']
+        ).start()
+    
+    # Write buffered access events in the background
+    if app.config['ACCESS_LOG_ENABLED'] and app.config['ACCESS_LOG_WORKER']:
+        from app.services.access_service import flush_access_events
+        app.extensions['access_log_worker'] = BackgroundWorker(
+            app, 'access-log', flush_access_events, app.config['ACCESS_LOG_FLUSH_INTERVAL']
+        ).start()
+    
+    # Reconcile storage with the database and apply retention policies in the background
+    if app.config['STORAGE_SWEEPER']:
+        from app.services.sweep_service import sweep_storage_periodically
+        app.extensions['storage_sweeper'] = BackgroundWorker(
+            app, 'storage-sweep', sweep_storage_periodically, app.config['STORAGE_SWEEP_INTERVAL']
+        ).start()
+
 def create_app(config_name='development'):
+    from app.services.ingest_service import IngestRequest
+
     app = Flask(__name__)
+    app.request_class = IngestRequest
+    timings = app.extensions['startup_timings'] = {}
+
+    def timed(name, init, *args):
+        started = time.perf_counter()
+        init(*args)
+        timings[name] = time.perf_counter() - started
     
     # Load configuration
     from app.config import config_by_name
     app.config.from_object(config_by_name[config_name])
     
+    # Take the client address from the trusted proxies' X-Forwarded-For
+    if app.config['PROXY_FIX_X_FOR']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
     # Initialize extensions with app
-    db.init_app(app)
-    bcrypt.init_app(app)
-    jwt.init_app(app)
-    mail.init_app(app)
+    timed('db', db.init_app, app)
+    timed('bcrypt', bcrypt.init_app, app)
+    timed('jwt', jwt.init_app, app)
+    timed('mail', mail.init_app, app)
     
-    # Create upload directory if it doesn't exist
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Hook application services into the app; the schema is left to migrations,
+    # and storage, caches and buckets are built on first use
+    from app.services.identity_service import init_identity_loader
+    from app.services.database_service import init_database
+    from app.services.metrics_service import init_metrics
+    from app.services.blocklist_service import init_token_blocklist
+    timed('database', init_database, app)
+    timed('identity', init_identity_loader, app, jwt)
+    timed('token_blocklist', init_token_blocklist, app, jwt)
+    timed('metrics', init_metrics, app)
     
     # Register blueprints
     from app.routes.auth_routes import auth_bp
@@ -38,9 +117,13 @@ def create_app(config_name='development'):
     app.register_blueprint(auth_bp)
     app.register_blueprint(file_bp)
     
-    # Create all database tables
-    with app.app_context():
-        db.create_all()
+    from app.commands import register_commands
+    register_commands(app)
+    
+    @app.before_request
+    def start_workers():
+        if 'background_workers' not in app.extensions:
+            start_background_workers(app)
     
     @app.route('/')
     def index():
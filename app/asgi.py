@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from app import create_app, start_background_workers
+
+class AsgiBridge:
+    """Serve the Flask app over ASGI without pinning a thread per transfer
+
+    Request bodies are received on the event loop before the view runs,
+    in memory up to `spool_size` bytes and in a temporary file past that,
+    and response bodies are pulled one chunk at a time, each chunk (and
+    each spooled write) on a short trip to a small thread pool.  A slow
+    client therefore only holds a coroutine, never a thread, for the length
+    of its upload or download; threads are busy only while views, chunk
+    reads and spool writes actually run.
+
+    Each request runs in one contextvars.Context across every hop, so
+    Flask's request context and `stream_with_context` work unchanged.
+    """
+
+    def __init__(self, app, max_threads, spool_size):
+        self.app = app
+        self.spool_size = spool_size
+        self.executor = ThreadPoolExecutor(max_threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']!r}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_background_workers(self.app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _receive_body(self, receive):
+        """Receive the whole body, spooling it to disk past `spool_size` bytes
+
+        Returns the spooled body and its size, or None when it is over
+        MAX_CONTENT_LENGTH.
+        """
+        limit = self.app.config['MAX_CONTENT_LENGTH']
+        loop = asyncio.get_running_loop()
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        size = 0
+        more = True
+        try:
+            while more:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise ConnectionAbortedError()
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    spool.close()
+                    return None
+                if size > self.spool_size:
+                    # Rolled over to a file: keep disk writes off the event loop
+                    await loop.run_in_executor(self.executor, spool.write, chunk)
+                else:
+                    spool.write(chunk)
+                more = message.get('more_body', False)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool, size
+
+    def _environ(self, scope, body, content_length):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'CONTENT_LENGTH': str(content_length),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    async def _watch_disconnect(self, receive, disconnected):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    async def _http(self, scope, receive, send):
+        try:
+            received = await self._receive_body(receive)
+        except ConnectionAbortedError:
+            return
+        if received is None:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': b'{"message": "Request body too large"}'})
+            return
+
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        body, content_length = received
+
+        def run(fn, *args):
+            return loop.run_in_executor(self.executor, context.run, fn, *args)
+
+        started = {}
+
+        def write(data):
+            raise RuntimeError('The WSGI write() callable is not supported')
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+            return write
+
+        disconnected = asyncio.Event()
+        watcher = None
+        end = object()
+        iterable = None
+        try:
+            iterable = await run(self.app.wsgi_app, self._environ(scope, body, content_length), start_response)
+            watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+            iterator = iter(iterable)
+            chunk = await run(next, iterator, end)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not end and not disconnected.is_set():
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await run(next, iterator, end)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            if iterable is not None and hasattr(iterable, 'close'):
+                await run(iterable.close)
+            body.close()
+
+def create_asgi_app(config_name=None):
+    """Build the ASGI application, e.g. ``uvicorn --factory app.asgi:create_asgi_app``"""
+    load_dotenv()
+    app = create_app(config_name or os.getenv('FLASK_ENV', 'development'))
+    return AsgiBridge(app, app.config['ASGI_MAX_THREADS'], app.config['ASGI_SPOOL_SIZE'])
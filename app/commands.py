@@ -0,0 +1,166 @@
+import os
+import click
+from flask.cli import ScriptInfo, with_appcontext
+
+class LazyMigrateGroup(click.Group):
+    """The Flask-Migrate `db` commands, imported only when `flask db` runs
+
+    Flask-Migrate pulls in Alembic, which would otherwise be imported by
+    every worker and test that builds the app.
+    """
+
+    def _migrate_group(self, ctx):
+        from flask_migrate.cli import db as migrate_group
+        from app import init_migrate
+
+        app = ctx.ensure_object(ScriptInfo).load_app()
+        if 'migrate' not in app.extensions:
+            init_migrate(app)
+        return migrate_group
+
+    def list_commands(self, ctx):
+        return self._migrate_group(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._migrate_group(ctx).get_command(ctx, name)
+
+db_group = LazyMigrateGroup('db', help='Perform database migrations.')
+
+@click.command('deliver-emails')
+@click.option('--batch-size', type=int, default=None, help='Emails to send per SMTP connection.')
+@with_appcontext
+def deliver_emails_command(batch_size):
+    """Deliver every due email in the outbox."""
+    from app.services.email_service import deliver_pending_emails
+
+    total = 0
+    while True:
+        sent = deliver_pending_emails(batch_size)
+        if not sent:
+            break
+        total += sent
+    click.echo(f'Delivered {total} emails')
+
+@click.group('storage')
+def storage_group():
+    """Manage stored file bytes."""
+
+@storage_group.command('migrate')
+@with_appcontext
+def storage_migrate_command():
+    """Move flat UPLOAD_FOLDER files into the sharded local layout."""
+    from app.services.storage_service import get_storage, LocalStorage
+
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise click.ClickException('Migration only applies to the local storage backend')
+    click.echo(f'Moved {storage.migrate_flat_files()} files into {storage.root}')
+
+@storage_group.command('sweep')
+@click.option('--batch-size', type=int, default=None, help='Keys or rows to check per batch.')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without removing it.')
+@click.option('--force', is_flag=True, help='Delete files with missing bytes however many there are.')
+@with_appcontext
+def storage_sweep_command(batch_size, dry_run, force):
+    """Delete orphaned bytes, dangling rows and data past its retention period."""
+    from app.services.sweep_service import SWEEP_COUNTERS, SweepAborted, run_sweep
+
+    try:
+        report = run_sweep(batch_size=batch_size, dry_run=dry_run, force=force)
+    except SweepAborted as e:
+        raise click.ClickException(str(e))
+    for name in SWEEP_COUNTERS:
+        click.echo(f'  {name:<24}{report[name]}')
+    if dry_run:
+        click.echo(f"Would reclaim {report['bytes_reclaimed']} bytes")
+    else:
+        click.echo(f"Reclaimed {report['bytes_reclaimed']} bytes")
+
+@click.group('search')
+def search_group():
+    """Manage the full-text search index."""
+
+@search_group.command('reindex')
+@click.option('--batch-size', type=int, default=500, help='Files to queue per transaction.')
+@with_appcontext
+def search_reindex_command(batch_size):
+    """Queue every stored file to be parsed and indexed again."""
+    from sqlalchemy.orm import selectinload
+    from app import db
+    from app.models import File
+    from app.services.document_service import enqueue_processing, notify_processing
+
+    total = 0
+    last_id = 0
+    while True:
+        files = File.query.options(selectinload(File.processing_job)) \
+            .filter(File.id > last_id).order_by(File.id).limit(batch_size).all()
+        if not files:
+            break
+        for file in files:
+            enqueue_processing(file)
+        db.session.commit()
+        total += len(files)
+        last_id = files[-1].id
+    notify_processing()
+    click.echo(f'Queued {total} files for indexing')
+
+@click.command('process-documents')
+@click.option('--batch-size', type=int, default=None, help='Documents to parse per batch.')
+@with_appcontext
+def process_documents_command(batch_size):
+    """Parse every due document in the processing queue."""
+    from app.services.document_service import process_pending_documents
+
+    total = 0
+    while True:
+        processed = process_pending_documents(batch_size)
+        if not processed:
+            break
+        total += processed
+    click.echo(f'Processed {total} documents')
+
+@click.command('calibrate-bcrypt')
+@click.option('--target-ms', type=int, default=None, help='Hash time to aim for (BCRYPT_TARGET_MS).')
+@with_appcontext
+def calibrate_bcrypt_command(target_ms):
+    """Time bcrypt on this machine and print the cost to set for every worker."""
+    from flask import current_app
+    from app.services.auth_service import calibrate_log_rounds
+
+    config = current_app.config
+    rounds = calibrate_log_rounds(
+        target_ms or config['BCRYPT_TARGET_MS'], config['BCRYPT_MIN_ROUNDS'], config['BCRYPT_MAX_ROUNDS']
+    )
+    click.echo(f'BCRYPT_LOG_ROUNDS={rounds}')
+
+@click.command('startup-profile')
+@click.option('--config', 'config_name', default=lambda: os.getenv('FLASK_ENV', 'development'),
+              help='Configuration to start the app with.')
+@click.option('--top', type=int, default=15, help='Packages to list by import time.')
+def startup_profile_command(config_name, top):
+    """Report import and init time per component of a cold app start."""
+    from app.services.startup_service import profile_startup
+
+    profile = profile_startup(config_name)
+    click.echo(f"import app    {profile['import_seconds'] * 1000:8.1f} ms")
+    click.echo(f"create_app()  {profile['create_app_seconds'] * 1000:8.1f} ms")
+
+    click.echo('\nInit time per component:')
+    for name, seconds in sorted(profile['components'].items(), key=lambda item: -item[1]):
+        click.echo(f'  {name:<24}{seconds * 1000:8.1f} ms')
+
+    click.echo('\nImport time per package:')
+    packages = sorted(profile['packages'].items(), key=lambda item: -item[1])
+    for name, seconds in packages[:top]:
+        click.echo(f'  {name:<24}{seconds * 1000:8.1f} ms')
+
+def register_commands(app):
+    """Attach the project's CLI commands to the app"""
+    app.cli.add_command(deliver_emails_command)
+    app.cli.add_command(storage_group)
+    app.cli.add_command(search_group)
+    app.cli.add_command(process_documents_command)
+    app.cli.add_command(calibrate_bcrypt_command)
+    app.cli.add_command(startup_profile_command)
+    app.cli.add_command(db_group)
@@ -5,11 +5,109 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'my_precious_secret_key')
     DEBUG = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000
+    }
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
+    # Chunked upload parts are staged on local disk whatever the storage backend
+    UPLOAD_STAGING_FOLDER = os.path.join(UPLOAD_FOLDER, '.sessions')
     ALLOWED_EXTENSIONS = {'pptx', 'docx', 'xlsx'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max upload size
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+    # Storage: 'local' (UPLOAD_FOLDER, sharded by hash prefix), 'memory' or 's3'
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+    STORAGE_SHARD_DEPTH = 2
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+
+    # Storage sweeper (`flask storage sweep`, or a background thread with STORAGE_SWEEPER=True in
+    # one process): removes orphaned bytes, dangling rows and data past its retention period.
+    # Anything modified within STORAGE_ORPHAN_GRACE may belong to an upload in flight and is kept.
+    STORAGE_SWEEPER = os.getenv('STORAGE_SWEEPER', 'False') == 'True'
+    STORAGE_SWEEP_INTERVAL = 600
+    STORAGE_SWEEP_BATCH_SIZE = 500
+    STORAGE_SWEEP_MAX_BATCHES = 20  # per scan and background pass; the next pass resumes where it stopped
+    STORAGE_ORPHAN_GRACE = timedelta(hours=1)
+    # Past this many files, stop if more than this share of those checked have no bytes (storage unmounted?)
+    STORAGE_SWEEP_MISSING_ALLOWANCE = 10
+    STORAGE_SWEEP_MAX_MISSING_SHARE = 0.01
+    UPLOAD_SESSION_TTL = timedelta(days=1)  # unfinished chunked uploads are discarded after this
+    FILE_RETENTION_DAYS = int(os.getenv('FILE_RETENTION_DAYS', 0)) or None  # None keeps files forever
+    EMAIL_OUTBOX_RETENTION_DAYS = 30  # sent and failed emails
+
+    UPLOAD_SESSION_MAX_PARTS = 10000
+    UPLOAD_SESSION_MAX_SIZE = 5 * 1024 * 1024 * 1024  # 5 GB per chunked upload
+    BATCH_UPLOAD_MAX_FILES = 500
+    BATCH_UPLOAD_MAX_ARCHIVE_SIZE = 1024 * 1024 * 1024  # uncompressed bytes per zip
+    BATCH_UPLOAD_WORKERS = 8
+    FILE_LIST_PAGE_SIZE = 50
+    FILE_LIST_MAX_PAGE_SIZE = 500
+
+    # Response cache for /file/list and download links, keyed by the catalog version.
+    # Other worker processes see a new version within CATALOG_VERSION_TTL seconds.
+    CATALOG_VERSION_TTL = 1
+    RESPONSE_CACHE_SIZE = 1024
+    RESPONSE_CACHE_TTL = 600
+    RESPONSE_CACHE_MIN_COMPRESS_SIZE = 1024  # smaller bodies are sent uncompressed
+    RESPONSE_CACHE_MAX_BODY_SIZE = 256 * 1024  # larger pages are streamed on every request
+    DOWNLOAD_LINK_REUSE = 0.5  # fraction of a link's lifetime during which it is handed out again
+    DOWNLOAD_LINKS_MAX_FILES = 500  # file ids per POST /file/download/links
+
+    # Full-text search
+    SEARCH_PAGE_SIZE = 20
+    SEARCH_MAX_PAGE_SIZE = 100
+    SEARCH_MAX_TEXT_CHARS = 1_000_000  # extracted characters indexed per document
+
+    # Downloads: None streams through the worker, 'x-accel-redirect' (nginx) or
+    # 'x-sendfile' (Apache/lighttpd) hand the transfer to the front proxy
+    DOWNLOAD_OFFLOAD = os.getenv('DOWNLOAD_OFFLOAD') or None
+    DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+    DOWNLOAD_MAX_RANGES = 16
+    DOWNLOAD_LINK_TTL = int(os.getenv('DOWNLOAD_LINK_TTL', 3600))  # seconds a download link stays valid
+    # Link revocations reach other workers within DOWNLOAD_REVOCATION_REFRESH seconds
+    DOWNLOAD_REVOCATION_REFRESH = 1
+    DOWNLOAD_REVOCATION_HOLE_GRACE = 60
+    ARCHIVE_MAX_FILES = 500
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt_secret_key')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=1)
+    # Revocations reach other workers within JWT_BLOCKLIST_REFRESH seconds
+    JWT_BLOCKLIST_REFRESH = 1
+    JWT_BLOCKLIST_HOLE_GRACE = 60
+    IDENTITY_CACHE_SIZE = 10000
+    IDENTITY_CACHE_TTL = 60  # seconds before other workers see a role change
+
+    # Password hashing: `flask calibrate-bcrypt` suggests the BCRYPT_LOG_ROUNDS
+    # that hashes within BCRYPT_TARGET_MS; set it once for every worker
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    BCRYPT_TARGET_MS = int(os.getenv('BCRYPT_TARGET_MS', 250))
+    BCRYPT_MIN_ROUNDS = 10
+    BCRYPT_MAX_ROUNDS = 15
+    BCRYPT_MAX_WORKERS = None  # defaults to the CPU count
+    BCRYPT_MAX_PENDING = 32
+    BCRYPT_TIMEOUT = 10
+
+    # Token buckets for auth endpoints as (burst, seconds to refill it), per client IP and per email.
+    # 'memory' limits each worker process; 'sqlite' shares the buckets between workers on one host.
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+    RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'memory')
+    RATE_LIMIT_SQLITE_PATH = os.getenv(
+        'RATE_LIMIT_SQLITE_PATH',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'rate_limits.sqlite')
+    )
+    RATE_LIMIT_MEMORY_SIZE = 100000
+    RATE_LIMIT_IDLE_SECONDS = 3600
+    RATE_LIMITS = {
+        'login_per_ip': (30, 60),
+        'login_per_email': (10, 300),
+        'signup_per_ip': (10, 600)
+    }
+    # Reverse proxies in front of the app whose X-Forwarded-For entry names the client; 0 trusts none
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
     
     # Email configuration
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -19,6 +117,47 @@ class Config:
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD', 'your-email-password')
     MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'no-reply@filesharing.com')
 
+    # Outbox delivery: emails are queued in the database and sent by a worker thread
+    EMAIL_OUTBOX_WORKER = os.getenv('EMAIL_OUTBOX_WORKER', 'True') == 'True'
+    EMAIL_OUTBOX_POLL_INTERVAL = 5
+    EMAIL_OUTBOX_BATCH_SIZE = 50
+    EMAIL_OUTBOX_LEASE_SECONDS = 300
+    EMAIL_MAX_ATTEMPTS = 5
+    EMAIL_RETRY_BASE_SECONDS = 30
+    EMAIL_RETRY_MAX_SECONDS = 3600
+
+    # Document processing: uploads queue a job that a worker thread parses on a process pool
+    DOCUMENT_WORKER = os.getenv('DOCUMENT_WORKER', 'True') == 'True'
+    DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', 0)) or None  # processes; defaults to the CPU count
+    DOCUMENT_POLL_INTERVAL = 5
+    DOCUMENT_BATCH_SIZE = 20
+    DOCUMENT_LEASE_SECONDS = 300
+    DOCUMENT_TIMEOUT = 120  # seconds to wait for one document to parse
+    DOCUMENT_MAX_ATTEMPTS = 3
+    DOCUMENT_RETRY_BASE_SECONDS = 30
+    DOCUMENT_RETRY_MAX_SECONDS = 3600
+    DOCUMENT_PREVIEW_CHARS = 500
+    DOCUMENT_PREVIEW_MAX_AGE = 300  # seconds clients may cache a finished preview
+
+    # Access audit: downloads and issued links are buffered per worker and written in bulk
+    # every ACCESS_LOG_FLUSH_INTERVAL seconds, once ACCESS_LOG_FLUSH_SIZE are waiting, and at exit
+    ACCESS_LOG_ENABLED = os.getenv('ACCESS_LOG_ENABLED', 'True') == 'True'
+    ACCESS_LOG_WORKER = os.getenv('ACCESS_LOG_WORKER', 'True') == 'True'
+    ACCESS_LOG_FLUSH_INTERVAL = 5
+    ACCESS_LOG_FLUSH_SIZE = 500
+    ACCESS_LOG_MAX_BUFFER = 50000  # the oldest events are dropped beyond this while the database is down
+    ACCESS_LOG_RETENTION_DAYS = 365  # events only; the counters are kept
+    ACCESS_STATS_RECENT_EVENTS = 20
+    ACCESS_STATS_MAX_LIMIT = 100
+
+    # Prometheus metrics at /metrics; set PROMETHEUS_MULTIPROC_DIR when running several workers
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    # ASGI serving (app.asgi): threads run views and chunk reads, never whole transfers
+    ASGI_MAX_THREADS = int(os.getenv('ASGI_MAX_THREADS', 32))
+    ASGI_SPOOL_SIZE = 1024 * 1024  # larger request bodies are spooled to a temporary file
+
 class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.getenv('DEV_DATABASE_URL', 'sqlite:///dev_db.sqlite')
@@ -27,14 +166,43 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite:///test_db.sqlite')
+    EMAIL_OUTBOX_WORKER = False
+    DOCUMENT_WORKER = False
+    STORAGE_SWEEPER = False
+    ACCESS_LOG_ENABLED = False  # tests/test_access.py turns it on
+    ACCESS_LOG_WORKER = False
+    DOCUMENT_WORKERS = 2
+    BCRYPT_LOG_ROUNDS = 4
+    STORAGE_BACKEND = 'memory'
     PRESERVE_CONTEXT_ON_EXCEPTION = False
+    JWT_BLOCKLIST_REFRESH = 60  # the test app's own revocations still apply at once
+    DOWNLOAD_REVOCATION_REFRESH = 60
+
+class BenchmarkConfig(Config):
+    # Used by the benchmarks package: production-like costs on a throwaway database
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCHMARK_DATABASE_URL', 'sqlite:///benchmark.sqlite')
+    UPLOAD_FOLDER = os.getenv('BENCHMARK_UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/benchmark_uploads'))
+    UPLOAD_STAGING_FOLDER = os.path.join(UPLOAD_FOLDER, '.sessions')
+    STORAGE_BACKEND = 'local'
+    EMAIL_OUTBOX_WORKER = False
+    DOCUMENT_WORKER = False
+    STORAGE_SWEEPER = False
+    RATE_LIMIT_ENABLED = False  # the login and signup scenarios come from a single address
 
 class ProductionConfig(Config):
     DEBUG = False
-    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///prod_db.sqlite')
+    # Heroku-style URLs use the 'postgres' scheme, which SQLAlchemy no longer accepts
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///prod_db.sqlite').replace('postgres://', 'postgresql://', 1)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_recycle': 1800,
+        'pool_pre_ping': True
+    }
 
 config_by_name = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'production': ProductionConfig
 }
\ No newline at end of file
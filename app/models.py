@@ -1,6 +1,8 @@
 import uuid
 from datetime import datetime
-from app import db, bcrypt
+from sqlalchemy import DDL, event
+from app import db
+from app.services.auth_service import hash_password, verify_password, needs_rehash
 from enum import Enum
 
 class UserRole(Enum):
@@ -13,19 +15,25 @@ class User(db.Model):
     password_hash = db.Column(db.String(128), nullable=False)
     role = db.Column(db.String(20), nullable=False)
     is_verified = db.Column(db.Boolean, default=False)
-    verification_token = db.Column(db.String(100), nullable=True)
+    verification_token = db.Column(db.String(100), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     files = db.relationship('File', backref='owner', lazy=True)
 
     def __init__(self, email, password, role):
         self.email = email
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.set_password(password)
         self.role = role
         self.is_verified = True
         self.verification_token = str(uuid.uuid4())
 
+    def set_password(self, password):
+        self.password_hash = hash_password(password)
+
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def is_ops_user(self):
         return self.role == UserRole.OPS.value
@@ -33,14 +41,36 @@ class User(db.Model):
     def is_client_user(self):
         return self.role == UserRole.CLIENT.value
 
+class Blob(db.Model):
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class File(db.Model):
+    # Keyset pagination on /file/list walks (created_at, id)
+    __table_args__ = (db.Index('ix_file_created_at_id', 'created_at', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
-    file_type = db.Column(db.String(10), nullable=False)
+    file_type = db.Column(db.String(10), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     download_token = db.Column(db.String(100), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'), nullable=True, index=True)
+
+    # Filled in by the document processing worker
+    processing_status = db.Column(db.String(10), nullable=False, default='pending')
+    page_count = db.Column(db.Integer, nullable=True)
+    word_count = db.Column(db.Integer, nullable=True)
+    title = db.Column(db.String(255), nullable=True)
+    preview = db.Column(db.Text, nullable=True)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    processing_job = db.relationship(
+        'ProcessingJob', backref='file', uselist=False, cascade='all, delete-orphan'
+    )
 
     def to_dict(self):
         return {
@@ -49,4 +79,137 @@ class File(db.Model):
             'file_type': self.file_type,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'uploaded_by': self.owner.email
-        }
\ No newline at end of file
+        }
+
+    def metadata_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.original_filename,
+            'processing_status': self.processing_status,
+            'page_count': self.page_count,
+            'word_count': self.word_count,
+            'title': self.title,
+            'preview': self.preview
+        }
+
+# Full-text index over file names and extracted document text, maintained by
+# app.services.search_service: an FTS5 table on SQLite, tsvector on Postgres
+FILE_SEARCH_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS file_search USING fts5("
+        "original_filename, content, tokenize='unicode61 remove_diacritics 2')"
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS file_search ("
+        "file_id INTEGER PRIMARY KEY REFERENCES file (id) ON DELETE CASCADE, "
+        "original_filename TEXT NOT NULL, content TEXT NOT NULL, document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_file_search_document ON file_search USING GIN (document)"
+    ]
+}
+
+for _dialect, _statements in FILE_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(db.metadata, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+    event.listen(db.metadata, 'before_drop', DDL('DROP TABLE IF EXISTS file_search').execute_if(dialect=_dialect))
+
+class UploadSession(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, parts):
+        return {
+            'upload_id': self.id,
+            'filename': self.original_filename,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'parts': [{'part_number': number, 'size': size} for number, size in parts]
+        }
+
+
+class EmailOutbox(db.Model):
+    # Workers claim due emails by (status, next_attempt_at)
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(36), nullable=True, index=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class ProcessingJob(db.Model):
+    # Workers claim due jobs by (status, next_attempt_at), like the email outbox
+    __table_args__ = (db.Index('ix_processing_job_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False, unique=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(36), nullable=True, index=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CatalogVersion(db.Model):
+    """A single counter bumped in every transaction that changes the file catalog"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+event.listen(
+    CatalogVersion.__table__, 'after_create',
+    DDL('INSERT INTO catalog_version (id, version) VALUES (1, 0)')
+)
+
+class RevokedToken(db.Model):
+    """A revoked access token (by jti) or a cut-off for every token of a user
+
+    The autoincrement id doubles as the blocklist version: workers read
+    the rows above the highest id they have seen, so ids must never be
+    reused, even on SQLite once the newest rows are pruned.
+    """
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=True, unique=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class LinkRevocation(db.Model):
+    """A cut-off before which every download link of a file or user is invalid
+
+    Like RevokedToken, the never reused autoincrement id is the version
+    workers follow to pick up each other's revocations.
+    """
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(4), nullable=False)  # 'file' or 'user'
+    ident = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class AccessEvent(db.Model):
+    """One download or download link handed out, written in batches by the access log
+
+    No foreign keys: the audit trail outlives the files and users it mentions.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    file_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class AccessCounter(db.Model):
+    """Running count of one kind of access event per file or per user"""
+    subject = db.Column(db.String(4), primary_key=True)  # 'file' or 'user'
+    subject_id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    last_at = db.Column(db.DateTime, nullable=False)
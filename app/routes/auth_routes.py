@@ -1,13 +1,25 @@
 from flask import Blueprint, request, jsonify, current_app, url_for
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt, current_user
 from app import db
 from app.models import User, UserRole
-from app.services.email_service import send_verification_email
+from app.services.email_service import queue_verification_email, notify_outbox
+from app.services.auth_service import PasswordHasherBusy
+from app.services.rate_limit_service import rate_limited
+from app.services.blocklist_service import revoke_token, revoke_user_tokens
+import time
 import uuid
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+@auth_bp.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    """Shed authentication work when the bcrypt queue is full"""
+    response = jsonify({'message': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/signup', methods=['POST'])
+@rate_limited('signup')
 def signup():
     """Create a new client user account"""
     data = request.get_json()
@@ -28,10 +40,12 @@ def signup():
     )
     
     db.session.add(new_user)
-    db.session.commit()
+    db.session.flush()
     
-    # Send verification email
-    send_verification_email(new_user)
+    # Queue the verification email; the outbox worker delivers it
+    queue_verification_email(new_user)
+    db.session.commit()
+    notify_outbox()
     
     verification_url = url_for(
         'auth.verify_email', 
@@ -59,6 +73,7 @@ def verify_email(token):
     return jsonify({'message': 'Email verified successfully. You can now login.'}), 200
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited('login')
 def login():
     """Login for both ops and client users"""
     data = request.get_json()
@@ -74,6 +89,11 @@ def login():
     if not user.is_verified and user.role == UserRole.CLIENT.value:
         return jsonify({'message': 'Please verify your email before logging in'}), 403
     
+    # Upgrade hashes made with an older bcrypt cost while we have the password
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.commit()
+    
     # Create access token
     access_token = create_access_token(identity={
         'user_id': user.id,
@@ -85,4 +105,34 @@ def login():
         'message': 'Login successful',
         'access_token': access_token,
         'user_role': user.role
-    }), 200
\ No newline at end of file
+    }), 200
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """Revoke the access token used for this request"""
+    token = get_jwt()
+    revoke_token(token['jti'], token['exp'])
+    return jsonify({'message': 'Logged out successfully'}), 200
+
+@auth_bp.route('/revoke', methods=['POST'])
+@jwt_required()
+def revoke():
+    """Revoke one access token by jti, or every token of a user (only for OPS users)"""
+    if not current_user.is_ops_user():
+        return jsonify({'message': 'Only Operations users can revoke tokens'}), 403
+
+    data = request.get_json(silent=True) or {}
+    if data.get('user_id') is not None:
+        if db.session.get(User, data['user_id']) is None:
+            return jsonify({'message': 'User not found'}), 404
+        revoke_user_tokens(data['user_id'])
+        return jsonify({'message': 'All tokens of the user have been revoked'}), 200
+
+    if data.get('jti'):
+        # The token's own expiry is unknown here, so keep it blocked for a full token lifetime
+        expires = time.time() + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+        revoke_token(data['jti'], expires)
+        return jsonify({'message': 'Token has been revoked'}), 200
+
+    return jsonify({'message': 'Missing jti or user_id'}), 400
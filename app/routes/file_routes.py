@@ -1,27 +1,54 @@
 import os
-import uuid
-from flask import Blueprint, request, jsonify, current_app, send_from_directory, url_for
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import time
+import zipfile
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, current_app, url_for, stream_with_context
+from flask_jwt_extended import jwt_required, current_user
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import File, User
-from app.services.file_service import allowed_file, get_file_extension
+from app.models import AccessCounter, AccessEvent, File, UploadSession
+from app.services.file_service import (
+    allowed_file, get_file_extension, decode_cursor, build_file_list_query, stream_file_page, delete_files
+)
+from app.services.upload_service import (
+    write_part, list_parts, missing_parts, part_paths, discard_session_parts
+)
+from app.services.token_service import (
+    DownloadTokenError, issue_download_token, issue_download_tokens, verify_download_token, is_link_revoked,
+    revoke_file_links, revoke_user_links
+)
+from app.services.download_service import send_stored_file, stream_zip_archive, unique_archive_names
+from app.services.blob_service import (
+    BlobMissing, store_files, store_many, acquire_blob, collect_blob
+)
+from app.services.ingest_service import has_office_signature
+from app.services.search_service import search_files
+from app.services.document_service import enqueue_processing, notify_processing
+from app.services.access_service import record_access, request_flush
+from app.services.catalog_service import (
+    catalog_version, get_cached, set_cached, make_etag, not_modified,
+    cached_response, set_cache_validators, stream_and_cache
+)
 
 file_bp = Blueprint('file', __name__, url_prefix='/file')
 
+@file_bp.errorhandler(BlobMissing)
+def blob_missing(error):
+    """Ask for a retry when an upload re-used bytes a concurrent delete just removed"""
+    db.session.rollback()
+    response = jsonify({'message': 'The file was deleted while uploading, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @file_bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_file():
     """Upload a file (only for OPS users)"""
-    # Get current user ID from JWT
-    current_user_data = get_jwt_identity()  # This is a dictionary
-    user = User.query.get(current_user_data['user_id'])  # Extract user_id
-
-    if not user:
-        return jsonify({"msg": "User not found"}), 404
-
-    if user.role != 'operations':
-        return jsonify({"msg": "Only Operations can upload files"}), 403
+    # The JWT identity is resolved to a cached user by the identity loader
+    if not current_user.is_ops_user():
+        return jsonify({'message': 'Only Operations users can upload files'}), 403
 
     if 'file' not in request.files:
         return jsonify({"msg": "No file part in the request"}), 400
@@ -38,99 +65,672 @@ def upload_file():
 
     original_filename = secure_filename(file.filename)
     file_extension = get_file_extension(original_filename)
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-    file.save(filepath)
+    try:
+        # The part was hashed and staged in storage while the body was parsed
+        sha256, size, created = file.stream.finish()
+    except ValueError as e:
+        message, status = e.args
+        return jsonify({'message': message}), status
 
     new_file = File(
-        filename=unique_filename,
+        filename=sha256,
         original_filename=original_filename,
         file_type=file_extension,
-        user_id=user.id
+        user_id=current_user.id,
+        blob_sha256=sha256
+    )
+
+    try:
+        acquire_blob(sha256, size)
+        db.session.add(new_file)
+        enqueue_processing(new_file)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if created:
+            collect_blob(sha256)
+        raise
+    notify_processing()
+
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'file_id': new_file.id,
+        'filename': original_filename,
+        'processing_status': new_file.processing_status
+    }), 201
+
+
+def _collect_batch_items(results):
+    """Gather (original filename, stream opener) pairs from the files and archive fields
+
+    Entries that fail validation are recorded in `results` straight away.
+    """
+    items = []
+    candidates = [
+        (storage.filename, lambda storage=storage: nullcontext(storage.stream))
+        for storage in request.files.getlist('files')
+    ]
+
+    archive = request.files.get('archive')
+    if archive:
+        try:
+            zf = zipfile.ZipFile(archive.stream)
+        except zipfile.BadZipFile:
+            raise ValueError('Archive is not a valid zip file')
+        members = [info for info in zf.infolist() if not info.is_dir()]
+        if sum(info.file_size for info in members) > current_app.config['BATCH_UPLOAD_MAX_ARCHIVE_SIZE']:
+            raise ValueError('Archive contents exceed the maximum allowed size')
+        candidates += [
+            (os.path.basename(info.filename), lambda info=info: zf.open(info))
+            for info in members
+        ]
+
+    if len(candidates) > current_app.config['BATCH_UPLOAD_MAX_FILES']:
+        raise ValueError(f'At most {current_app.config["BATCH_UPLOAD_MAX_FILES"]} files per batch')
+
+    for name, opener in candidates:
+        original_filename = secure_filename(name or '')
+        if not original_filename or not allowed_file(original_filename):
+            results.append({'filename': name, 'status': 'error', 'message': 'File type not allowed'})
+        else:
+            items.append((original_filename, _office_document(opener)))
+    return items
+
+def _office_document(opener):
+    """Wrap a stream opener so content without the OOXML signature is refused, as single uploads are"""
+    @contextmanager
+    def open_checked():
+        with opener() as stream:
+            if not has_office_signature(stream):
+                raise ValueError('File content is not a valid Office document', 400)
+            yield stream
+    return open_checked
+
+
+@file_bp.route('/upload/batch', methods=['POST'])
+@jwt_required()
+def upload_batch():
+    """Upload many files, or a zip of them, in one request (only for OPS users)"""
+    if not current_user.is_ops_user():
+        return jsonify({'message': 'Only Operations users can upload files'}), 403
+
+    results = []
+    try:
+        items = _collect_batch_items(results)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    if not items and not results:
+        return jsonify({'message': 'No files in the request'}), 400
+
+    stored = store_many(
+        [opener for _, opener in items],
+        current_app.config['BATCH_UPLOAD_WORKERS']
+    )
+
+    new_files = []
+    sizes = {}
+    created = set()
+    references = Counter()
+    for (original_filename, _), outcome in zip(items, stored):
+        if isinstance(outcome, ValueError):
+            message, _ = outcome.args
+            results.append({'filename': original_filename, 'status': 'error', 'message': message})
+            continue
+        if isinstance(outcome, Exception):
+            current_app.logger.warning('Batch upload of %s failed: %s', original_filename, outcome)
+            results.append({'filename': original_filename, 'status': 'error', 'message': 'Could not store file'})
+            continue
+
+        sha256, size, is_new = outcome
+        sizes[sha256] = size
+        references[sha256] += 1
+        if is_new:
+            created.add(sha256)
+        new_files.append(File(
+            filename=sha256,
+            original_filename=original_filename,
+            file_type=get_file_extension(original_filename),
+            user_id=current_user.id,
+            blob_sha256=sha256
+        ))
+
+    try:
+        for sha256, count in references.items():
+            acquire_blob(sha256, sizes[sha256], count)
+        db.session.add_all(new_files)
+        for new_file in new_files:
+            enqueue_processing(new_file)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for sha256 in created:
+            collect_blob(sha256)
+        raise
+    notify_processing()
+
+    results += [
+        {'filename': f.original_filename, 'status': 'uploaded', 'file_id': f.id}
+        for f in new_files
+    ]
+
+    return jsonify({
+        'message': f'{len(new_files)} of {len(results)} files uploaded',
+        'results': results
+    }), 201 if new_files else 400
+
+def _get_upload_session(upload_id):
+    """Load an upload session owned by the current OPS user, or an error response"""
+    if not current_user.is_ops_user():
+        return None, (jsonify({'message': 'Only Operations users can upload files'}), 403)
+
+    session = UploadSession.query.get(upload_id)
+    if not session or session.user_id != current_user.id:
+        return None, (jsonify({'message': 'Upload session not found'}), 404)
+
+    return session, None
+
+
+@file_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_upload_session():
+    """Start a resumable chunked upload (only for OPS users)"""
+    if not current_user.is_ops_user():
+        return jsonify({'message': 'Only Operations users can upload files'}), 403
+
+    data = request.get_json(silent=True)
+    if not data or not data.get('filename'):
+        return jsonify({'message': 'Missing filename'}), 400
+
+    original_filename = secure_filename(data['filename'])
+    if not allowed_file(original_filename):
+        return jsonify({
+            'message': f'File type not allowed. Supported types: {", ".join(current_app.config["ALLOWED_EXTENSIONS"])}'
+        }), 400
+
+    session = UploadSession(
+        user_id=current_user.id,
+        original_filename=original_filename,
+        file_type=get_file_extension(original_filename)
+    )
+    db.session.add(session)
+    db.session.commit()
+
+    return jsonify({
+        'message': 'Upload session created',
+        'upload_id': session.id,
+        'max_part_size': current_app.config['MAX_CONTENT_LENGTH'],
+        'max_parts': current_app.config['UPLOAD_SESSION_MAX_PARTS']
+    }), 201
+
+
+@file_bp.route('/uploads/<upload_id>/parts/<int:part_number>', methods=['PUT'])
+@jwt_required()
+def upload_part(upload_id, part_number):
+    """Store one numbered part of a chunked upload; parts may arrive in any order"""
+    session, error = _get_upload_session(upload_id)
+    if error:
+        return error
+
+    if not 1 <= part_number <= current_app.config['UPLOAD_SESSION_MAX_PARTS']:
+        return jsonify({'message': 'Invalid part number'}), 400
+
+    # Parts arrive in any order, so the running total is checked as each one does
+    received = sum(size for number, size in list_parts(session.id) if number != part_number)
+    try:
+        size = write_part(
+            session.id, part_number, request.stream,
+            max_size=current_app.config['UPLOAD_SESSION_MAX_SIZE'] - received
+        )
+    except ValueError as e:
+        message, status = e.args
+        return jsonify({'message': message}), status
+
+    return jsonify({
+        'message': 'Part uploaded successfully',
+        'part_number': part_number,
+        'size': size
+    }), 200
+
+
+@file_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(upload_id):
+    """Report which parts of a chunked upload have arrived"""
+    session, error = _get_upload_session(upload_id)
+    if error:
+        return error
+
+    return jsonify(session.to_dict(list_parts(session.id))), 200
+
+
+@file_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload_session(upload_id):
+    """Assemble the parts of a chunked upload into a stored file"""
+    session, error = _get_upload_session(upload_id)
+    if error:
+        return error
+
+    data = request.get_json(silent=True) or {}
+    total_parts = data.get('total_parts')
+    if not isinstance(total_parts, int) or isinstance(total_parts, bool) or \
+            not 1 <= total_parts <= current_app.config['UPLOAD_SESSION_MAX_PARTS']:
+        return jsonify({'message': 'Missing or invalid total_parts'}), 400
+
+    parts = list_parts(session.id)
+    missing_count, missing = missing_parts(parts, total_parts)
+    if missing_count:
+        return jsonify({
+            'message': 'Upload is incomplete',
+            'missing_count': missing_count,
+            'missing_parts': missing
+        }), 409
+
+    total_size = sum(size for number, size in parts if number <= total_parts)
+    if total_size > current_app.config['UPLOAD_SESSION_MAX_SIZE']:
+        return jsonify({'message': 'Upload exceeds the maximum allowed size'}), 413
+
+    sha256, _ = store_files(part_paths(session.id, total_parts))
+
+    new_file = File(
+        filename=sha256,
+        original_filename=session.original_filename,
+        file_type=session.file_type,
+        user_id=session.user_id,
+        blob_sha256=sha256
     )
 
+    acquire_blob(sha256, total_size)
     db.session.add(new_file)
+    enqueue_processing(new_file)
+    db.session.delete(session)
     db.session.commit()
+    discard_session_parts(upload_id)
+    notify_processing()
 
     return jsonify({
         'message': 'File uploaded successfully',
         'file_id': new_file.id,
-        'filename': original_filename
+        'filename': new_file.original_filename,
+        'size': total_size,
+        'processing_status': new_file.processing_status
     }), 201
 
 
+@file_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload_session(upload_id):
+    """Abandon a chunked upload and discard its parts"""
+    session, error = _get_upload_session(upload_id)
+    if error:
+        return error
+
+    db.session.delete(session)
+    db.session.commit()
+    discard_session_parts(upload_id)
+
+    return jsonify({'message': 'Upload session aborted'}), 200
+
+@file_bp.route('/<int:file_id>', methods=['DELETE'])
+@jwt_required()
+def delete_file(file_id):
+    """Delete a file (only for OPS users); its blob is collected with the last reference"""
+    if not current_user.is_ops_user():
+        return jsonify({'message': 'Only Operations users can delete files'}), 403
+
+    file = File.query.get(file_id)
+    if not file:
+        return jsonify({'message': 'File not found'}), 404
+
+    delete_files([file])
+    return jsonify({'message': 'File deleted successfully'}), 200
+
+@file_bp.route('/<int:file_id>/preview', methods=['GET'])
+@jwt_required()
+def get_file_preview(file_id):
+    """Get a file's processing status, page count and text preview without downloading it"""
+    file = File.query.get(file_id)
+    if not file:
+        return jsonify({'message': 'File not found'}), 404
+
+    response = jsonify(file.metadata_dict())
+    if file.processing_status == 'pending':
+        response.status_code = 202
+        response.headers['Retry-After'] = str(current_app.config['DOCUMENT_POLL_INTERVAL'])
+        response.cache_control.no_store = True
+        return response
+
+    # Finished results only change if the file is reprocessed
+    processed_at = file.processed_at.timestamp() if file.processed_at else 0
+    response.set_etag(f'{file.id}-{file.processing_status}-{processed_at}')
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['DOCUMENT_PREVIEW_MAX_AGE']
+    return response.make_conditional(request)
+
 @file_bp.route('/list', methods=['GET'])
 @jwt_required()
 def list_files():
     """List all files (only for Client users)"""
-    current_user_data = get_jwt_identity()
-    user = User.query.get(current_user_data['user_id'])
+    if not current_user.is_client_user():
+        return jsonify({'message': 'Only Client users can list files'}), 403
 
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    try:
+        limit = int(request.args.get('limit', current_app.config['FILE_LIST_PAGE_SIZE']))
+        cursor = request.args.get('cursor')
+        cursor = decode_cursor(cursor) if cursor else None
+        created_after = request.args.get('created_after')
+        created_after = datetime.fromisoformat(created_after) if created_after else None
+        created_before = request.args.get('created_before')
+        created_before = datetime.fromisoformat(created_before) if created_before else None
+    except ValueError:
+        return jsonify({'message': 'Invalid pagination or date filter'}), 400
+
+    if limit < 1:
+        return jsonify({'message': 'Invalid pagination or date filter'}), 400
+    limit = min(limit, current_app.config['FILE_LIST_MAX_PAGE_SIZE'])
+
+    filters = {
+        'cursor': cursor,
+        'file_type': request.args.get('file_type'),
+        'uploaded_by': request.args.get('uploaded_by'),
+        'created_after': created_after,
+        'created_before': created_before
+    }
+
+    # Pages only change when the catalog version does, so a client holding
+    # the current ETag is answered without querying or serializing anything
+    version = catalog_version()
+    etag = make_etag(version, 'list', limit, sorted(filters.items()))
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    cache_key = (version, 'list', limit, tuple(sorted(filters.items())))
+    cached = get_cached(cache_key)
+    if cached is None:
+        query = build_file_list_query(**filters)
+        return stream_and_cache(cache_key, stream_file_page(query, limit), etag)
+
+    return cached_response(cached, etag)
+
+
+@file_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search():
+    """Search files by name and document text (only for Client users)"""
+    if not current_user.is_client_user():
+        return jsonify({'message': 'Only Client users can search files'}), 403
 
-    if not user.is_client_user():
-        return jsonify({'message': 'Only Client users can list files'}), 403
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'message': 'Missing search query'}), 400
+
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', current_app.config['SEARCH_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({'message': 'Invalid pagination'}), 400
 
-    all_files = File.query.all()
-    files_list = [file.to_dict() for file in all_files]
+    if page < 1 or per_page < 1:
+        return jsonify({'message': 'Invalid pagination'}), 400
+    per_page = min(per_page, current_app.config['SEARCH_MAX_PAGE_SIZE'])
+
+    hits = search_files(query, per_page, (page - 1) * per_page)
 
     return jsonify({
-        'message': 'Files retrieved successfully',
-        'files': files_list
+        'results': [
+            {**file.to_dict(), 'rank': rank, 'snippet': snippet}
+            for file, rank, snippet in hits
+        ],
+        'page': page,
+        'per_page': per_page
     }), 200
 
 
+def _reusable_link(cache_key, file_id, ttl):
+    """Get a cached (token, issued_at) link that may still be handed out, or None
+
+    A link issued while the catalog is unchanged is handed out again until
+    it has used up DOWNLOAD_LINK_REUSE of its lifetime, skipping the query.
+    """
+    link = get_cached(cache_key)
+    if link is None:
+        return None
+    issued_at = link[1]
+    if time.time() - issued_at > ttl * current_app.config['DOWNLOAD_LINK_REUSE'] or \
+            is_link_revoked(file_id, current_user.id, issued_at):
+        return None
+    return link
+
 @file_bp.route('/download/<int:file_id>', methods=['GET'])
 @jwt_required()
 def get_download_link(file_id):
     """Get encrypted download link (only for Client users)"""
-    current_user_data = get_jwt_identity()
-    user = User.query.get(current_user_data['user_id'])
+    if not current_user.is_client_user():
+        return jsonify({'message': 'Only Client users can download files'}), 403
 
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    version = catalog_version()
+    cache_key = (version, 'link', file_id, current_user.id)
+    ttl = current_app.config['DOWNLOAD_LINK_TTL']
+    link = _reusable_link(cache_key, file_id, ttl)
+    if link is not None:
+        token, issued_at = link
+    else:
+        file = File.query.get(file_id)
+        if not file:
+            return jsonify({'message': 'File not found'}), 404
+        # Tokens carry whole-second timestamps; flooring keeps the revocation check conservative
+        issued_at = int(time.time())
+        token = issue_download_token(file, current_user.id)
+        set_cached(cache_key, (token, issued_at))
+
+    # A revalidated link is still handed out, so it is recorded either way
+    record_access('link', current_user.id, [file_id])
+    etag = make_etag(version, 'link', token)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    download_url = url_for('file.download_file', token=token, _external=True)
+
+    response = jsonify({
+        'message': 'success',
+        'download_link': download_url,
+        'expires_in': ttl - int(time.time() - issued_at)
+    })
+    return set_cache_validators(response, etag)
 
-    if not user.is_client_user():
+@file_bp.route('/download/links', methods=['POST'])
+@jwt_required()
+def get_download_links():
+    """Get download links for many files at once (only for Client users)
+
+    Takes {"file_ids": [...]} and returns the links by file id, with the
+    ids that could not be resolved under "errors".  Files without a
+    reusable cached link are loaded with a single IN query.
+    """
+    if not current_user.is_client_user():
         return jsonify({'message': 'Only Client users can download files'}), 403
 
-    file = File.query.get(file_id)
-    if not file:
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('file_ids')
+    if not isinstance(file_ids, list) or not file_ids:
+        return jsonify({'message': 'Provide a list of file_ids'}), 400
+
+    max_files = current_app.config['DOWNLOAD_LINKS_MAX_FILES']
+    if len(file_ids) > max_files:
+        return jsonify({'message': f'At most {max_files} files per request'}), 400
+
+    if any(not isinstance(i, int) or isinstance(i, bool) for i in file_ids):
+        return jsonify({'message': 'file_ids must be integers'}), 400
+
+    version = catalog_version()
+    ttl = current_app.config['DOWNLOAD_LINK_TTL']
+    links, errors, uncached = {}, {}, []
+    for file_id in dict.fromkeys(file_ids):
+        link = _reusable_link((version, 'link', file_id, current_user.id), file_id, ttl)
+        if link is not None:
+            links[file_id] = link
+        else:
+            uncached.append(file_id)
+
+    if uncached:
+        files = File.query.filter(File.id.in_(uncached)).all()
+        issued_at = int(time.time())
+        for file, token in zip(files, issue_download_tokens(files, current_user.id)):
+            links[file.id] = (token, issued_at)
+            set_cached((version, 'link', file.id, current_user.id), (token, issued_at))
+        for file_id in uncached:
+            if file_id not in links:
+                errors[str(file_id)] = 'File not found'
+
+    # Tokens are URL-safe, so every link is the same URL with its own token at the end
+    base_url = url_for('file.download_file', token='-', _external=True)[:-1]
+    record_access('link', current_user.id, list(links))
+    now = time.time()
+    return jsonify({
+        'message': 'success',
+        'links': {
+            str(file_id): {'download_link': base_url + token, 'expires_in': ttl - int(now - issued_at)}
+            for file_id, (token, issued_at) in links.items()
+        },
+        'errors': errors
+    })
+
+@file_bp.route('/download-file/<token>', methods=['GET'])
+@jwt_required()
+def download_file(token):
+    """Download file using encrypted token (only for Client users)"""
+    if not current_user.is_client_user():
+        return jsonify({'message': 'Access denied'}), 403
+
+    # The signed token carries everything needed to serve the file
+    try:
+        link = verify_download_token(token, current_user.id)
+    except DownloadTokenError as e:
+        return jsonify({'message': e.message}), e.status_code
+
+    try:
+        response = send_stored_file(
+            link['k'],
+            link['n'],
+            etag=link['e'],
+            last_modified=link['created_at']
+        )
+    except FileNotFoundError:
+        # Deleted since the link was issued, before this worker saw the revocation
         return jsonify({'message': 'File not found'}), 404
 
-    download_url = url_for(
-        'file.download_file',
-        token=file.download_token,
-        _external=True
-    )
+    record_access('download', current_user.id, [link['f']])
+    return response
+
+
+@file_bp.route('/download-links/revoke', methods=['POST'])
+@jwt_required()
+def revoke_download_links():
+    """Revoke every link issued so far for a file or to a user (only for OPS users)"""
+    if not current_user.is_ops_user():
+        return jsonify({'message': 'Only Operations users can revoke download links'}), 403
+
+    data = request.get_json(silent=True) or {}
+    if isinstance(data.get('file_id'), int):
+        revoke_file_links(data['file_id'])
+    elif isinstance(data.get('user_id'), int):
+        revoke_user_links(data['user_id'])
+    else:
+        return jsonify({'message': 'Provide a file_id or user_id'}), 400
+
+    return jsonify({'message': 'Download links revoked'}), 200
+
+@file_bp.route('/access-stats', methods=['GET'])
+@jwt_required()
+def get_access_stats():
+    """Download and link counters of a file or user, or the most downloaded files (only for OPS users)"""
+    if not current_user.is_ops_user():
+        return jsonify({'message': 'Only Operations users can view access statistics'}), 403
+
+    # Counters lag by up to ACCESS_LOG_FLUSH_INTERVAL; nudge our worker rather than write here
+    request_flush()
+
+    file_id = request.args.get('file_id', type=int)
+    user_id = request.args.get('user_id', type=int)
+    if file_id is None and user_id is None:
+        limit = max(1, min(request.args.get('limit', 20, type=int), current_app.config['ACCESS_STATS_MAX_LIMIT']))
+        top = AccessCounter.query.filter_by(subject='file', kind='download') \
+            .order_by(AccessCounter.count.desc(), AccessCounter.subject_id).limit(limit)
+        return jsonify({
+            'message': 'success',
+            'top_files': [{
+                'file_id': counter.subject_id,
+                'downloads': counter.count,
+                'last_download_at': counter.last_at.strftime('%Y-%m-%d %H:%M:%S')
+            } for counter in top]
+        }), 200
+
+    if file_id is not None:
+        subject, subject_id, column = 'file', file_id, AccessEvent.file_id
+    else:
+        subject, subject_id, column = 'user', user_id, AccessEvent.user_id
+    counters = AccessCounter.query.filter_by(subject=subject, subject_id=subject_id)
+    recent = AccessEvent.query.filter(column == subject_id) \
+        .order_by(AccessEvent.id.desc()).limit(current_app.config['ACCESS_STATS_RECENT_EVENTS'])
 
     return jsonify({
         'message': 'success',
-        'download_link': download_url
+        f'{subject}_id': subject_id,
+        'counters': {
+            counter.kind: {'count': counter.count, 'last_at': counter.last_at.strftime('%Y-%m-%d %H:%M:%S')}
+            for counter in counters
+        },
+        'recent': [{
+            'kind': event.kind,
+            'file_id': event.file_id,
+            'user_id': event.user_id,
+            'created_at': event.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        } for event in recent]
     }), 200
 
 
-@file_bp.route('/download-file/<token>', methods=['GET'])
+@file_bp.route('/download/archive', methods=['POST'])
 @jwt_required()
-def download_file(token):
-    """Download file using encrypted token (only for Client users)"""
-    current_user_data = get_jwt_identity()
-    user = User.query.get(current_user_data['user_id'])
+def download_archive():
+    """Download many files as one streamed ZIP archive (only for Client users)"""
+    if not current_user.is_client_user():
+        return jsonify({'message': 'Only Client users can download files'}), 403
 
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('file_ids') or []
+    tokens = data.get('tokens') or []
+    if not isinstance(file_ids, list) or not isinstance(tokens, list) or not (file_ids or tokens):
+        return jsonify({'message': 'Provide a list of file_ids or tokens'}), 400
 
-    if not user.is_client_user():
-        return jsonify({'message': 'Access denied'}), 403
+    if len(file_ids) + len(tokens) > current_app.config['ARCHIVE_MAX_FILES']:
+        return jsonify({'message': f'At most {current_app.config["ARCHIVE_MAX_FILES"]} files per archive'}), 400
 
-    file = File.query.filter_by(download_token=token).first()
-    if not file:
-        return jsonify({'message': 'Invalid download link'}), 404
+    if any(not isinstance(i, int) or isinstance(i, bool) for i in file_ids) or \
+            any(not isinstance(token, str) for token in tokens):
+        return jsonify({'message': 'file_ids must be integers and tokens strings'}), 400
 
-    return send_from_directory(
-        current_app.config['UPLOAD_FOLDER'],
-        file.filename,
-        as_attachment=True,
-        download_name=file.original_filename
-    )
+    # Signed tokens locate their file on their own; plain ids need one query
+    try:
+        links = [verify_download_token(token, current_user.id) for token in tokens]
+    except DownloadTokenError as e:
+        return jsonify({'message': e.message}), e.status_code
+
+    by_id = {f.id: f for f in File.query.filter(File.id.in_(file_ids))} if file_ids else {}
+    missing = [i for i in file_ids if i not in by_id]
+    if missing:
+        return jsonify({'message': 'Some files were not found', 'missing': missing}), 404
+
+    requested = [(by_id[i].original_filename, by_id[i].filename, by_id[i].created_at) for i in file_ids]
+    requested += [(link['n'], link['k'], link['created_at']) for link in links]
+
+    record_access('download', current_user.id, file_ids + [link['f'] for link in links])
+
+    names = unique_archive_names([name for name, _, _ in requested])
+    entries = [(name, key, modified) for name, (_, key, modified) in zip(names, requested)]
+
+    response = Response(stream_with_context(stream_zip_archive(entries)), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename='documents.zip')
+    return response
@@ -0,0 +1,132 @@
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, insert
+from sqlalchemy.exc import IntegrityError
+from app import db, lazy_extension
+from app.models import AccessCounter, AccessEvent
+
+class AccessLog:
+    """Access events of this worker waiting to be written
+
+    Recording is an append under a lock, so downloads never wait on the
+    database.  If writes keep failing only the newest `max_buffer` events
+    are kept and the rest are counted in `dropped`.
+    """
+
+    def __init__(self, flush_size, max_buffer):
+        self.flush_size = flush_size
+        self.dropped = 0
+        self._events = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+
+    def record(self, kind, user_id, file_ids, at):
+        """Buffer one event per file, returning True once a flush is due"""
+        with self._lock:
+            for file_id in file_ids:
+                if len(self._events) == self._events.maxlen:
+                    self.dropped += 1
+                self._events.append((kind, file_id, user_id, at))
+            return len(self._events) >= self.flush_size
+
+    def take(self):
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def put_back(self, events):
+        """Requeue events that could not be written ahead of the ones recorded since"""
+        with self._lock:
+            events = events + list(self._events)
+            overflow = max(0, len(events) - self._events.maxlen)
+            self.dropped += overflow
+            self._events.clear()
+            self._events.extend(events[overflow:])
+
+    def __len__(self):
+        return len(self._events)
+
+def _create_access_log(app):
+    # Holds the app, so events recorded by a worker are written even if nothing else refers to it
+    atexit.register(_flush_at_exit, app)
+    return AccessLog(app.config['ACCESS_LOG_FLUSH_SIZE'], app.config['ACCESS_LOG_MAX_BUFFER'])
+
+def get_access_log():
+    """Get this worker's buffer of unwritten access events, creating it on first use"""
+    return lazy_extension('access_log', _create_access_log)
+
+def record_access(kind, user_id, file_ids):
+    """Note that a user downloaded ('download') or was handed a link to ('link') some files"""
+    if not current_app.config['ACCESS_LOG_ENABLED'] or not file_ids:
+        return
+    if get_access_log().record(kind, user_id, file_ids, datetime.utcnow()):
+        request_flush()
+
+def request_flush():
+    """Ask the access log worker to write the buffer now, without waiting for it"""
+    worker = current_app.extensions.get('access_log_worker')
+    if worker is not None:
+        worker.wake()
+
+def _add_to_counter(subject, subject_id, kind, count, last_at):
+    """Add to a counter in the current transaction, creating its row if needed"""
+    updated = AccessCounter.query.filter_by(subject=subject, subject_id=subject_id, kind=kind).update({
+        AccessCounter.count: AccessCounter.count + count,
+        AccessCounter.last_at: case((AccessCounter.last_at < last_at, last_at), else_=AccessCounter.last_at)
+    }, synchronize_session=False)
+    if updated:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(AccessCounter(
+                subject=subject, subject_id=subject_id, kind=kind, count=count, last_at=last_at
+            ))
+    except IntegrityError:
+        # Another worker created the row concurrently; add to it instead
+        _add_to_counter(subject, subject_id, kind, count, last_at)
+
+def _write_events(events):
+    db.session.execute(insert(AccessEvent), [
+        {'kind': kind, 'file_id': file_id, 'user_id': user_id, 'created_at': at}
+        for kind, file_id, user_id, at in events
+    ])
+
+    totals = {}
+    for kind, file_id, user_id, at in events:
+        for key in (('file', file_id, kind), ('user', user_id, kind)):
+            count, last_at = totals.get(key, (0, at))
+            totals[key] = (count + 1, max(last_at, at))
+    for (subject, subject_id, kind), (count, last_at) in totals.items():
+        _add_to_counter(subject, subject_id, kind, count, last_at)
+    db.session.commit()
+
+def flush_access_events():
+    """Write every buffered access event, one bulk insert and counter update per batch
+
+    Returns the number of events written.  Events of a batch that fails
+    go back into the buffer for the next flush.
+    """
+    log = get_access_log()
+    events = log.take()
+    batch_size = log.flush_size
+    for start in range(0, len(events), batch_size):
+        try:
+            _write_events(events[start:start + batch_size])
+        except Exception:
+            db.session.rollback()
+            log.put_back(events[start:])
+            raise
+    return len(events)
+
+def _flush_at_exit(app):
+    if not len(app.extensions['access_log']):
+        return
+    with app.app_context():
+        try:
+            flush_access_events()
+        except Exception:
+            app.logger.exception('Could not write %d access events at exit', len(app.extensions['access_log']))
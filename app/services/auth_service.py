@@ -0,0 +1,112 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app
+from app import bcrypt
+from app.services.metrics_service import record_password_hash
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are queued or one waits past its timeout"""
+
+class PasswordHasher:
+    """Run bcrypt on a bounded thread pool and shed work beyond a queue limit
+
+    bcrypt releases the GIL, so hashing on the pool keeps CPU use capped at
+    `max_workers` cores while request threads wait without spinning.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def run(self, fn, *args, timeout=None):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+
+        def task():
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(task)
+        except BaseException:
+            self._slots.release()
+            raise
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            # The hash still finishes on the pool and frees its slot then
+            raise PasswordHasherBusy() from None
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+def get_password_hasher():
+    """Get this process's password hasher, creating it from the app config"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                config = current_app.config
+                _hasher = PasswordHasher(
+                    config['BCRYPT_MAX_WORKERS'] or os.cpu_count() or 1,
+                    config['BCRYPT_MAX_PENDING']
+                )
+    return _hasher
+
+def hash_password(password):
+    """Hash a password with the configured bcrypt cost off the request thread"""
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    started = time.perf_counter()
+    password_hash = get_password_hasher().run(
+        bcrypt.generate_password_hash, password, rounds,
+        timeout=current_app.config['BCRYPT_TIMEOUT']
+    )
+    record_password_hash('hash', time.perf_counter() - started)
+    return password_hash.decode('utf-8')
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash off the request thread"""
+    started = time.perf_counter()
+    matches = get_password_hasher().run(
+        bcrypt.check_password_hash, password_hash, password,
+        timeout=current_app.config['BCRYPT_TIMEOUT']
+    )
+    record_password_hash('verify', time.perf_counter() - started)
+    return matches
+
+def get_hash_rounds(password_hash):
+    """Read the cost factor out of a '$2b$12$...' bcrypt hash"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(password_hash):
+    """Check whether a stored hash was made with a lower cost than configured
+
+    A higher cost is kept, so workers briefly configured with different
+    costs never undo each other's upgrades.
+    """
+    rounds = get_hash_rounds(password_hash)
+    return rounds is None or rounds < current_app.config['BCRYPT_LOG_ROUNDS']
+
+def calibrate_log_rounds(target_ms, min_rounds, max_rounds, probe_rounds=8):
+    """Find the highest bcrypt cost whose hash time stays within target_ms
+
+    Each extra round doubles the work, so one timed probe is enough to
+    extrapolate the rest.  Run it once through `flask calibrate-bcrypt` and
+    share the result as BCRYPT_LOG_ROUNDS, so every worker hashes alike.
+    """
+    started = time.perf_counter()
+    bcrypt.generate_password_hash('calibration-probe', probe_rounds)
+    probe_ms = max((time.perf_counter() - started) * 1000, 0.001)
+
+    rounds = probe_rounds + math.floor(math.log2(target_ms / probe_ms))
+    return max(min_rounds, min(rounds, max_rounds))
@@ -0,0 +1,169 @@
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Blob
+from app.services.storage_service import get_storage
+
+class BlobMissing(Exception):
+    """Raised when an upload re-used bytes that a concurrent delete collected"""
+
+def blob_exists(sha256):
+    """Check whether the bytes of a blob are already stored"""
+    return get_storage().exists(sha256)
+
+def _consume(stream, digest, out=None):
+    """Feed a stream into a digest (and optionally a file), returning its size"""
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+    size = 0
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+        size += len(chunk)
+        if out is not None:
+            out.write(chunk)
+    return size
+
+def hash_stream(stream):
+    """Compute the SHA-256 digest and size of a readable stream"""
+    digest = hashlib.sha256()
+    size = _consume(stream, digest)
+    return digest.hexdigest(), size
+
+def hash_files(paths):
+    """Compute the SHA-256 digest and size of several files read back to back"""
+    digest = hashlib.sha256()
+    size = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            size += _consume(f, digest)
+    return digest.hexdigest(), size
+
+def store_stream(stream):
+    """Store an uploaded stream as a blob, returning its (sha256, size, created)
+
+    Seekable streams (Werkzeug spools uploads to memory or a temp file) are
+    hashed first and only copied when the content is new, so re-uploading an
+    existing document costs no write I/O.  Other streams are hashed while they
+    are staged in storage, and the staged copy is dropped if the blob exists.
+    `created` is False when the bytes were already stored.
+    """
+    storage = get_storage()
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+
+    if stream.seekable():
+        start = stream.tell()
+        sha256, size = hash_stream(stream)
+        created = not storage.exists(sha256)
+        if created:
+            stream.seek(start)
+            with storage.writer(sha256) as out:
+                shutil.copyfileobj(stream, out, chunk_size)
+        return sha256, size, created
+
+    digest = hashlib.sha256()
+    with storage.stage() as staged:
+        size = _consume(stream, digest, staged.file)
+        sha256 = digest.hexdigest()
+        created = not storage.exists(sha256)
+        if created:
+            staged.commit(sha256)
+    return sha256, size, created
+
+def store_files(paths):
+    """Store the concatenation of several files as a blob, returning its (sha256, size)"""
+    storage = get_storage()
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+
+    sha256, size = hash_files(paths)
+    if not storage.exists(sha256):
+        with storage.writer(sha256) as out:
+            for path in paths:
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, out, chunk_size)
+    return sha256, size
+
+def store_many(openers, max_workers):
+    """Store several streams as blobs concurrently
+
+    `openers` are callables returning a readable stream.  Returns one
+    (sha256, size, created) tuple per opener, or the exception raised while
+    storing it.
+    """
+    app = current_app._get_current_object()
+
+    def store(open_stream):
+        with app.app_context():
+            try:
+                with open_stream() as stream:
+                    return store_stream(stream)
+            except Exception as e:
+                return e
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        return list(pool.map(store, openers))
+
+def acquire_blob(sha256, size, references=1):
+    """Add references to a blob in the current transaction, creating its row if needed
+
+    Updating or inserting the row holds it until the transaction ends, so
+    collect_blob cannot remove the bytes meanwhile.  A new row is only
+    created once the bytes are confirmed present: an upload that found them
+    already stored may have raced with the delete that collected them.
+    """
+    updated = Blob.query.filter_by(sha256=sha256).update(
+        {Blob.refcount: Blob.refcount + references}, synchronize_session=False
+    )
+    if updated:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(Blob(sha256=sha256, size=size, refcount=references))
+    except IntegrityError:
+        # Another upload created the row concurrently; count our references on it
+        Blob.query.filter_by(sha256=sha256).update(
+            {Blob.refcount: Blob.refcount + references}, synchronize_session=False
+        )
+        return
+    if not blob_exists(sha256):
+        raise BlobMissing(sha256)
+
+def release_blob(sha256):
+    """Drop a reference to a blob in the current transaction
+
+    Returns True when this was the last reference and the row was removed;
+    the caller should then call collect_blob once the transaction commits.
+    """
+    Blob.query.filter_by(sha256=sha256).update(
+        {Blob.refcount: Blob.refcount - 1}, synchronize_session=False
+    )
+    deleted = Blob.query.filter(Blob.sha256 == sha256, Blob.refcount <= 0).delete(
+        synchronize_session=False
+    )
+    return bool(deleted)
+
+def collect_blob(sha256):
+    """Remove the bytes of an unreferenced blob after its row was deleted
+
+    A placeholder row claims the hash while the bytes are deleted, so an
+    upload acquiring the blob meanwhile waits for the delete and then finds
+    the bytes gone instead of committing a row that points at nothing.
+    Commits its own transaction; returns False when the blob was re-acquired.
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.add(Blob(sha256=sha256, size=0, refcount=0))
+    except IntegrityError:
+        # Re-acquired by a concurrent upload after we released it
+        db.session.rollback()
+        return False
+    try:
+        get_storage().delete(sha256)
+    except Exception:
+        db.session.rollback()
+        raise
+    Blob.query.filter_by(sha256=sha256, refcount=0).delete(synchronize_session=False)
+    db.session.commit()
+    return True
@@ -0,0 +1,99 @@
+import math
+from datetime import datetime, timezone
+from flask import current_app, jsonify
+from sqlalchemy.exc import IntegrityError
+from app import db, lazy_extension
+from app.models import RevokedToken
+from app.services.tail_service import TableTail
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+class TokenBlocklist(TableTail):
+    """A worker's in-memory copy of the revoked_token table
+
+    Checking a token is a dict lookup.  Entries are dropped once the
+    tokens they cover have expired anyway.  Tokens carry their issue time
+    in whole seconds, so a user's cut-off revokes every token issued up to
+    and including the second it was made in, like RevocationSet does for
+    download links: a login in that same second has to be repeated.
+    """
+
+    model = RevokedToken
+    columns = ('jti', 'user_id', 'created_at', 'expires_at')
+
+    def __init__(self, refresh_interval, hole_grace):
+        super().__init__(refresh_interval, hole_grace)
+        self.jtis = {}
+        self.user_cutoffs = {}
+
+    def is_revoked(self, jti, user_id, issued_at):
+        self.refresh_if_stale()
+        if jti in self.jtis:
+            return True
+        cutoff = self.user_cutoffs.get(user_id)
+        return cutoff is not None and issued_at <= cutoff[0]
+
+    def add_row(self, jti, user_id, created_at, expires_at):
+        self.add(jti, user_id, created_at, expires_at)
+
+    def add(self, jti, user_id, created_at, expires_at):
+        if jti is not None:
+            self.jtis[jti] = expires_at
+        elif user_id is not None:
+            cutoff = math.floor(created_at.replace(tzinfo=timezone.utc).timestamp())
+            previous = self.user_cutoffs.get(user_id)
+            if previous is None or cutoff > previous[0]:
+                self.user_cutoffs[user_id] = (cutoff, expires_at)
+
+    def prune(self, now):
+        self.jtis = {jti: expires for jti, expires in self.jtis.items() if expires > now}
+        self.user_cutoffs = {
+            user_id: entry for user_id, entry in self.user_cutoffs.items() if entry[1] > now
+        }
+
+    def __len__(self):
+        return len(self.jtis) + len(self.user_cutoffs)
+
+def _blocklist():
+    return lazy_extension('token_blocklist', lambda app: TokenBlocklist(
+        app.config['JWT_BLOCKLIST_REFRESH'], app.config['JWT_BLOCKLIST_HOLE_GRACE']
+    ))
+
+def revoke_token(jti, expires_at):
+    """Revoke one access token by its jti until it expires"""
+    created_at, expires_at = datetime.utcnow(), _utc(expires_at)
+    try:
+        with db.session.begin_nested():
+            db.session.add(RevokedToken(jti=jti, created_at=created_at, expires_at=expires_at))
+    except IntegrityError:
+        pass  # already revoked, e.g. by the same logout sent twice at once
+    db.session.commit()
+    _blocklist().add(jti, None, created_at, expires_at)
+
+def revoke_user_tokens(user_id):
+    """Revoke every access token issued to a user so far"""
+    created_at = datetime.utcnow()
+    expires_at = created_at + current_app.config['JWT_ACCESS_TOKEN_EXPIRES']
+    db.session.add(RevokedToken(user_id=user_id, created_at=created_at, expires_at=expires_at))
+    db.session.commit()
+    _blocklist().add(None, user_id, created_at, expires_at)
+
+def prune_revoked_tokens(dry_run=False):
+    """Delete blocklist rows whose tokens have expired, returning how many"""
+    expired = RevokedToken.query.filter(RevokedToken.expires_at <= datetime.utcnow())
+    if dry_run:
+        return expired.count()
+    deleted = expired.delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def init_token_blocklist(app, jwt):
+    """Reject revoked access tokens on every @jwt_required() request"""
+    @jwt.token_in_blocklist_loader
+    def token_in_blocklist_callback(_jwt_header, jwt_data):
+        return _blocklist().is_revoked(jwt_data['jti'], jwt_data['sub']['user_id'], jwt_data['iat'])
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(_jwt_header, _jwt_data):
+        return jsonify({'message': 'Token has been revoked'}), 401
@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import threading
+import time
+from flask import current_app, request, stream_with_context
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from app import db, lazy_extension
+from app.models import CatalogVersion, File
+from app.services.identity_service import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class CatalogCache:
+    """The last catalog version this process read, plus serialized responses keyed by it
+
+    Entries are keyed by version, so a bump makes every older entry
+    unreachable and the LRU bound ages them out.
+    """
+
+    def __init__(self, maxsize, ttl, version_ttl):
+        self.responses = TTLCache(maxsize, ttl)
+        self.version_ttl = version_ttl
+        self._version = None
+        self._read_at = 0
+        self._lock = threading.Lock()
+
+    def version(self):
+        if time.monotonic() - self._read_at >= self.version_ttl:
+            version = db.session.query(CatalogVersion.version).filter(CatalogVersion.id == 1).scalar()
+            with self._lock:
+                self._version = version or 0
+                self._read_at = time.monotonic()
+        return self._version
+
+    def expire_version(self):
+        with self._lock:
+            self._read_at = 0
+
+class CachedBody:
+    """A serialized response body and its compressed variants, built on first use"""
+
+    def __init__(self, body):
+        self.variants = {'identity': body}
+
+    def encoded(self, encoding):
+        body = self.variants.get(encoding)
+        if body is None:
+            identity = self.variants['identity']
+            body = brotli.compress(identity) if encoding == 'br' else gzip.compress(identity, 6)
+            self.variants[encoding] = body
+        return body
+
+def _create_catalog(app):
+    return CatalogCache(
+        app.config['RESPONSE_CACHE_SIZE'],
+        app.config['RESPONSE_CACHE_TTL'],
+        app.config['CATALOG_VERSION_TTL']
+    )
+
+def _catalog():
+    return lazy_extension('catalog', _create_catalog)
+
+def catalog_version():
+    """Get the current catalog version, re-reading it at most every CATALOG_VERSION_TTL seconds"""
+    return _catalog().version()
+
+def get_cached(key):
+    return _catalog().responses.get(key)
+
+def set_cached(key, value):
+    _catalog().responses.set(key, value)
+
+def make_etag(version, *parts):
+    """Build a weak validator for a representation of the catalog at `version`"""
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+    return f'{version}-{digest}'
+
+def negotiate_encoding(size):
+    """Pick the best content coding the client accepts for a body of `size` bytes"""
+    if size < current_app.config['RESPONSE_CACHE_MIN_COMPRESS_SIZE']:
+        return 'identity'
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+def set_cache_validators(response, etag):
+    """Mark a response as revalidated on every use by its weak ETag"""
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def cached_response(cached, etag, mimetype='application/json'):
+    """Send a cached body in the negotiated encoding with a weak ETag"""
+    encoding = negotiate_encoding(len(cached.variants['identity']))
+    response = current_app.response_class(cached.encoded(encoding), mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return set_cache_validators(response, etag)
+
+def stream_and_cache(key, chunks, etag, mimetype='application/json'):
+    """Stream a body built on a cache miss, caching it once complete if it is small enough
+
+    At most RESPONSE_CACHE_MAX_BODY_SIZE bytes are held while streaming;
+    larger bodies are only streamed.  The miss itself is sent uncompressed,
+    later hits in the negotiated encoding.
+    """
+    max_size = current_app.config['RESPONSE_CACHE_MAX_BODY_SIZE']
+
+    def generate():
+        parts, size = [], 0
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            if parts is not None:
+                size += len(data)
+                if size <= max_size:
+                    parts.append(data)
+                else:
+                    parts = None
+            yield data
+        if parts is not None:
+            set_cached(key, CachedBody(b''.join(parts)))
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    return set_cache_validators(response, etag)
+
+def not_modified(etag):
+    """Build a 304 when the request's If-None-Match matches a weak ETag, else return None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return set_cache_validators(current_app.response_class(status=304), etag)
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_file_changes(session, flush_context):
+    """Advance the catalog version inside any transaction that adds or deletes files
+
+    Updates are left out: document processing rewrites every file once, and
+    the fields it changes are served by the preview endpoint, not the list.
+    """
+    changed = any(isinstance(obj, File) for obj in (*session.new, *session.deleted))
+    if changed and not session.info.get('catalog_bumped'):
+        session.connection().execute(
+            update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+        )
+        session.info['catalog_bumped'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _expire_after_commit(session):
+    if session.info.pop('catalog_bumped', False) and current_app and 'catalog' in current_app.extensions:
+        _catalog().expire_version()
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_after_rollback(session):
+    session.info.pop('catalog_bumped', None)
@@ -0,0 +1,25 @@
+from sqlalchemy import event
+from app import db
+
+def _apply_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def init_database(app):
+    """Apply SQLITE_PRAGMAS to every new SQLite connection of the app's engine
+
+    WAL lets readers proceed while a writer commits, synchronous=NORMAL is
+    durable under WAL without an fsync per transaction, and busy_timeout
+    makes writers wait for the lock instead of failing immediately.
+    """
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with app.app_context():
+        engine = db.engine
+
+    if engine.dialect.name == 'sqlite' and pragmas:
+        event.listen(
+            engine, 'connect',
+            lambda dbapi_connection, record: _apply_sqlite_pragmas(pragmas, dbapi_connection, record)
+        )
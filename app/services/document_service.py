@@ -0,0 +1,255 @@
+import multiprocessing
+import os
+import re
+import threading
+import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import ProcessingJob
+from app.services.search_service import index_file
+from app.services.storage_service import get_storage
+
+# The zip parts of each OOXML format that hold user-visible text
+TEXT_PARTS = {
+    'docx': re.compile(r'^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$'),
+    'pptx': re.compile(r'^ppt/(slides/slide\d+|notesSlides/notesSlide\d+)\.xml$'),
+    'xlsx': re.compile(r'^xl/(sharedStrings|worksheets/sheet\d+)\.xml$')
+}
+
+# The parts that each count as one page: slides of a deck, sheets of a workbook
+PAGE_PARTS = {
+    'pptx': re.compile(r'^ppt/slides/slide\d+\.xml$'),
+    'xlsx': re.compile(r'^xl/worksheets/sheet\d+\.xml$')
+}
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _read_text(archive, names, max_chars):
+    """Concatenate the text runs of some zip parts, stopping after max_chars
+
+    Parts are parsed incrementally so large documents never build a full
+    element tree.
+    """
+    pieces = []
+    total = 0
+    for name in names:
+        with archive.open(name) as part:
+            for _, element in ET.iterparse(part):
+                tag = _local_name(element.tag)
+                if tag == 't' and element.text:
+                    pieces.append(element.text)
+                    total += len(element.text)
+                elif tag in ('p', 'si'):
+                    pieces.append('\n')
+                element.clear()
+                if total >= max_chars:
+                    return ''.join(pieces)[:max_chars]
+    return ''.join(pieces)
+
+def _matching_parts(archive, pattern):
+    return sorted((n for n in archive.namelist() if pattern.match(n)), key=_natural_key)
+
+def _property(archive, part, tag):
+    """Read one text property out of docProps/core.xml or docProps/app.xml"""
+    try:
+        with archive.open(part) as f:
+            for _, element in ET.iterparse(f):
+                if _local_name(element.tag) == tag and element.text:
+                    return element.text.strip()
+    except KeyError:
+        pass
+    return None
+
+def extract_text(path, file_type, max_chars):
+    """Pull the visible text out of a pptx/docx/xlsx file
+
+    Text runs (<w:t>, <a:t>, <t>) are concatenated within a paragraph or
+    shared string.  Stops after max_chars characters.
+    """
+    pattern = TEXT_PARTS.get(file_type)
+    if pattern is None:
+        return ''
+    with zipfile.ZipFile(path) as archive:
+        return _read_text(archive, _matching_parts(archive, pattern), max_chars)
+
+def analyze_document(path, file_type, max_chars, preview_chars):
+    """Extract the text and metadata of one document
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    pattern = TEXT_PARTS.get(file_type)
+    with zipfile.ZipFile(path) as archive:
+        text_parts = _matching_parts(archive, pattern) if pattern else []
+        text = _read_text(archive, text_parts, max_chars)
+
+        if file_type in PAGE_PARTS:
+            pages = _matching_parts(archive, PAGE_PARTS[file_type])
+            page_count = len(pages)
+            # A deck's preview is its first slide; other formats just start at the top
+            preview = _read_text(archive, pages[:1], preview_chars) if file_type == 'pptx' else text[:preview_chars]
+        else:
+            pages = _property(archive, 'docProps/app.xml', 'Pages')
+            page_count = int(pages) if pages and pages.isdigit() else None
+            preview = text[:preview_chars]
+
+        title = _property(archive, 'docProps/core.xml', 'title')
+
+    return {
+        'text': text,
+        'page_count': page_count,
+        'word_count': len(text.split()),
+        'title': title[:255] if title else None,
+        'preview': preview.strip()
+    }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Get this process's document parsing pool, creating it from the app config
+
+    Workers are spawned rather than forked so they never inherit the
+    parent's threads, locks or database connections.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    current_app.config['DOCUMENT_WORKERS'] or os.cpu_count() or 1,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _pool
+
+def _discard_process_pool():
+    """Drop a pool whose worker died so the next batch starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def enqueue_processing(file):
+    """Queue a file for background processing in the current transaction"""
+    file.processing_status = 'pending'
+    if file.processing_job is None:
+        file.processing_job = ProcessingJob()
+    else:
+        job = file.processing_job
+        job.status, job.attempts, job.claim_token = 'pending', 0, None
+        job.next_attempt_at = datetime.utcnow()
+
+def notify_processing():
+    """Wake the processing worker, if this process runs one, after new jobs were committed"""
+    worker = current_app.extensions.get('document_worker')
+    if worker is not None:
+        worker.wake()
+
+def _claim_due_jobs(batch_size):
+    """Lease a batch of due jobs to this worker so concurrent workers skip them"""
+    now = datetime.utcnow()
+    claim_token = str(uuid.uuid4())
+    due_ids = db.session.query(ProcessingJob.id).filter(
+        ProcessingJob.status == 'pending',
+        ProcessingJob.next_attempt_at <= now
+    ).order_by(ProcessingJob.id).limit(batch_size)
+
+    ProcessingJob.query.filter(
+        ProcessingJob.id.in_(due_ids.scalar_subquery()),
+        ProcessingJob.status == 'pending',
+        ProcessingJob.next_attempt_at <= now
+    ).update({
+        ProcessingJob.claim_token: claim_token,
+        ProcessingJob.next_attempt_at: now + timedelta(seconds=current_app.config['DOCUMENT_LEASE_SECONDS'])
+    }, synchronize_session=False)
+    db.session.commit()
+
+    return ProcessingJob.query.filter_by(claim_token=claim_token).order_by(ProcessingJob.id).all()
+
+def _record_failure(job, error, permanent=False):
+    config = current_app.config
+    job.attempts += 1
+    job.last_error = str(error)[:500]
+    if permanent or job.attempts >= config['DOCUMENT_MAX_ATTEMPTS']:
+        job.status = 'failed'
+        job.file.processing_status = 'failed'
+        # Unreadable documents stay findable by name
+        index_file(job.file.id, job.file.original_filename, '')
+    else:
+        delay = min(
+            config['DOCUMENT_RETRY_BASE_SECONDS'] * 2 ** (job.attempts - 1),
+            config['DOCUMENT_RETRY_MAX_SECONDS']
+        )
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+def _record_result(job, result):
+    file = job.file
+    file.page_count = result['page_count']
+    file.word_count = result['word_count']
+    file.title = result['title']
+    file.preview = result['preview']
+    file.processed_at = datetime.utcnow()
+    file.processing_status = 'done'
+    job.status = 'done'
+    index_file(file.id, file.original_filename, result['text'])
+
+def process_pending_documents(batch_size=None):
+    """Parse one batch of due documents in parallel on the process pool
+
+    Each file is made available as a local path for the batch (copied out
+    of remote storage if needed), parsed in a worker process, and its
+    results are stored on the File row and in the search index.  Returns
+    the number of documents processed.
+    """
+    config = current_app.config
+    batch = _claim_due_jobs(batch_size or config['DOCUMENT_BATCH_SIZE'])
+    if not batch:
+        return 0
+
+    storage = get_storage()
+    pool = get_process_pool()
+    processed = 0
+    with ExitStack() as stack:
+        futures = []
+        for job in batch:
+            try:
+                path = stack.enter_context(storage.local_file(job.file.filename))
+                futures.append(pool.submit(
+                    analyze_document, path, job.file.file_type,
+                    config['SEARCH_MAX_TEXT_CHARS'], config['DOCUMENT_PREVIEW_CHARS']
+                ))
+            except Exception as e:
+                futures.append(e)
+
+        for job, future in zip(batch, futures):
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                result = future.result(config['DOCUMENT_TIMEOUT'])
+            except Exception as e:
+                current_app.logger.warning('Processing file %s failed: %s', job.file_id, e)
+                if isinstance(e, BrokenProcessPool):
+                    _discard_process_pool()
+                # A malformed document will not parse any better on a retry
+                _record_failure(job, e, permanent=isinstance(e, (zipfile.BadZipFile, ET.ParseError)))
+            else:
+                _record_result(job, result)
+                processed += 1
+            db.session.commit()
+
+    current_app.logger.info('Processed %d of %d queued documents', processed, len(batch))
+    return processed
+
+def pending_document_count():
+    """Count documents waiting to be processed"""
+    return ProcessingJob.query.filter_by(status='pending').count()
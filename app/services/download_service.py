@@ -0,0 +1,202 @@
+import hashlib
+import io
+import mimetypes
+import uuid
+import zipfile
+from flask import current_app, request
+from werkzeug.datastructures import Headers
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+from app.services.storage_service import get_storage
+
+def _satisfiable_ranges(size):
+    """Resolve the request's Range header against a representation of `size` bytes
+
+    Returns None when the whole representation should be sent, or a list of
+    (start, stop) pairs, which is empty when no requested range is satisfiable.
+    """
+    byte_range = request.range
+    if byte_range is None or byte_range.units != 'bytes':
+        return None
+    if len(byte_range.ranges) > current_app.config['DOWNLOAD_MAX_RANGES']:
+        return None
+
+    ranges = []
+    for start, stop in byte_range.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+def _if_range_matches(etag, last_modified):
+    """Check whether an If-Range precondition (if any) still holds"""
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return last_modified.replace(microsecond=0) <= if_range.date.replace(tzinfo=None)
+    return True
+
+def _part_header(start, stop, size, boundary, mimetype):
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {mimetype}\r\n'
+        f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+    ).encode('ascii')
+
+def _read_multipart(storage, key, ranges, size, boundary, mimetype, chunk_size):
+    for start, stop in ranges:
+        yield _part_header(start, stop, size, boundary, mimetype)
+        yield from storage.read_range(key, start, stop, chunk_size)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode('ascii')
+
+def _multipart_length(ranges, size, boundary, mimetype):
+    length = len(f'--{boundary}--\r\n')
+    for start, stop in ranges:
+        length += len(_part_header(start, stop, size, boundary, mimetype)) + (stop - start) + 2
+    return length
+
+def send_stored_file(key, download_name, etag=None, last_modified=None):
+    """Send a stored file with validators, Range support and optional proxy offload
+
+    `etag` should be a content hash when one is known (blob-backed files);
+    otherwise one is derived from the key, size and modification time.
+    """
+    storage = get_storage()
+    size = storage.size(key)
+    if last_modified is None:
+        last_modified = storage.modified(key)
+    if etag is None:
+        etag = hashlib.sha1(f'{key}-{size}-{last_modified.isoformat()}'.encode('utf-8')).hexdigest()
+
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    headers = Headers()
+    headers.set('Content-Disposition', 'attachment', filename=download_name)
+    headers.set('Accept-Ranges', 'bytes')
+
+    def respond(body=None, status=200, **kwargs):
+        response = current_app.response_class(
+            body, status=status, headers=headers, direct_passthrough=True, **kwargs
+        )
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        return response
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return respond(status=304)
+
+    offload = current_app.config['DOWNLOAD_OFFLOAD']
+    local_path = storage.local_path(key)
+    if offload == 'x-accel-redirect':
+        # nginx serves the bytes (and any Range) from an internal location
+        prefix = current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')
+        headers.set('X-Accel-Redirect', f'{prefix}/{storage.relative_path(key)}')
+        return respond(mimetype=mimetype)
+    if offload == 'x-sendfile' and local_path is not None:
+        headers.set('X-Sendfile', local_path)
+        return respond(mimetype=mimetype)
+
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+    ranges = _satisfiable_ranges(size) if _if_range_matches(etag, last_modified) else None
+
+    if ranges is None:
+        headers.set('Content-Length', str(size))
+        if local_path is not None:
+            # Lets the WSGI server use sendfile() for the whole body
+            body = wrap_file(request.environ, open(local_path, 'rb'), chunk_size)
+        else:
+            body = storage.read_range(key, 0, size, chunk_size)
+        return respond(body, mimetype=mimetype)
+
+    if not ranges:
+        headers.set('Content-Range', f'bytes */{size}')
+        return respond(status=416)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers.set('Content-Range', f'bytes {start}-{stop - 1}/{size}')
+        headers.set('Content-Length', str(stop - start))
+        return respond(storage.read_range(key, start, stop, chunk_size), status=206, mimetype=mimetype)
+
+    boundary = uuid.uuid4().hex
+    headers.set('Content-Length', str(_multipart_length(ranges, size, boundary, mimetype)))
+    return respond(
+        _read_multipart(storage, key, ranges, size, boundary, mimetype, chunk_size),
+        status=206,
+        content_type=f'multipart/byteranges; boundary={boundary}'
+    )
+
+class _ZipSink(io.RawIOBase):
+    """An unseekable write target that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def unique_archive_names(names):
+    """Make archive member names unique by suffixing repeats with ' (n)'
+
+    A suffixed name may itself be requested, e.g. 'a.docx', 'a (1).docx'
+    and 'a.docx' again, so numbers are skipped until the name is unused.
+    """
+    used = set(names)
+    counts = {}
+    unique = []
+    for name in names:
+        if name in counts:
+            stem, dot, ext = name.rpartition('.')
+            count = counts[name]
+            while True:
+                count += 1
+                candidate = f'{stem} ({count}).{ext}' if dot else f'{name} ({count})'
+                if candidate not in used:
+                    break
+            counts[name] = count
+            used.add(candidate)
+            name = candidate
+        else:
+            counts[name] = 0
+        unique.append(name)
+    return unique
+
+def stream_zip_archive(entries):
+    """Generate a ZIP archive chunk by chunk from (arcname, key, modified) entries
+
+    Members are stored uncompressed: OOXML documents are already deflated,
+    so recompressing them costs CPU for no gain.  Because the sink cannot
+    seek, zipfile writes data descriptors after each member, and only the
+    bytes produced since the previous chunk are ever held in memory.
+    """
+    storage = get_storage()
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+    sink = _ZipSink()
+
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, key, modified in entries:
+            info = zipfile.ZipInfo(arcname, date_time=modified.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = storage.size(key)
+
+            with archive.open(info, 'w') as dest:
+                for chunk in storage.read_range(key, chunk_size=chunk_size):
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+
+    yield sink.drain()
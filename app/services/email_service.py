@@ -1,35 +1,114 @@
+import smtplib
+import uuid
+from datetime import datetime, timedelta
 from flask import current_app, render_template, url_for
 from flask_mail import Message
-from app import mail
+from app import db, mail
+from app.models import EmailOutbox
 
-def send_verification_email(user):
-    """Send email verification to the user"""
+def queue_verification_email(user):
+    """Queue the verification email for a user in the current transaction"""
+    verification_url = url_for(
+        'auth.verify_email',
+        token=user.verification_token,
+        _external=True
+    )
 
-    try:
-        verification_url = url_for(
-            'auth.verify_email',
-            token=user.verification_token,
-            _external=True
+    email = EmailOutbox(
+        recipient=str(user.email).strip(),
+        subject="Verify your mail",
+        html=render_template(
+            'email/verification.html',
+            user=user,
+            verification_url=verification_url
         )
+    )
+    db.session.add(email)
+    return email
+
+def notify_outbox():
+    """Wake the outbox worker, if this process runs one, after new mail was committed"""
+    worker = current_app.extensions.get('email_worker')
+    if worker is not None:
+        worker.wake()
+
+def _claim_due_emails(batch_size):
+    """Lease a batch of due emails to this worker so concurrent workers skip them"""
+    now = datetime.utcnow()
+    claim_token = str(uuid.uuid4())
+    due_ids = db.session.query(EmailOutbox.id).filter(
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.id).limit(batch_size)
+
+    EmailOutbox.query.filter(
+        EmailOutbox.id.in_(due_ids.scalar_subquery()),
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    ).update({
+        EmailOutbox.claim_token: claim_token,
+        EmailOutbox.next_attempt_at: now + timedelta(seconds=current_app.config['EMAIL_OUTBOX_LEASE_SECONDS'])
+    }, synchronize_session=False)
+    db.session.commit()
+
+    return EmailOutbox.query.filter_by(claim_token=claim_token).order_by(EmailOutbox.id).all()
 
-        # Make sure subject and email are strings
-        subject = "Verify your mail"
-        recipient = str(user.email).strip()
-
-        msg = Message(
-            subject=subject,
-            recipients=[recipient],
-            html=render_template(
-                'email/verification.html',
-                user=user,
-                verification_url=verification_url
-            )
+def _record_failure(email, error):
+    config = current_app.config
+    email.attempts += 1
+    email.last_error = str(error)[:500]
+    if email.attempts >= config['EMAIL_MAX_ATTEMPTS']:
+        email.status = 'failed'
+    else:
+        delay = min(
+            config['EMAIL_RETRY_BASE_SECONDS'] * 2 ** (email.attempts - 1),
+            config['EMAIL_RETRY_MAX_SECONDS']
         )
+        email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+def deliver_pending_emails(batch_size=None):
+    """Send one batch of due outbox emails over a single SMTP connection
+
+    Returns the number of emails delivered.  Failures are retried with
+    exponential backoff until EMAIL_MAX_ATTEMPTS, then marked failed.
+    """
+    batch = _claim_due_emails(batch_size or current_app.config['EMAIL_OUTBOX_BATCH_SIZE'])
+    if not batch:
+        return 0
+
+    sent = 0
+    remaining = list(batch)
+    try:
+        with mail.connect() as connection:
+            while remaining:
+                email = remaining[0]
+                try:
+                    connection.send(Message(
+                        subject=email.subject,
+                        recipients=[email.recipient],
+                        html=email.html
+                    ))
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    raise
+                except Exception as e:
+                    current_app.logger.warning('Email %s to %s failed: %s', email.id, email.recipient, e)
+                    _record_failure(email, e)
+                else:
+                    email.status = 'sent'
+                    email.sent_at = datetime.utcnow()
+                    sent += 1
+                remaining.pop(0)
+                db.session.commit()
+    except (smtplib.SMTPException, OSError) as e:
+        # The connection itself failed; every email not yet tried counts an attempt
+        current_app.logger.warning('SMTP connection failed: %s', e)
+        for email in remaining:
+            _record_failure(email, e)
+        db.session.commit()
 
-        mail.send(msg)
-        print("Email sent successfully to", recipient)
-        return True
+    current_app.logger.info('Delivered %d of %d queued emails', sent, len(batch))
+    return sent
 
-    except Exception as e:
-        print("Error sending email:", e)
-        return False
+def pending_email_count():
+    """Count emails waiting in the outbox"""
+    return EmailOutbox.query.filter_by(status='pending').count()
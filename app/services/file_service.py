@@ -1,4 +1,15 @@
+import base64
+import json
+from datetime import datetime
 from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.orm import contains_eager
+from app import db
+from app.models import File, User
+from app.services.blob_service import collect_blob, release_blob
+from app.services.search_service import remove_from_index
+from app.services.storage_service import get_storage
+from app.services.token_service import apply_link_revocations, queue_link_revocations
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
@@ -7,4 +18,93 @@ def allowed_file(filename):
 
 def get_file_extension(filename):
     """Get the file extension from filename"""
-    return filename.rsplit('.', 1)[1].lower()
\ No newline at end of file
+    return filename.rsplit('.', 1)[1].lower()
+
+def stored_size(storage, key):
+    """Get the size of a stored key, or 0 when its bytes are missing"""
+    return storage.size(key) if storage.exists(key) else 0
+
+def delete_files(files):
+    """Delete files in one transaction and drop bytes nothing refers to any more
+
+    A blob is collected with its last reference; files stored before blobs
+    were introduced own their bytes outright.  Returns the bytes reclaimed.
+    """
+    storage = get_storage()
+    file_ids, unreferenced, legacy_keys = [], [], []
+    for file in files:
+        file_ids.append(file.id)
+        sha256 = file.blob_sha256
+        db.session.delete(file)
+        remove_from_index(file.id)
+        if not sha256:
+            legacy_keys.append(file.filename)
+        elif release_blob(sha256):
+            unreferenced.append(sha256)
+    revocations = queue_link_revocations('file', file_ids)
+    db.session.commit()
+    apply_link_revocations(revocations)
+
+    reclaimed = 0
+    for sha256 in unreferenced:
+        size = stored_size(storage, sha256)
+        if collect_blob(sha256):
+            reclaimed += size
+    for key in legacy_keys:
+        reclaimed += stored_size(storage, key)
+        storage.delete(key)
+    return reclaimed
+
+def encode_cursor(created_at, file_id):
+    """Encode the (created_at, id) position of a file as an opaque cursor"""
+    raw = json.dumps([created_at.isoformat(), file_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, file_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(file_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def build_file_list_query(cursor=None, file_type=None, uploaded_by=None,
+                          created_after=None, created_before=None):
+    """Build the keyset-ordered file listing query with the owner joined in"""
+    query = File.query.join(File.owner).options(contains_eager(File.owner))
+
+    if file_type:
+        query = query.filter(File.file_type == file_type.lower())
+    if uploaded_by:
+        query = query.filter(User.email == uploaded_by)
+    if created_after:
+        query = query.filter(File.created_at >= created_after)
+    if created_before:
+        query = query.filter(File.created_at < created_before)
+    if cursor:
+        query = query.filter(tuple_(File.created_at, File.id) > cursor)
+
+    return query.order_by(File.created_at, File.id)
+
+def stream_file_page(query, limit):
+    """Serialize one page of files as JSON, one row at a time
+
+    The query is read with ``yield_per`` so rows are never materialized all
+    at once; one extra row is fetched to decide whether a next page exists.
+    """
+    yield '{"message": "Files retrieved successfully", "files": ['
+
+    last = None
+    has_more = False
+    for count, file in enumerate(query.limit(limit + 1).yield_per(100)):
+        if count == limit:
+            has_more = True
+            break
+        if last is not None:
+            yield ', '
+        yield json.dumps(file.to_dict())
+        last = file
+
+    next_cursor = encode_cursor(last.created_at, last.id) if has_more else None
+    yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
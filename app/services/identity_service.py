@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, jsonify
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app import db, lazy_extension
+from app.models import User, UserRole
+
+class CachedIdentity:
+    """The slice of a User needed to authorize a request"""
+    __slots__ = ('id', 'email', 'role', 'is_verified')
+
+    def __init__(self, id, email, role, is_verified):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.is_verified = is_verified
+
+    def is_ops_user(self):
+        return self.role == UserRole.OPS.value
+
+    def is_client_user(self):
+        return self.role == UserRole.CLIENT.value
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def _identity_cache():
+    return lazy_extension('identity_cache', lambda app: TTLCache(
+        app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL']
+    ))
+
+def load_identity(user_id):
+    """Get the cached identity of a user, reading it from the database on a miss"""
+    cache = _identity_cache()
+    identity = cache.get(user_id)
+    if identity is None:
+        row = db.session.query(User.id, User.email, User.role, User.is_verified) \
+            .filter(User.id == user_id).first()
+        if row is None:
+            return None
+        identity = CachedIdentity(*row)
+        cache.set(user_id, identity)
+    return identity
+
+def invalidate_identity(user_id):
+    """Drop a user's cached identity so the next request reloads it"""
+    _identity_cache().invalidate(user_id)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _note_changed_user(mapper, connection, user):
+    # Invalidated only once committed, so a concurrent request cannot re-cache the old row
+    object_session(user).info.setdefault('changed_user_ids', set()).add(user.id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    user_ids = session.info.pop('changed_user_ids', ())
+    if user_ids and current_app and 'identity_cache' in current_app.extensions:
+        for user_id in user_ids:
+            invalidate_identity(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
+def init_identity_loader(app, jwt):
+    """Resolve the JWT identity to a cached user once per request
+
+    Other worker processes see a change once their entry expires, so
+    IDENTITY_CACHE_TTL bounds how long a role change takes to apply.
+    """
+    @jwt.user_lookup_loader
+    def user_lookup_callback(_jwt_header, jwt_data):
+        return load_identity(jwt_data['sub']['user_id'])
+
+    @jwt.user_lookup_error_loader
+    def user_lookup_error_callback(_jwt_header, jwt_data):
+        return jsonify({'message': 'User not found'}), 404
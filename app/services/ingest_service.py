@@ -0,0 +1,105 @@
+import hashlib
+import io
+from flask import Request, current_app
+from app.services.storage_service import get_storage
+
+# Every Office Open XML document (docx, pptx, xlsx) is a zip archive
+OOXML_MAGIC = b'PK\x03\x04'
+INGEST_ENDPOINTS = {'file.upload_file'}
+
+def has_office_signature(stream):
+    """Check that a seekable stream starts with the OOXML signature, leaving its position as it was"""
+    start = stream.tell()
+    head = stream.read(len(OOXML_MAGIC))
+    stream.seek(start)
+    return head == OOXML_MAGIC
+
+class IngestStream(io.RawIOBase):
+    """A multipart file part written straight into a storage staging object
+
+    Werkzeug writes each chunk of the part here while it parses the body.
+    The chunk is counted, hashed and checked against the OOXML signature on
+    its way to staging, so an upload is written to disk once instead of
+    being spooled to a temp file and copied.  Once the part is rejected
+    the rest of it is dropped instead of written.
+    """
+
+    def __init__(self, storage, max_size):
+        self.storage = storage
+        self.max_size = max_size
+        self.staged = storage.stage()
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+        self.error = None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.error is not None:
+            return len(data)
+
+        if len(self.head) < len(OOXML_MAGIC):
+            self.head += data[:len(OOXML_MAGIC) - len(self.head)]
+            if not OOXML_MAGIC.startswith(self.head):
+                self.reject('File content is not a valid Office document', 400)
+                return len(data)
+
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.reject('File is too large', 413)
+            return len(data)
+
+        self.digest.update(data)
+        self.staged.file.write(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Werkzeug rewinds each part once it is complete; nothing is read back
+        return 0
+
+    def reject(self, message, status):
+        self.error = (message, status)
+        self.staged.__exit__(None, None, None)
+
+    def finish(self):
+        """Validate the part and publish it as a blob, returning (sha256, size, created)
+
+        `created` is False when the blob was already stored, in which case
+        the staged copy is dropped.  Raises ValueError with a message and an
+        HTTP status when the part was rejected.
+        """
+        if self.error is None and self.head != OOXML_MAGIC:
+            self.reject('File content is not a valid Office document', 400)
+        if self.error is not None:
+            raise ValueError(*self.error)
+
+        sha256 = self.digest.hexdigest()
+        created = not self.storage.exists(sha256)
+        with self.staged:
+            if created:
+                self.staged.commit(sha256)
+        return sha256, self.size, created
+
+    def close(self):
+        if not self.closed:
+            self.staged.__exit__(None, None, None)
+        super().close()
+
+class IngestRequest(Request):
+    """Request class that streams file parts of upload endpoints into storage"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in INGEST_ENDPOINTS:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        stream = IngestStream(get_storage(), current_app.config['MAX_CONTENT_LENGTH'])
+        self._ingest_streams = getattr(self, '_ingest_streams', []) + [stream]
+        return stream
+
+    def close(self):
+        # Parts are not in `files` yet if parsing failed halfway; drop their staged bytes too
+        for stream in getattr(self, '_ingest_streams', ()):
+            stream.close()
+        super().close()
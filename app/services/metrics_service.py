@@ -0,0 +1,149 @@
+import os
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from app import db
+
+UPLOAD_ENDPOINTS = {'file.upload_file', 'file.upload_part', 'file.upload_batch'}
+DOWNLOAD_ENDPOINTS = {'file.download_file', 'file.download_archive'}
+
+class Metrics:
+    """The application's Prometheus metrics, registered on a registry of their own
+
+    When PROMETHEUS_MULTIPROC_DIR is set, prometheus_client writes every
+    value to a per-process file in that directory and a scrape merges the
+    files, so /metrics reports the totals of all gunicorn workers whichever
+    one answers it.
+    """
+
+    def __init__(self, prometheus, buckets):
+        self.prometheus = prometheus
+        self.registry = prometheus.CollectorRegistry()
+        options = {'registry': self.registry}
+
+        self.request_latency = prometheus.Histogram(
+            'http_request_duration_seconds', 'Time spent handling a request',
+            ['endpoint', 'method', 'status'], buckets=buckets, **options
+        )
+        self.request_queries = prometheus.Histogram(
+            'http_request_db_queries', 'SQL statements run while handling a request',
+            ['endpoint'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100), **options
+        )
+        self.request_query_time = prometheus.Histogram(
+            'http_request_db_seconds', 'Time spent in SQL while handling a request',
+            ['endpoint'], buckets=buckets, **options
+        )
+        self.upload_bytes = prometheus.Counter(
+            'file_upload_bytes', 'Request body bytes received by upload endpoints', **options
+        )
+        self.download_bytes = prometheus.Counter(
+            'file_download_bytes', 'Response body bytes sent by download endpoints', **options
+        )
+        self.password_hash_time = prometheus.Histogram(
+            'password_hash_duration_seconds', 'Time spent in bcrypt, including queueing',
+            ['operation'], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), **options
+        )
+        self.queues = _QueueCollector(prometheus)
+        self.registry.register(self.queues)
+
+    def render(self):
+        """Render every metric in the Prometheus text format"""
+        prometheus = self.prometheus
+        registry = self.registry
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = prometheus.CollectorRegistry()
+            prometheus.multiprocess.MultiProcessCollector(registry)
+            registry.register(self.queues)
+        return prometheus.generate_latest(registry)
+
+class _QueueCollector:
+    """Report queue depths straight from the database at scrape time"""
+
+    def __init__(self, prometheus):
+        self.prometheus = prometheus
+
+    def collect(self):
+        from app.services.email_service import pending_email_count
+        from app.services.document_service import pending_document_count
+
+        gauge = self.prometheus.core.GaugeMetricFamily
+        yield gauge('email_outbox_pending', 'Emails waiting to be delivered', value=pending_email_count())
+        yield gauge('document_jobs_pending', 'Documents waiting to be processed', value=pending_document_count())
+
+def _metrics():
+    return current_app.extensions.get('metrics') if current_app else None
+
+def record_password_hash(operation, seconds):
+    """Record how long a bcrypt hash or check took, when metrics are enabled"""
+    metrics = _metrics()
+    if metrics is not None:
+        metrics.password_hash_time.labels(operation).observe(seconds)
+
+def _count_bytes(body, counter):
+    for chunk in body:
+        counter.inc(len(chunk))
+        yield chunk
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_time = 0.0
+
+def _after_request(response):
+    metrics = _metrics()
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+
+    endpoint = request.endpoint or 'unmatched'
+    metrics.request_latency.labels(endpoint, request.method, str(response.status_code)) \
+        .observe(time.perf_counter() - started)
+    metrics.request_queries.labels(endpoint).observe(g.metrics_queries)
+    metrics.request_query_time.labels(endpoint).observe(g.metrics_query_time)
+
+    if endpoint in UPLOAD_ENDPOINTS and request.content_length:
+        metrics.upload_bytes.inc(request.content_length)
+    elif endpoint in DOWNLOAD_ENDPOINTS and response.status_code in (200, 206):
+        if response.content_length is not None and not response.headers.get('X-Accel-Redirect'):
+            metrics.download_bytes.inc(response.content_length)
+        elif response.is_streamed:
+            response.response = _count_bytes(response.response, metrics.download_bytes)
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+        if context is not None and hasattr(context, 'metrics_started'):
+            g.metrics_query_time += time.perf_counter() - context.metrics_started
+
+def init_metrics(app):
+    """Instrument requests and SQL and serve /metrics when METRICS_ENABLED is set"""
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    try:
+        import prometheus_client
+        import prometheus_client.core
+        import prometheus_client.multiprocess
+    except ImportError as e:
+        raise RuntimeError('METRICS_ENABLED requires the prometheus_client package') from e
+
+    app.extensions['metrics'] = Metrics(prometheus_client, app.config['METRICS_LATENCY_BUCKETS'])
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.route('/metrics')
+    def metrics():
+        return current_app.response_class(
+            app.extensions['metrics'].render(),
+            mimetype=prometheus_client.CONTENT_TYPE_LATEST
+        )
@@ -0,0 +1,153 @@
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, jsonify, request
+from app import lazy_extension
+
+def take_token(state, capacity, rate, now):
+    """Refill a (tokens, updated_at) bucket and try to take one token from it
+
+    Returns the new state and how many seconds to wait before a token is
+    available (0 when one was taken).
+    """
+    if state is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, state[0] + max(0.0, now - state[1]) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+class MemoryBucketStore:
+    """Token buckets in this process, evicting the least recently used beyond `maxsize`"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            state, retry_after = take_token(self._buckets.get(key), capacity, rate, now)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker process on the host
+
+    Each take is one short `BEGIN IMMEDIATE` transaction, so concurrent
+    workers serialize on the file lock instead of double-spending a
+    bucket.  The file is separate from the application database so rate
+    limiting never waits behind application writes.  Buckets idle for
+    longer than `idle_seconds` are full again and are pruned now and then.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path, idle_seconds):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS rate_bucket '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, rate, now):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated_at FROM rate_bucket WHERE key = ?', (key,)
+            ).fetchone()
+            (tokens, updated_at), retry_after = take_token(row, capacity, rate, now)
+            connection.execute(
+                'INSERT INTO rate_bucket (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, updated_at)
+            )
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                connection.execute('DELETE FROM rate_bucket WHERE updated_at < ?', (now - self.idle_seconds,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return retry_after
+
+def create_bucket_store(config):
+    """Build the bucket store selected by RATE_LIMIT_STORAGE"""
+    backend = config['RATE_LIMIT_STORAGE']
+    if backend == 'memory':
+        return MemoryBucketStore(config['RATE_LIMIT_MEMORY_SIZE'])
+    if backend == 'sqlite':
+        return SQLiteBucketStore(config['RATE_LIMIT_SQLITE_PATH'], config['RATE_LIMIT_IDLE_SECONDS'])
+    raise ValueError(f'Unknown RATE_LIMIT_STORAGE: {backend!r}')
+
+def _bucket_keys(endpoint):
+    """The (limit name, key) pairs a request to `endpoint` is charged against"""
+    keys = [(f'{endpoint}_per_ip', request.remote_addr or 'unknown')]
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get('email'), str):
+        keys.append((f'{endpoint}_per_email', data['email'].strip().lower()))
+    return keys
+
+def check_rate_limit(endpoint):
+    """Take a token from each bucket of the request in turn, returning seconds to wait or 0
+
+    Stops at the first bucket that rejects the request, so a rejected
+    request does not also drain the buckets after it.
+    """
+    store = lazy_extension('rate_limits', lambda app: create_bucket_store(app.config))
+    limits = current_app.config['RATE_LIMITS']
+    now = time.time()
+    for name, key in _bucket_keys(endpoint):
+        if name not in limits:
+            continue
+        capacity, period = limits[name]
+        retry_after = store.take(f'{name}:{key}', capacity, capacity / period, now)
+        if retry_after:
+            return retry_after
+    return 0.0
+
+def rate_limited(endpoint):
+    """Shed requests over the per-IP and per-email limits of `endpoint` with a 429
+
+    Runs before the view, so a rejected request never reaches bcrypt or
+    the database.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_app.config['RATE_LIMIT_ENABLED']:
+                retry_after = check_rate_limit(endpoint)
+                if retry_after:
+                    response = jsonify({'message': 'Too many requests, please retry later'})
+                    response.headers['Retry-After'] = str(math.ceil(retry_after))
+                    return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
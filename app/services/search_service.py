@@ -0,0 +1,70 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import contains_eager
+from app import db
+from app.models import File
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+def index_file(file_id, original_filename, content):
+    """Add or replace one file's entry in the full-text index"""
+    if _dialect() == 'postgresql':
+        db.session.execute(text(
+            "INSERT INTO file_search (file_id, original_filename, content, document) "
+            "VALUES (:id, :name, :content, "
+            "setweight(to_tsvector('simple', :name), 'A') || setweight(to_tsvector('english', :content), 'B')) "
+            "ON CONFLICT (file_id) DO UPDATE SET original_filename = EXCLUDED.original_filename, "
+            "content = EXCLUDED.content, document = EXCLUDED.document"
+        ), {'id': file_id, 'name': original_filename, 'content': content})
+    else:
+        db.session.execute(text('DELETE FROM file_search WHERE rowid = :id'), {'id': file_id})
+        db.session.execute(text(
+            'INSERT INTO file_search (rowid, original_filename, content) VALUES (:id, :name, :content)'
+        ), {'id': file_id, 'name': original_filename, 'content': content})
+
+def remove_from_index(file_id):
+    """Drop one file from the full-text index"""
+    column = 'file_id' if _dialect() == 'postgresql' else 'rowid'
+    db.session.execute(text(f'DELETE FROM file_search WHERE {column} = :id'), {'id': file_id})
+
+def _fts5_query(query):
+    """Turn free text into a safe FTS5 query: every word required, the last as a prefix"""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def search_files(query, limit, offset):
+    """Run a ranked full-text search, returning (File, rank, snippet) tuples
+
+    Files are loaded with their owners in a single query after ranking.
+    """
+    if _dialect() == 'postgresql':
+        rows = db.session.execute(text(
+            "SELECT file_id, ts_rank(document, q) AS rank, "
+            "ts_headline('english', content, q, 'StartSel=[, StopSel=], MaxWords=12, MinWords=5') AS snippet "
+            "FROM file_search, websearch_to_tsquery('english', :q) AS q "
+            "WHERE document @@ q ORDER BY rank DESC, file_id LIMIT :limit OFFSET :offset"
+        ), {'q': query, 'limit': limit, 'offset': offset}).all()
+    else:
+        match = _fts5_query(query)
+        if match is None:
+            return []
+        # Matches in the file name weigh ten times as much as matches in the body
+        rows = db.session.execute(text(
+            "SELECT rowid, bm25(file_search, 10.0, 1.0) AS rank, "
+            "snippet(file_search, 1, '[', ']', '...', 12) AS snippet "
+            "FROM file_search WHERE file_search MATCH :q "
+            "ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), {'q': match, 'limit': limit, 'offset': offset}).all()
+
+    if not rows:
+        return []
+
+    files = File.query.join(File.owner).options(contains_eager(File.owner)) \
+        .filter(File.id.in_([row[0] for row in rows])).all()
+    by_id = {file.id: file for file in files}
+    return [(by_id[row[0]], row[1], row[2]) for row in rows if row[0] in by_id]
@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Runs in a fresh interpreter so nothing is imported or initialized yet
+PROFILE_SCRIPT = '''
+import json, os, sys, time
+preloaded = sorted(sys.modules)
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+print(json.dumps({
+    'preloaded': preloaded,
+    'import_seconds': imported - started,
+    'create_app_seconds': created - imported,
+    'components': app.extensions['startup_timings']
+}))
+sys.stdout.flush()
+os._exit(0)
+'''
+
+def parse_import_times(output, exclude=()):
+    """Sum `python -X importtime` self times (seconds) per top-level package"""
+    packages = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if name not in exclude:
+            packages[name.split('.')[0]] += int(self_us) / 1_000_000
+    return dict(packages)
+
+def profile_startup(config_name):
+    """Import and build the app in a fresh interpreter and time each part
+
+    Returns the time to import `app`, the time `create_app` took in total
+    and per extension or service, and module import time per package
+    (which also covers imports that `create_app` triggers).
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT, config_name],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'Starting the app failed:\n{result.stderr[-2000:]}')
+
+    profile = json.loads(result.stdout.strip().splitlines()[-1])
+    profile['packages'] = parse_import_times(result.stderr, set(profile.pop('preloaded')))
+    return profile
@@ -0,0 +1,352 @@
+import abc
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from app import lazy_extension
+
+class StorageBackend(abc.ABC):
+    """Where file bytes live; every driver stores opaque keys atomically
+
+    Writers go through `stage()`: bytes are written to a staging object and
+    only become visible under a key when `commit(key)` is called, so readers
+    never observe a partial file.  Reading the bytes, size or modification
+    time of a missing key raises FileNotFoundError.
+    """
+
+    @abc.abstractmethod
+    def stage(self):
+        ...
+
+    @contextmanager
+    def writer(self, key):
+        """Write a key in one go; nothing is published if the block raises"""
+        with self.stage() as staged:
+            yield staged.file
+            staged.commit(key)
+
+    @abc.abstractmethod
+    def read_range(self, key, start=0, stop=None, chunk_size=1024 * 1024):
+        ...
+
+    @abc.abstractmethod
+    def exists(self, key):
+        ...
+
+    @abc.abstractmethod
+    def size(self, key):
+        ...
+
+    @abc.abstractmethod
+    def modified(self, key):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key):
+        ...
+
+    @abc.abstractmethod
+    def iter_keys(self):
+        ...
+
+    def available(self):
+        """Check that the store itself is reachable, so missing keys really are missing"""
+        return True
+
+    def local_path(self, key):
+        """Get a filesystem path for the key when the driver has one"""
+        return None
+
+    def relative_path(self, key):
+        """Get the key's location relative to the storage root, for proxy offload"""
+        return key
+
+    @contextmanager
+    def local_file(self, key):
+        """Yield a filesystem path holding the key's bytes, copying them if needed"""
+        path = self.local_path(key)
+        if path is not None:
+            yield path
+            return
+
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in self.read_range(key):
+                    out.write(chunk)
+            yield temp_path
+        finally:
+            os.unlink(temp_path)
+
+class _LocalStaged:
+    def __init__(self, storage):
+        self.storage = storage
+        os.makedirs(storage.staging_dir, exist_ok=True)
+        self.temp_path = os.path.join(storage.staging_dir, f'{uuid.uuid4()}.tmp')
+        self.file = open(self.temp_path, 'wb')
+
+    def commit(self, key):
+        self.file.close()
+        path = self.storage.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.temp_path, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+
+class LocalStorage(StorageBackend):
+    """Files under a root directory, sharded by a hash prefix of their key
+
+    `ab/cd/<key>` keeps every directory small no matter how many files are
+    stored.  Keys still sitting flat in the root (from before sharding) are
+    found too until `flask storage migrate` moves them.
+    """
+
+    def __init__(self, root, shard_depth=2):
+        self.root = root
+        self.shard_depth = shard_depth
+        self.staging_dir = os.path.join(root, '.staging')
+
+    def shard_path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return os.path.join(self.root, *shards, key)
+
+    def path_for(self, key):
+        if '/' in key or '\\' in key or key.startswith('.'):
+            raise ValueError(f'Invalid storage key: {key!r}')
+        return self.shard_path(key)
+
+    def local_path(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            legacy_path = os.path.join(self.root, key)
+            if os.path.isfile(legacy_path):
+                return legacy_path
+        return path
+
+    def relative_path(self, key):
+        return os.path.relpath(self.local_path(key), self.root).replace(os.sep, '/')
+
+    def stage(self):
+        return _LocalStaged(self)
+
+    def read_range(self, key, start=0, stop=None, chunk_size=1024 * 1024):
+        with open(self.local_path(key), 'rb') as f:
+            f.seek(start)
+            remaining = None if stop is None else stop - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.local_path(key))
+
+    def modified(self, key):
+        return datetime.utcfromtimestamp(os.path.getmtime(self.local_path(key)))
+
+    def delete(self, key):
+        try:
+            os.unlink(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for name in filenames:
+                if not name.startswith('.'):
+                    yield name
+
+    def available(self):
+        return os.path.isdir(self.root)
+
+    def migrate_flat_files(self):
+        """Move files stored flat in the root into their shard directories
+
+        Returns the number of files moved.
+        """
+        moved = 0
+        if not os.path.isdir(self.root):
+            return moved
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    path = self.shard_path(entry.name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(entry.path, path)
+                    moved += 1
+        return moved
+
+class _MemoryStaged:
+    def __init__(self, storage):
+        self.storage = storage
+        self.file = io.BytesIO()
+
+    def commit(self, key):
+        with self.storage._lock:
+            self.storage._objects[key] = (self.file.getvalue(), datetime.utcnow())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+class MemoryStorage(StorageBackend):
+    """Objects kept in a dict; for tests and throwaway environments"""
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def stage(self):
+        return _MemoryStaged(self)
+
+    def _object(self, key):
+        try:
+            return self._objects[key]
+        except KeyError:
+            raise FileNotFoundError(key) from None
+
+    def read_range(self, key, start=0, stop=None, chunk_size=1024 * 1024):
+        data = self._object(key)[0]
+        stop = len(data) if stop is None else stop
+        for offset in range(start, stop, chunk_size):
+            yield data[offset:min(offset + chunk_size, stop)]
+
+    def exists(self, key):
+        return key in self._objects
+
+    def size(self, key):
+        return len(self._object(key)[0])
+
+    def modified(self, key):
+        return self._object(key)[1]
+
+    def delete(self, key):
+        with self._lock:
+            self._objects.pop(key, None)
+
+    def iter_keys(self):
+        return iter(list(self._objects))
+
+class _S3Staged:
+    def __init__(self, storage):
+        self.storage = storage
+        self.file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+
+    def commit(self, key):
+        self.file.seek(0)
+        self.storage.client.upload_fileobj(self.file, self.storage.bucket, self.storage.object_key(key))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, Ceph...) via boto3"""
+
+    def __init__(self, bucket, prefix='', client=None, **client_options):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError('STORAGE_BACKEND "s3" requires the boto3 package') from e
+            client = boto3.client('s3', **client_options)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def object_key(self, key):
+        return f'{self.prefix}{key}'
+
+    def stage(self):
+        return _S3Staged(self)
+
+    def read_range(self, key, start=0, stop=None, chunk_size=1024 * 1024):
+        options = {}
+        if start or stop is not None:
+            options['Range'] = f'bytes={start}-' + ('' if stop is None else str(stop - 1))
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key), **options)['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key) from None
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key) from None
+            raise
+
+    def exists(self, key):
+        try:
+            self._head(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, key):
+        return self._head(key)['ContentLength']
+
+    def modified(self, key):
+        return self._head(key)['LastModified'].replace(tzinfo=None)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def iter_keys(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):]
+
+    def available(self):
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except self.client.exceptions.ClientError:
+            return False
+        return True
+
+    def relative_path(self, key):
+        return self.object_key(key)
+
+def create_storage(config):
+    """Build the storage driver selected by STORAGE_BACKEND"""
+    backend = config['STORAGE_BACKEND']
+    if backend == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'], config['STORAGE_SHARD_DEPTH'])
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 's3':
+        options = {'endpoint_url': config['S3_ENDPOINT_URL']} if config['S3_ENDPOINT_URL'] else {}
+        return S3Storage(config['S3_BUCKET'], config['S3_PREFIX'], **options)
+    raise ValueError(f'Unknown STORAGE_BACKEND: {backend!r}')
+
+def get_storage():
+    """Get the storage driver of the current app, creating it on first use"""
+    return lazy_extension('storage', lambda app: create_storage(app.config))
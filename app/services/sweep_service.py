@@ -0,0 +1,377 @@
+import itertools
+import os
+import shutil
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import AccessEvent, Blob, EmailOutbox, File, UploadSession
+from app.services.blob_service import collect_blob
+from app.services.blocklist_service import prune_revoked_tokens
+from app.services.file_service import delete_files, stored_size
+from app.services.storage_service import LocalStorage, get_storage
+from app.services.token_service import prune_link_revocations
+from app.services.upload_service import discard_session_parts, list_parts
+
+SWEEP_COUNTERS = (
+    'staged_files', 'upload_sessions', 'orphan_keys', 'dangling_files', 'dangling_blobs',
+    'unreferenced_blobs', 'refcounts_fixed', 'expired_files', 'expired_emails',
+    'expired_access_events', 'revoked_tokens', 'link_revocations'
+)
+
+class SweepAborted(Exception):
+    """Raised when storage looks unavailable rather than missing a few keys"""
+
+class SweepState:
+    """Where each scan of an incremental sweep stopped, so the next pass resumes there
+
+    Storage keys come from a listing generator kept between passes; table
+    scans remember the last key they saw.  Only one batch of keys or rows
+    is in memory at a time, however many files are stored.
+    """
+
+    def __init__(self):
+        self.keys = None
+        self.last_blob = ''
+        self.last_legacy_file = 0
+
+def _directory_size(path):
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                pass
+    return size
+
+def _mtime(entry):
+    try:
+        return entry.stat().st_mtime
+    except FileNotFoundError:
+        return float('inf')  # removed while listing; nothing to sweep
+
+def _stale_entries(directory, cutoff, batch_size):
+    """Yield batches of directory entries last modified before `cutoff` (a timestamp)"""
+    if not os.path.isdir(directory):
+        return
+    with os.scandir(directory) as entries:
+        stale = (entry for entry in entries if _mtime(entry) < cutoff)
+        while True:
+            batch = list(itertools.islice(stale, batch_size))
+            if not batch:
+                return
+            yield batch
+
+def _referenced_keys(keys):
+    referenced = {sha256 for sha256, in db.session.query(Blob.sha256).filter(Blob.sha256.in_(keys))}
+    referenced.update(key for key, in db.session.query(File.filename).filter(File.filename.in_(keys)))
+    return referenced
+
+class StorageSweep:
+    """One pass reconciling storage with the database and applying retention
+
+    Every scan reads `batch_size` keys or rows at a time and, with
+    `max_batches`, stops after that many batches; `state` remembers where.
+    A dry run counts what would be removed without removing anything.
+    Files whose bytes look missing are only deleted while they stay a small
+    share of the rows checked, unless `force` is set: an unmounted or
+    misconfigured store must not empty the catalog.
+    """
+
+    def __init__(self, state=None, batch_size=None, max_batches=None, dry_run=False, force=False):
+        config = current_app.config
+        self.state = state or SweepState()
+        self.batch_size = batch_size or config['STORAGE_SWEEP_BATCH_SIZE']
+        self.max_batches = max_batches
+        self.dry_run = dry_run
+        self.force = force
+        self.storage = get_storage()
+        self.grace = config['STORAGE_ORPHAN_GRACE']
+        self.report = Counter()
+
+    def _batches(self):
+        return range(self.max_batches) if self.max_batches else itertools.count()
+
+    def _check_missing(self, checked, missing):
+        """Raise SweepAborted once more files lack their bytes than storage could plausibly lose"""
+        self.report['rows_checked'] += checked
+        self.report['rows_missing'] += missing
+        if self.force or not missing:
+            return
+        config = current_app.config
+        total, found = self.report['rows_checked'], self.report['rows_missing']
+        if found > config['STORAGE_SWEEP_MISSING_ALLOWANCE'] and \
+                found > total * config['STORAGE_SWEEP_MAX_MISSING_SHARE']:
+            raise SweepAborted(
+                f'{found} of {total} files checked have no stored bytes; '
+                'check the storage configuration, or sweep with --force'
+            )
+
+    def run(self):
+        if not self.storage.available():
+            raise SweepAborted('Storage is not available; nothing was swept')
+        self.sweep_staging()
+        # Rows missing their bytes are counted first, so a wrong store aborts before any orphan is deleted
+        self.sweep_blobs()
+        self.sweep_legacy_files()
+        self.sweep_orphan_keys()
+        self.apply_retention()
+        return self.report
+
+    def sweep_staging(self):
+        """Remove abandoned storage staging files and expired chunked upload sessions"""
+        report = self.report
+        cutoff = time.time() - self.grace.total_seconds()
+
+        if isinstance(self.storage, LocalStorage):
+            stale = _stale_entries(self.storage.staging_dir, cutoff, self.batch_size)
+            for _, batch in zip(self._batches(), stale):
+                for entry in batch:
+                    try:
+                        size = entry.stat().st_size
+                        if not self.dry_run:
+                            os.unlink(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    report['bytes_reclaimed'] += size
+                    report['staged_files'] += 1
+
+        expired_before = datetime.utcnow() - current_app.config['UPLOAD_SESSION_TTL']
+        last_id = ''
+        for _ in self._batches():
+            sessions = UploadSession.query.filter(
+                UploadSession.created_at < expired_before, UploadSession.id > last_id
+            ).order_by(UploadSession.id).limit(self.batch_size).all()
+            if not sessions:
+                break
+            last_id = sessions[-1].id
+            for session in sessions:
+                report['bytes_reclaimed'] += sum(size for _, size in list_parts(session.id))
+                report['upload_sessions'] += 1
+                if not self.dry_run:
+                    discard_session_parts(session.id)
+                    db.session.delete(session)
+            db.session.commit()
+
+        # Part directories left behind by sessions whose row is already gone
+        stale = _stale_entries(current_app.config['UPLOAD_STAGING_FOLDER'], cutoff, self.batch_size)
+        for _, batch in zip(self._batches(), stale):
+            names = [entry.name for entry in batch if entry.is_dir()]
+            live = {upload_id for upload_id, in db.session.query(UploadSession.id).filter(UploadSession.id.in_(names))}
+            for entry in batch:
+                if entry.is_dir() and entry.name not in live:
+                    report['bytes_reclaimed'] += _directory_size(entry.path)
+                    report['upload_sessions'] += 1
+                    if not self.dry_run:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+            db.session.commit()
+
+    def sweep_orphan_keys(self):
+        """Delete stored bytes that no blob row or legacy file refers to"""
+        state, storage = self.state, self.storage
+        cutoff = datetime.utcnow() - self.grace
+        if state.keys is None:
+            state.keys = storage.iter_keys()
+
+        for _ in self._batches():
+            keys = list(itertools.islice(state.keys, self.batch_size))
+            if not keys:
+                state.keys = None
+                return
+
+            referenced = _referenced_keys(keys)
+            orphans = []
+            for key in keys:
+                if key in referenced:
+                    continue
+                try:
+                    # Younger bytes may belong to an upload whose row is not committed yet
+                    if storage.modified(key) <= cutoff:
+                        orphans.append((key, storage.size(key)))
+                except FileNotFoundError:
+                    pass  # deleted since it was listed
+            db.session.commit()
+
+            if orphans:
+                # An upload may have adopted the bytes since the first check
+                adopted = _referenced_keys([key for key, _ in orphans])
+                for key, size in orphans:
+                    if key not in adopted:
+                        if not self.dry_run:
+                            storage.delete(key)
+                        self.report['orphan_keys'] += 1
+                        self.report['bytes_reclaimed'] += size
+                db.session.commit()
+
+    def sweep_blobs(self):
+        """Reconcile blob rows with the files referring to them and the stored bytes
+
+        Files whose bytes are gone are deleted along with their blob, blobs no
+        file refers to are collected and drifted reference counts are fixed.
+        Rows are only changed if their reference count is still the one read,
+        so a concurrent upload of the same content always wins.
+        """
+        state, storage, report = self.state, self.storage, self.report
+        cutoff = datetime.utcnow() - self.grace
+
+        for _ in self._batches():
+            blobs = Blob.query.filter(Blob.sha256 > state.last_blob) \
+                .order_by(Blob.sha256).limit(self.batch_size).all()
+            if not blobs:
+                state.last_blob = ''
+                return
+            state.last_blob = blobs[-1].sha256
+
+            observed = [(blob.sha256, blob.refcount, blob.created_at) for blob in blobs]
+            counts = dict(
+                db.session.query(File.blob_sha256, func.count(File.id))
+                .filter(File.blob_sha256.in_([sha256 for sha256, _, _ in observed]))
+                .group_by(File.blob_sha256).all()
+            )
+
+            missing = [sha256 for sha256, _, _ in observed if not storage.exists(sha256)]
+            self._check_missing(len(observed), len(missing))
+            if missing:
+                files = File.query.filter(File.blob_sha256.in_(missing)).all()
+                report['dangling_files'] += len(files)
+                report['dangling_blobs'] += len(missing)
+                if not self.dry_run:
+                    delete_files(files)
+                    # Releasing the files usually removed the rows already; drop any with a drifted count
+                    Blob.query.filter(Blob.sha256.in_(missing)).delete(synchronize_session=False)
+                    db.session.commit()
+
+            unreferenced = []
+            for sha256, refcount, created_at in observed:
+                count = counts.get(sha256, 0)
+                if sha256 in missing or (count and count == refcount):
+                    continue
+                if count:
+                    report['refcounts_fixed'] += 1
+                    if not self.dry_run:
+                        Blob.query.filter(Blob.sha256 == sha256, Blob.refcount == refcount) \
+                            .update({Blob.refcount: count}, synchronize_session=False)
+                elif created_at is None or created_at <= cutoff:
+                    unreferenced.append((sha256, refcount))
+
+            if self.dry_run:
+                for sha256, _ in unreferenced:
+                    report['unreferenced_blobs'] += 1
+                    report['bytes_reclaimed'] += stored_size(storage, sha256)
+                db.session.commit()
+                continue
+
+            deleted = [
+                sha256 for sha256, refcount in unreferenced
+                if Blob.query.filter(Blob.sha256 == sha256, Blob.refcount == refcount)
+                .delete(synchronize_session=False)
+            ]
+            db.session.commit()
+            for sha256 in deleted:
+                size = stored_size(storage, sha256)
+                if collect_blob(sha256):
+                    report['unreferenced_blobs'] += 1
+                    report['bytes_reclaimed'] += size
+
+    def sweep_legacy_files(self):
+        """Delete files stored before blobs were introduced whose bytes are gone"""
+        state = self.state
+
+        for _ in self._batches():
+            files = File.query.filter(File.blob_sha256.is_(None), File.id > state.last_legacy_file) \
+                .order_by(File.id).limit(self.batch_size).all()
+            if not files:
+                state.last_legacy_file = 0
+                return
+            state.last_legacy_file = files[-1].id
+
+            dangling = [file for file in files if not self.storage.exists(file.filename)]
+            self._check_missing(len(files), len(dangling))
+            if dangling:
+                self.report['dangling_files'] += len(dangling)
+                if not self.dry_run:
+                    delete_files(dangling)
+            db.session.commit()
+
+    def _expire_rows(self, counter, model, *criteria):
+        """Delete the rows matching `criteria` in id batches"""
+        last_id = 0
+        for _ in self._batches():
+            ids = [row_id for row_id, in db.session.query(model.id).filter(model.id > last_id, *criteria)
+                   .order_by(model.id).limit(self.batch_size)]
+            if not ids:
+                break
+            last_id = ids[-1]
+            if self.dry_run:
+                self.report[counter] += len(ids)
+                continue
+            self.report[counter] += model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+    def apply_retention(self):
+        """Delete files, finished emails, access events and revocations past their retention period
+
+        Dry runs count expiring files but not the bytes they would free,
+        which depends on which blobs other files still share.
+        """
+        config = current_app.config
+        now = datetime.utcnow()
+
+        if config['FILE_RETENTION_DAYS']:
+            cutoff = now - timedelta(days=config['FILE_RETENTION_DAYS'])
+            last_id = 0
+            for _ in self._batches():
+                files = File.query.filter(File.created_at < cutoff, File.id > last_id) \
+                    .order_by(File.id).limit(self.batch_size).all()
+                if not files:
+                    break
+                last_id = files[-1].id
+                self.report['expired_files'] += len(files)
+                if not self.dry_run:
+                    self.report['bytes_reclaimed'] += delete_files(files)
+            db.session.commit()
+
+        if config['EMAIL_OUTBOX_RETENTION_DAYS']:
+            cutoff = now - timedelta(days=config['EMAIL_OUTBOX_RETENTION_DAYS'])
+            self._expire_rows('expired_emails', EmailOutbox,
+                              EmailOutbox.status.in_(('sent', 'failed')), EmailOutbox.created_at < cutoff)
+
+        if config['ACCESS_LOG_RETENTION_DAYS']:
+            cutoff = now - timedelta(days=config['ACCESS_LOG_RETENTION_DAYS'])
+            self._expire_rows('expired_access_events', AccessEvent, AccessEvent.created_at < cutoff)
+
+        self.report['revoked_tokens'] += prune_revoked_tokens(self.dry_run)
+        self.report['link_revocations'] += prune_link_revocations(self.dry_run)
+
+def run_sweep(state=None, batch_size=None, max_batches=None, dry_run=False, force=False):
+    """Reconcile storage with the database and apply retention policies
+
+    Returns a Counter of what was (or with `dry_run`, would be) removed
+    and `bytes_reclaimed`.  With `max_batches` every scan stops after that
+    many batches and `state` remembers where, so periodic passes do
+    bounded work and together cover the whole store.  Raises SweepAborted
+    when storage looks unavailable.
+    """
+    return StorageSweep(state, batch_size, max_batches, dry_run, force).run()
+
+def format_report(report):
+    """Summarize a sweep report on one line"""
+    removed = ', '.join(f'{name}={report[name]}' for name in SWEEP_COUNTERS if report[name])
+    return f"reclaimed {report['bytes_reclaimed']} bytes" + (f' ({removed})' if removed else '')
+
+def sweep_storage_periodically():
+    """One bounded pass of the background sweeper"""
+    state = current_app.extensions.setdefault('storage_sweep', SweepState())
+    try:
+        report = run_sweep(state, max_batches=current_app.config['STORAGE_SWEEP_MAX_BATCHES'])
+    except SweepAborted as e:
+        db.session.rollback()
+        # Start over next time rather than resume scans that saw a broken store
+        current_app.extensions['storage_sweep'] = SweepState()
+        current_app.logger.warning('Storage sweep skipped: %s', e)
+        return
+    if any(report[name] for name in SWEEP_COUNTERS + ('bytes_reclaimed',)):
+        current_app.logger.info('Storage sweep %s', format_report(report))
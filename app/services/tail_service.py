@@ -0,0 +1,67 @@
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select
+from app import db
+
+class TableTail:
+    """A worker's in-memory copy of an append-only table, kept current by id
+
+    At most every `refresh_interval` seconds a caller reads the rows added
+    since the last refresh, using the autoincrement id as a version
+    counter.  Ids can commit out of order on Postgres, so missing ids are
+    re-read until they show up or `hole_grace` seconds pass (they then
+    belonged to rolled back transactions).  Subclasses set `model` and
+    `columns`, apply each row in `add_row` and drop stale entries in `prune`.
+    """
+
+    model = None
+    columns = ()
+
+    def __init__(self, refresh_interval, hole_grace):
+        self.refresh_interval = refresh_interval
+        self.hole_grace = hole_grace
+        self._low_water = 0
+        self._highest = 0
+        self._holes = {}
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh_if_stale(self):
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+
+    def refresh(self):
+        """Read rows added since the last refresh; one thread at a time"""
+        if not self._lock.acquire(blocking=self._refreshed_at is None):
+            return
+        try:
+            query = select(self.model.id, *[getattr(self.model, name) for name in self.columns]) \
+                .where(self.model.id > self._low_water).order_by(self.model.id)
+            # Its own connection, so the request's session and transaction are left alone
+            with db.engine.connect() as connection:
+                rows = connection.execute(query).all()
+            self._apply(rows, time.monotonic())
+        finally:
+            self._lock.release()
+
+    def _apply(self, rows, now):
+        expected = self._low_water + 1
+        for row_id, *values in rows:
+            self.add_row(*values)
+            for missing in range(max(expected, self._highest + 1), row_id):
+                self._holes.setdefault(missing, now)
+            self._holes.pop(row_id, None)
+            self._highest = max(self._highest, row_id)
+            expected = row_id + 1
+
+        self._holes = {hole: seen for hole, seen in self._holes.items() if now - seen < self.hole_grace}
+        self._low_water = min(self._holes, default=self._highest + 1) - 1
+        self.prune(datetime.utcnow())
+        self._refreshed_at = now
+
+    def add_row(self, *values):
+        raise NotImplementedError
+
+    def prune(self, now):
+        raise NotImplementedError
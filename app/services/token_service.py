@@ -0,0 +1,154 @@
+import calendar
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from app import db, lazy_extension
+from app.models import LinkRevocation
+from app.services.tail_service import TableTail
+
+class DownloadTokenError(Exception):
+    """Raised when a download token cannot be honoured"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+class RevocationSet(TableTail):
+    """Revocation cut-offs for download tokens, keyed by ('file', id) or ('user', id)
+
+    A token is revoked when it was issued at or before the cut-off of its file
+    or user.  The cut-offs are rows of the link_revocation table, so every
+    worker sees them within `refresh_interval` seconds and they survive
+    restarts.  Entries older than the token lifetime can no longer match a
+    valid token, so they are pruned and the set stays small.
+    """
+
+    model = LinkRevocation
+    columns = ('kind', 'ident', 'created_at')
+
+    def __init__(self, ttl, refresh_interval, hole_grace):
+        super().__init__(refresh_interval, hole_grace)
+        self.ttl = ttl
+        self._cutoffs = {}
+
+    def add_row(self, kind, ident, created_at):
+        cutoff = created_at.replace(tzinfo=timezone.utc).timestamp()
+        if cutoff > self._cutoffs.get((kind, ident), -1):
+            self._cutoffs[(kind, ident)] = cutoff
+
+    def is_revoked(self, file_id, user_id, issued_at):
+        self.refresh_if_stale()
+        cutoffs = self._cutoffs
+        return (
+            issued_at <= cutoffs.get(('file', file_id), -1)
+            or issued_at <= cutoffs.get(('user', user_id), -1)
+        )
+
+    def prune(self, now):
+        oldest = now.replace(tzinfo=timezone.utc).timestamp() - self.ttl
+        self._cutoffs = {key: cutoff for key, cutoff in self._cutoffs.items() if cutoff >= oldest}
+
+    def __len__(self):
+        return len(self._cutoffs)
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='download-link')
+
+def _create_revocations(app):
+    return RevocationSet(
+        app.config['DOWNLOAD_LINK_TTL'],
+        app.config['DOWNLOAD_REVOCATION_REFRESH'],
+        app.config['DOWNLOAD_REVOCATION_HOLE_GRACE']
+    )
+
+def _revocations():
+    return lazy_extension('download_revocations', _create_revocations)
+
+def _token_payload(file, user_id):
+    return {
+        'f': file.id,
+        'k': file.filename,
+        'e': file.blob_sha256,
+        'n': file.original_filename,
+        'm': calendar.timegm(file.created_at.utctimetuple()),
+        'u': user_id
+    }
+
+def issue_download_token(file, user_id):
+    """Sign a token that locates a file and authorizes one user to fetch it"""
+    return _serializer().dumps(_token_payload(file, user_id))
+
+def issue_download_tokens(files, user_id):
+    """Sign download tokens for several files with one serializer"""
+    serializer = _serializer()
+    return [serializer.dumps(_token_payload(file, user_id)) for file in files]
+
+def verify_download_token(token, user_id):
+    """Check a download token for `user_id` without touching the database
+
+    Returns the token payload with `issued_at` added, or raises
+    DownloadTokenError.
+    """
+    try:
+        payload, issued_at = _serializer().loads(
+            token,
+            max_age=current_app.config['DOWNLOAD_LINK_TTL'],
+            return_timestamp=True
+        )
+    except SignatureExpired:
+        raise DownloadTokenError('Download link has expired', 410)
+    except BadSignature:
+        raise DownloadTokenError('Invalid download link', 404)
+
+    if payload['u'] != user_id:
+        raise DownloadTokenError('Download link was issued to another user', 403)
+
+    issued_at = issued_at.timestamp()
+    if _revocations().is_revoked(payload['f'], payload['u'], issued_at):
+        raise DownloadTokenError('Download link has been revoked', 410)
+
+    payload['issued_at'] = issued_at
+    payload['created_at'] = datetime.utcfromtimestamp(payload['m'])
+    return payload
+
+def is_link_revoked(file_id, user_id, issued_at):
+    """Check whether a link issued at `issued_at` has since been revoked"""
+    return _revocations().is_revoked(file_id, user_id, issued_at)
+
+def queue_link_revocations(kind, idents):
+    """Add link revocations to the current transaction
+
+    Returns them for apply_link_revocations, to call once the transaction
+    has committed.
+    """
+    created_at = datetime.utcnow()
+    db.session.add_all(LinkRevocation(kind=kind, ident=ident, created_at=created_at) for ident in idents)
+    return [(kind, ident, created_at) for ident in idents]
+
+def apply_link_revocations(revocations):
+    """Make committed revocations effective in this worker right away"""
+    for revocation in revocations:
+        _revocations().add_row(*revocation)
+
+def revoke_file_links(file_id):
+    """Invalidate every download link issued so far for a file"""
+    revocations = queue_link_revocations('file', [file_id])
+    db.session.commit()
+    apply_link_revocations(revocations)
+
+def revoke_user_links(user_id):
+    """Invalidate every download link issued so far to a user"""
+    revocations = queue_link_revocations('user', [user_id])
+    db.session.commit()
+    apply_link_revocations(revocations)
+
+def prune_link_revocations(dry_run=False):
+    """Delete revocations older than any link they could still apply to, returning how many"""
+    oldest = datetime.utcnow() - timedelta(seconds=current_app.config['DOWNLOAD_LINK_TTL'])
+    expired = LinkRevocation.query.filter(LinkRevocation.created_at < oldest)
+    if dry_run:
+        return expired.count()
+    deleted = expired.delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,74 @@
+import os
+import shutil
+import uuid
+from flask import current_app
+
+PART_SUFFIX = '.part'
+
+def session_dir(upload_id):
+    """Get the staging directory holding the parts of an upload session"""
+    return os.path.join(current_app.config['UPLOAD_STAGING_FOLDER'], upload_id)
+
+def part_path(upload_id, part_number):
+    """Get the staging path of one numbered part"""
+    return os.path.join(session_dir(upload_id), f'{part_number:05d}{PART_SUFFIX}')
+
+def write_part(upload_id, part_number, stream, max_size=None):
+    """Stream a part to disk and atomically publish it, returning its size
+
+    Parts are written to a private temporary name and renamed into place, so
+    parallel or retried PUTs of the same part never expose a torn file.
+    Raises ValueError(message, status) once the part grows past `max_size`.
+    """
+    directory = session_dir(upload_id)
+    os.makedirs(directory, exist_ok=True)
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+
+    temp_path = os.path.join(directory, f'.{uuid.uuid4()}.tmp')
+    try:
+        with open(temp_path, 'wb') as out:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                out.write(chunk)
+                if max_size is not None and out.tell() > max_size:
+                    raise ValueError('Upload exceeds the maximum allowed size', 413)
+            size = out.tell()
+        os.replace(temp_path, part_path(upload_id, part_number))
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    return size
+
+def list_parts(upload_id):
+    """List the (part_number, size) pairs received so far, in order"""
+    directory = session_dir(upload_id)
+    if not os.path.isdir(directory):
+        return []
+
+    parts = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(PART_SUFFIX):
+            parts.append((int(entry.name[:-len(PART_SUFFIX)]), entry.stat().st_size))
+    return sorted(parts)
+
+def missing_parts(parts, total_parts, limit=100):
+    """Count the part numbers in 1..total_parts that have not arrived yet
+
+    Returns the count and the first `limit` of them.
+    """
+    received = {number for number, _ in parts if number <= total_parts}
+    first = []
+    for number in range(1, total_parts + 1):
+        if len(first) == limit:
+            break
+        if number not in received:
+            first.append(number)
+    return total_parts - len(received), first
+
+def part_paths(upload_id, total_parts):
+    """Get the staging paths of parts 1..total_parts in order"""
+    return [part_path(upload_id, number) for number in range(1, total_parts + 1)]
+
+def discard_session_parts(upload_id):
+    """Remove every staged part of an upload session"""
+    shutil.rmtree(session_dir(upload_id), ignore_errors=True)
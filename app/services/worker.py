@@ -0,0 +1,44 @@
+import threading
+
+class BackgroundWorker:
+    """Run a task repeatedly on a daemon thread inside an application context
+
+    The task runs every `interval` seconds, or sooner when `wake` is called.
+    Each gunicorn worker process runs its own thread, so tasks must claim
+    their work in the database rather than assume they are alone.
+    """
+
+    def __init__(self, app, name, task, interval):
+        self.app = app
+        self.name = name
+        self.task = task
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    self.task()
+                except Exception:
+                    self.app.logger.exception('Background task %s failed', self.name)
@@ -0,0 +1,6 @@
+"""Benchmarks for the file sharing API
+
+Run ``python -m benchmarks --help`` for options.  Results are reported as
+p50/p99 latency, throughput and peak traced memory per scenario and can be
+saved as a baseline that later runs are compared against.
+"""
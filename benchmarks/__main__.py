@@ -0,0 +1,75 @@
+import os
+import random
+import shutil
+import sys
+import time
+import click
+from benchmarks.harness import benchmark, compare, format_report, load_report, make_report, save_report
+
+@click.command()
+@click.option('--users', type=int, default=10000, show_default=True, help='Users to seed.')
+@click.option('--files', type=int, default=100000, show_default=True, help='Files to seed.')
+@click.option('--blobs', type=int, default=1000, show_default=True, help='Distinct stored documents behind the files.')
+@click.option('--reuse', is_flag=True, help='Keep the previously seeded database instead of rebuilding it.')
+@click.option('--requests', type=int, default=500, show_default=True, help='Requests per scenario.')
+@click.option('--concurrency', type=int, default=8, show_default=True, help='Threads driving each HTTP scenario.')
+@click.option('--memory-requests', type=int, default=20, show_default=True,
+              help='Requests in the separate memory pass; 0 skips it.')
+@click.option('--scenario', 'selected', multiple=True, help='Only run scenarios whose name starts with this.')
+@click.option('--save', type=click.Path(dir_okay=False), help='Write the report as JSON, e.g. to use as a baseline.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Compare against a saved report.')
+@click.option('--tolerance', type=float, default=0.2, show_default=True,
+              help='Allowed slowdown against the baseline before failing.')
+@click.option('--seed', 'seed_value', type=int, default=42, show_default=True, help='Random seed.')
+def main(users, files, blobs, reuse, requests, concurrency, memory_requests, selected,
+         save, baseline, tolerance, seed_value):
+    """Seed a benchmark database, run every scenario and report the results."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    from app import create_app, db
+    from app.models import User, UserRole
+    from benchmarks.scenarios import http_scenarios, micro_scenarios
+    from benchmarks.seed import seed
+
+    app = create_app('benchmark')
+    rng = random.Random(seed_value)
+
+    with app.app_context():
+        if not reuse:
+            db.drop_all()
+            shutil.rmtree(app.config['UPLOAD_FOLDER'], ignore_errors=True)
+            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+            db.create_all()
+            started = time.perf_counter()
+            seed(users, files, blobs, seed_value=seed_value)
+            click.echo(f'Seeded {users} users and {files} files in {time.perf_counter() - started:.1f}s', err=True)
+        ops_ids = [row[0] for row in db.session.query(User.id).filter(User.role == UserRole.OPS.value)]
+        client_ids = [row[0] for row in db.session.query(User.id).filter(User.role == UserRole.CLIENT.value)]
+        micro = micro_scenarios(app, client_ids)
+
+        results = {}
+        for name, operation, setup in micro:
+            if not selected or name.startswith(selected):
+                results[name] = benchmark(operation, requests, 1, setup, memory_requests)
+
+    for name, operation, setup in http_scenarios(app, ops_ids, client_ids, rng):
+        if not selected or name.startswith(selected):
+            results[name] = benchmark(operation, requests, concurrency, setup, memory_requests)
+
+    report = make_report(results, {
+        'users': users, 'files': files, 'blobs': blobs, 'requests': requests,
+        'concurrency': concurrency, 'seed': seed_value
+    })
+    click.echo(format_report(report))
+
+    if save:
+        save_report(report, save)
+    if baseline:
+        regressions = compare(report, load_report(baseline), tolerance)
+        for regression in regressions:
+            click.echo(f'REGRESSION {regression}', err=True)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
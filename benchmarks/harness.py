@@ -0,0 +1,139 @@
+import json
+import math
+import platform
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies, errors, elapsed, peak_bytes=None):
+    """Reduce raw latencies (seconds) to the figures a report and baseline keep"""
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'peak_kib': None if peak_bytes is None else round(peak_bytes / 1024, 1)
+    }
+
+def run_scenario(operation, requests, concurrency=1, setup=None):
+    """Call `operation(worker_state)` `requests` times over `concurrency` threads
+
+    `setup()` builds one worker state per thread (a test client, a token...).
+    The operation returns True on success.  Latency is taken around each
+    call; throughput is requests over wall-clock time.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal errors
+        state = setup() if setup else None
+        local = []
+        local_errors = 0
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            started = time.perf_counter()
+            try:
+                ok = operation(state)
+            except Exception:
+                ok = False
+            local.append(time.perf_counter() - started)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        # Serial runs stay on the calling thread and keep its app context
+        worker()
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+    return latencies, errors, time.perf_counter() - started
+
+def measure_memory(operation, requests, setup=None):
+    """Peak traced allocation of running an operation a few times
+
+    tracemalloc slows Python down several-fold, so this runs as a separate
+    pass and never colours the latency figures.
+    """
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        for _ in range(requests):
+            operation(state)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark(operation, requests, concurrency=1, setup=None, memory_requests=0):
+    """Run one scenario and summarize it"""
+    latencies, errors, elapsed = run_scenario(operation, requests, concurrency, setup)
+    peak = measure_memory(operation, memory_requests, setup) if memory_requests else None
+    return summarize(latencies, errors, elapsed, peak)
+
+def make_report(results, parameters):
+    return {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+        'parameters': parameters,
+        'results': results
+    }
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(report, baseline, tolerance=0.2):
+    """List the scenarios that regressed beyond `tolerance` against a baseline
+
+    Latency regresses when it grows, throughput when it shrinks; scenarios
+    missing from either side are ignored.
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {previous[metric]} -> {current[metric]}')
+        if previous['throughput'] and current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput']} -> {current['throughput']}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+def format_report(report):
+    """Render a report as an aligned plain-text table"""
+    header = f"{'scenario':<24}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'peak KiB':>10}"
+    lines = [header, '-' * len(header)]
+    for name, r in report['results'].items():
+        peak = '-' if r['peak_kib'] is None else f"{r['peak_kib']:.1f}"
+        lines.append(
+            f"{name:<24}{r['requests']:>10}{r['errors']:>8}{r['p50_ms']:>10.2f}"
+            f"{r['p99_ms']:>10.2f}{r['throughput']:>10.1f}{peak:>10}"
+        )
+    return '\n'.join(lines)
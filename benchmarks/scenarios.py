@@ -0,0 +1,127 @@
+import atexit
+import io
+import itertools
+import os
+import tempfile
+from flask_jwt_extended import create_access_token
+from app import db
+from app.models import File, User
+from app.services.auth_service import hash_password, verify_password
+from app.services.document_service import extract_text
+from app.services.file_service import build_file_list_query, encode_cursor, stream_file_page
+from app.services.token_service import issue_download_token, verify_download_token
+from benchmarks.seed import BENCHMARK_PASSWORD, make_docx
+
+def _token_for(user_id):
+    user = db.session.get(User, user_id)
+    return create_access_token(identity={'user_id': user.id, 'email': user.email, 'role': user.role})
+
+def http_scenarios(app, ops_ids, client_ids, rng):
+    """Build (name, operation, setup) triples that drive the WSGI app
+
+    Each worker thread gets its own test client, which calls the WSGI app
+    in-process: the numbers cover routing, auth, SQL and serialization but
+    not socket or proxy overhead.
+    """
+    with app.app_context():
+        ops_token = _token_for(ops_ids[0])
+        client_token = _token_for(client_ids[0])
+        client_emails = [row[0] for row in db.session.query(User.email).filter(User.id.in_(client_ids[:1000]))]
+        file_ids = [row[0] for row in db.session.query(File.id).order_by(File.id).limit(10000)]
+        positions = db.session.query(File.created_at, File.id).order_by(File.id).limit(10000).all()
+        download_tokens = [
+            issue_download_token(file, client_ids[0])
+            for file in File.query.filter(File.id.in_(file_ids[:100]))
+        ]
+
+    ops_headers = {'Authorization': f'Bearer {ops_token}'}
+    client_headers = {'Authorization': f'Bearer {client_token}'}
+    signup_numbers = itertools.count()
+    upload_numbers = itertools.count()
+    setup = app.test_client
+
+    def signup(client):
+        email = f'signup{next(signup_numbers)}-{rng.random()}@bench.example'
+        response = client.post('/auth/signup', json={'email': email, 'password': BENCHMARK_PASSWORD})
+        return response.status_code == 201
+
+    def login(client):
+        response = client.post('/auth/login', json={
+            'email': rng.choice(client_emails), 'password': BENCHMARK_PASSWORD
+        })
+        return response.status_code == 200
+
+    def upload(client):
+        content = make_docx(f'Uploaded during benchmark {next(upload_numbers)} {rng.random()}')
+        response = client.post(
+            '/file/upload',
+            data={'file': (io.BytesIO(content), 'benchmark.docx')},
+            headers=ops_headers,
+            content_type='multipart/form-data'
+        )
+        return response.status_code == 201
+
+    def list_first_page(client):
+        return client.get('/file/list', headers=client_headers).status_code == 200
+
+    def list_random_page(client):
+        created_at, file_id = rng.choice(positions)
+        response = client.get(
+            '/file/list',
+            query_string={'cursor': encode_cursor(created_at, file_id)},
+            headers=client_headers
+        )
+        return response.status_code == 200
+
+    def list_not_modified(client):
+        if not hasattr(client, 'list_etag'):
+            client.list_etag = client.get('/file/list', headers=client_headers).headers['ETag']
+        response = client.get('/file/list', headers={**client_headers, 'If-None-Match': client.list_etag})
+        return response.status_code == 304
+
+    def download_link(client):
+        response = client.get(f'/file/download/{rng.choice(file_ids)}', headers=client_headers)
+        return response.status_code == 200
+
+    def download(client):
+        response = client.get(f'/file/download-file/{rng.choice(download_tokens)}', headers=client_headers)
+        ok = response.status_code == 200 and len(response.data) > 0
+        response.close()
+        return ok
+
+    return [
+        ('signup', signup, setup),
+        ('login', login, setup),
+        ('upload', upload, setup),
+        ('list_first_page', list_first_page, setup),
+        ('list_random_page', list_random_page, setup),
+        ('list_not_modified', list_not_modified, setup),
+        ('download_link', download_link, setup),
+        ('download', download, setup)
+    ]
+
+def micro_scenarios(app, client_ids):
+    """Build (name, operation, setup) triples that call services directly
+
+    Operations run inside the app context pushed by the caller.
+    """
+    password_hash = hash_password(BENCHMARK_PASSWORD)
+    file = File.query.first()
+    token = issue_download_token(file, client_ids[0])
+
+    document = tempfile.NamedTemporaryFile(suffix='.docx', delete=False)
+    document.write(make_docx(' '.join(['benchmark'] * 2000)))
+    document.close()
+    atexit.register(os.unlink, document.name)
+
+    def serialize_page(_):
+        return len(''.join(stream_file_page(build_file_list_query(), 50))) > 0
+
+    return [
+        ('micro.hash_password', lambda _: bool(hash_password(BENCHMARK_PASSWORD)), None),
+        ('micro.verify_password', lambda _: verify_password(password_hash, BENCHMARK_PASSWORD), None),
+        ('micro.issue_token', lambda _: bool(issue_download_token(file, client_ids[0])), None),
+        ('micro.verify_token', lambda _: bool(verify_download_token(token, client_ids[0])), None),
+        ('micro.serialize_page', serialize_page, None),
+        ('micro.extract_text', lambda _: bool(extract_text(document.name, 'docx', 1_000_000)), None)
+    ]
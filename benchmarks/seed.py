@@ -0,0 +1,92 @@
+import io
+import random
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app import db
+from app.models import Blob, CatalogVersion, File, User, UserRole
+from app.services.auth_service import hash_password
+from app.services.blob_service import store_stream
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+def make_docx(text):
+    """Build a small but valid docx holding one paragraph of text"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr(
+            'word/document.xml',
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body><w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:body></w:document>'
+        )
+    return buffer.getvalue()
+
+def _insert(table, rows, batch_size):
+    connection = db.session.connection()
+    for start in range(0, len(rows), batch_size):
+        connection.execute(table.insert(), rows[start:start + batch_size])
+
+def seed(users, files, blobs=None, ops_ratio=0.01, batch_size=10000, seed_value=42):
+    """Bulk insert users, stored blobs and files for benchmarking
+
+    Every user shares one password hash (bcrypt is the slow part of seeding,
+    not of what we measure), and files reference `blobs` distinct stored
+    documents round-robin, as deduplicated uploads would.  Rows go in
+    through executemany in batches, so a million files take seconds rather
+    than the hours single ORM inserts would.  Returns the seeded ops and
+    client user ids.
+    """
+    rng = random.Random(seed_value)
+    password_hash = hash_password(BENCHMARK_PASSWORD)
+    now = datetime.utcnow()
+
+    ops_count = max(1, int(users * ops_ratio))
+    user_rows = [{
+        'email': f'user{i}@bench.example',
+        'password_hash': password_hash,
+        'role': UserRole.OPS.value if i < ops_count else UserRole.CLIENT.value,
+        'is_verified': True,
+        'verification_token': None,
+        'created_at': now
+    } for i in range(users)]
+    _insert(User.__table__, user_rows, batch_size)
+
+    ops_ids = [row[0] for row in db.session.query(User.id).filter(User.role == UserRole.OPS.value)]
+    client_ids = [row[0] for row in db.session.query(User.id).filter(User.role == UserRole.CLIENT.value)]
+
+    blob_keys = []
+    blob_count = min(blobs or files, files) if files else 0
+    for i in range(blob_count):
+        sha256, size, _ = store_stream(io.BytesIO(make_docx(f'Benchmark document {i} {uuid.uuid4()}')))
+        blob_keys.append((sha256, size))
+
+    references = [0] * blob_count
+    file_rows = []
+    for i in range(files):
+        index = i % blob_count
+        references[index] += 1
+        sha256 = blob_keys[index][0]
+        file_rows.append({
+            'filename': sha256,
+            'original_filename': f'document_{i}.docx',
+            'file_type': 'docx',
+            'created_at': now - timedelta(seconds=files - i),
+            'user_id': rng.choice(ops_ids),
+            'download_token': str(uuid.uuid4()),
+            'blob_sha256': sha256,
+            'processing_status': 'done'
+        })
+
+    _insert(Blob.__table__, [
+        {'sha256': sha256, 'size': size, 'refcount': count, 'created_at': now}
+        for (sha256, size), count in zip(blob_keys, references)
+    ], batch_size)
+    _insert(File.__table__, file_rows, batch_size)
+
+    db.session.execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+    )
+    db.session.commit()
+    return ops_ids, client_ids
@@ -0,0 +1,49 @@
+"""access log
+
+Revision ID: 1f657e55e06c
+Revises: c15d4a10dc16
+Create Date: 2026-10-16 16:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f657e55e06c'
+down_revision = 'c15d4a10dc16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('access_counter',
+    sa.Column('subject', sa.String(length=4), nullable=False),
+    sa.Column('subject_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.Column('last_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('subject', 'subject_id', 'kind')
+    )
+    op.create_table('access_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('access_event', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_access_event_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_access_event_file_id'), ['file_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_access_event_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('access_event', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_access_event_user_id'))
+        batch_op.drop_index(batch_op.f('ix_access_event_file_id'))
+        batch_op.drop_index(batch_op.f('ix_access_event_created_at'))
+
+    op.drop_table('access_event')
+    op.drop_table('access_counter')
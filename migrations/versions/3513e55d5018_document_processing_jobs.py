@@ -0,0 +1,65 @@
+"""document processing jobs
+
+Revision ID: 3513e55d5018
+Revises: e41a6c0b9d37
+Create Date: 2026-10-16 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3513e55d5018'
+down_revision = 'e41a6c0b9d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('processing_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('claim_token', sa.String(length=36), nullable=True),
+    sa.Column('last_error', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['file.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_id')
+    )
+    with op.batch_alter_table('processing_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_processing_job_claim_token'), ['claim_token'], unique=False)
+        batch_op.create_index('ix_processing_job_status_next_attempt_at', ['status', 'next_attempt_at'], unique=False)
+
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('processing_status', sa.String(length=10), nullable=False, server_default='pending'))
+        batch_op.add_column(sa.Column('page_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('word_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('title', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('preview', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('processed_at', sa.DateTime(), nullable=True))
+
+    # Files uploaded before the pipeline existed are queued for processing
+    op.execute(
+        "INSERT INTO processing_job (file_id, status, attempts, next_attempt_at, created_at) "
+        "SELECT id, 'pending', 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP FROM file"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_column('processed_at')
+        batch_op.drop_column('preview')
+        batch_op.drop_column('title')
+        batch_op.drop_column('word_count')
+        batch_op.drop_column('page_count')
+        batch_op.drop_column('processing_status')
+
+    with op.batch_alter_table('processing_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_processing_job_status_next_attempt_at')
+        batch_op.drop_index(batch_op.f('ix_processing_job_claim_token'))
+
+    op.drop_table('processing_job')
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""link revocations
+
+Revision ID: 74aa3b979725
+Revises: 1f657e55e06c
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '74aa3b979725'
+down_revision = '1f657e55e06c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('link_revocation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=4), nullable=False),
+    sa.Column('ident', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('link_revocation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_link_revocation_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('link_revocation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_link_revocation_created_at'))
+
+    op.drop_table('link_revocation')
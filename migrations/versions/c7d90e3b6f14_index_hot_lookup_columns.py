@@ -0,0 +1,52 @@
+"""index hot lookup columns
+
+Revision ID: c7d90e3b6f14
+Revises: 8b4e7d21c5a2
+Create Date: 2026-10-16 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d90e3b6f14'
+down_revision = '8b4e7d21c5a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_verification_token'), ['verification_token'], unique=False)
+
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_file_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_file_file_type'), ['file_type'], unique=False)
+        batch_op.create_index('ix_file_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_file_blob_sha256'), ['blob_sha256'], unique=False)
+
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_session_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.create_index('ix_email_outbox_status_next_attempt_at', ['status', 'next_attempt_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_email_outbox_claim_token'), ['claim_token'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_email_outbox_claim_token'))
+        batch_op.drop_index('ix_email_outbox_status_next_attempt_at')
+
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_session_user_id'))
+
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_file_blob_sha256'))
+        batch_op.drop_index('ix_file_created_at_id')
+        batch_op.drop_index(batch_op.f('ix_file_file_type'))
+        batch_op.drop_index(batch_op.f('ix_file_user_id'))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_verification_token'))
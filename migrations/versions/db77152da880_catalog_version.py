@@ -0,0 +1,29 @@
+"""catalog version
+
+Revision ID: db77152da880
+Revises: 3513e55d5018
+Create Date: 2026-10-16 14:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'db77152da880'
+down_revision = '3513e55d5018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO catalog_version (id, version) VALUES (1, 0)')
+
+
+def downgrade():
+    op.drop_table('catalog_version')
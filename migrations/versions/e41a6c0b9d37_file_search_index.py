@@ -0,0 +1,40 @@
+"""file search index
+
+Revision ID: e41a6c0b9d37
+Revises: c7d90e3b6f14
+Create Date: 2026-10-16 11:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a6c0b9d37'
+down_revision = 'c7d90e3b6f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE file_search USING fts5("
+            "original_filename, content, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif dialect == 'postgresql':
+        op.create_table('file_search',
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('original_filename', sa.Text(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('document', postgresql.TSVECTOR(), nullable=False),
+        sa.ForeignKeyConstraint(['file_id'], ['file.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('file_id')
+        )
+        op.create_index('ix_file_search_document', 'file_search', ['document'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS file_search')
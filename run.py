@@ -1,7 +1,12 @@
 import os
-from app import create_app
+from dotenv import load_dotenv
+from app import create_app, start_background_workers
+
+# The flask CLI loads .env itself; plain entry points like this one do it explicitly
+load_dotenv()
 
 app = create_app(os.getenv('FLASK_ENV', 'development'))
 
 if __name__ == '__main__':
+    start_background_workers(app)
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,69 @@
+import pytest
+import os
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models import User, UserRole
+
+@pytest.fixture
+def client(tmp_path):
+    app = create_app('testing')
+    
+    # Create uploads folder for test; chunked upload parts are staged under tmp_path
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    app.config['UPLOAD_STAGING_FOLDER'] = str(tmp_path / '.sessions')
+    
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            
+            # Clean up files after test
+            for file in os.listdir(app.config['UPLOAD_FOLDER']):
+                file_path = os.path.join(app.config['UPLOAD_FOLDER'], file)
+                if os.path.isfile(file_path):
+                    os.unlink(file_path)
+            
+            db.session.remove()
+            db.drop_all()
+
+@pytest.fixture
+def ops_token(client):
+    """Create a token for operations user"""
+    with client.application.app_context():
+        user = User(
+            email='testops@example.com',
+            password='password123',
+            role=UserRole.OPS.value
+        )
+        user.is_verified = True
+        db.session.add(user)
+        db.session.commit()
+        
+        access_token = create_access_token(identity={
+            'user_id': user.id,
+            'email': user.email,
+            'role': user.role
+        })
+        
+        return access_token, user.id
+
+@pytest.fixture
+def client_token(client):
+    """Create a token for client user"""
+    with client.application.app_context():
+        user = User(
+            email='testclient@example.com',
+            password='password123',
+            role=UserRole.CLIENT.value
+        )
+        user.is_verified = True
+        db.session.add(user)
+        db.session.commit()
+        
+        access_token = create_access_token(identity={
+            'user_id': user.id,
+            'email': user.email,
+            'role': user.role
+        })
+        
+        return access_token, user.id
@@ -0,0 +1,82 @@
+"""Builders and probes shared by the test modules"""
+import io
+import json
+import zipfile
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import db
+from app.models import User
+
+def make_token(role, email):
+    """Create a user and return an access token for it"""
+    user = User(email=email, password='password123', role=role)
+    db.session.add(user)
+    db.session.commit()
+    return create_access_token(identity={'user_id': user.id, 'email': user.email, 'role': user.role})
+
+def docx(*paragraphs):
+    """Build a minimal docx whose body holds the given paragraphs"""
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr(
+            'word/document.xml',
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'
+        )
+    return buffer.getvalue()
+
+def pptx(*slides):
+    """Build a minimal pptx with one text run per slide"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for number, text in enumerate(slides, 1):
+            archive.writestr(
+                f'ppt/slides/slide{number}.xml',
+                '<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+                'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+                f'<a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:sld>'
+            )
+    return buffer.getvalue()
+
+def upload(client, token, name, content):
+    """Upload a file and return its id"""
+    response = client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(content), name)},
+        headers={'Authorization': f'Bearer {token}'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    return response.get_json()['file_id']
+
+def upload_and_get_download_token(client, ops_token, client_token, content):
+    """Upload a file as ops and fetch its download token as a client"""
+    upload_response = client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(content), 'test_file.docx')},
+        headers={'Authorization': f'Bearer {ops_token}'},
+        content_type='multipart/form-data'
+    )
+    file_id = json.loads(upload_response.data)['file_id']
+
+    link_response = client.get(
+        f'/file/download/{file_id}',
+        headers={'Authorization': f'Bearer {client_token}'}
+    )
+    return json.loads(link_response.data)['download_link'].rsplit('/', 1)[1]
+
+def count_statements(fn):
+    """Call fn and return its result with the SQL statements it ran"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        result = fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return result, statements
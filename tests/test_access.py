@@ -0,0 +1,83 @@
+import pytest
+from datetime import datetime
+from app import db
+from app.models import AccessCounter, AccessEvent
+from app.services.access_service import AccessLog, flush_access_events, get_access_log
+from app.services.ingest_service import OOXML_MAGIC
+from tests.helpers import count_statements, upload
+
+@pytest.fixture(autouse=True)
+def access_log(client):
+    """Turn the access log on, writing what is left before the tables are dropped"""
+    client.application.config['ACCESS_LOG_ENABLED'] = True
+    yield
+    flush_access_events()
+
+def test_downloads_are_logged_behind_the_request(client, ops_token, client_token):
+    """Test that downloads are buffered, then written and counted in bulk"""
+    ops_token, _ = ops_token
+    client_token, client_id = client_token
+    headers = {'Authorization': f'Bearer {client_token}'}
+    file_id = upload(client, ops_token, 'audited.docx', OOXML_MAGIC + b"audited")
+
+    response = client.get(f'/file/download/{file_id}', headers=headers)
+    link = response.get_json()['download_link']
+    token = link.rsplit('/', 1)[1]
+    revalidated = client.get(f'/file/download/{file_id}', headers={**headers, 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    for _ in range(2):
+        response, statements = count_statements(
+            lambda: client.get(f'/file/download-file/{token}', headers=headers)
+        )
+        assert response.status_code == 200
+        assert not [s for s in statements if 'access_' in s]
+    assert AccessEvent.query.count() == 0
+
+    # The stats endpoint reads what has been written so far and leaves the buffer to the worker
+    ops_headers = {'Authorization': f'Bearer {ops_token}'}
+    response, statements = count_statements(
+        lambda: client.get(f'/file/access-stats?file_id={file_id}', headers=ops_headers)
+    )
+    assert response.get_json()['counters'] == {}
+    assert not [s for s in statements if s.lstrip().startswith(('INSERT', 'UPDATE'))]
+    assert flush_access_events() == 4
+
+    stats = client.get(f'/file/access-stats?file_id={file_id}', headers=ops_headers).get_json()
+    assert stats['counters']['download']['count'] == 2
+    assert stats['counters']['link']['count'] == 2
+    assert [event['kind'] for event in stats['recent']] == ['download', 'download', 'link', 'link']
+    assert all(event['user_id'] == client_id for event in stats['recent'])
+
+    stats = client.get(f'/file/access-stats?user_id={client_id}', headers=ops_headers).get_json()
+    assert stats['counters']['download']['count'] == 2
+
+    client.get(f'/file/download-file/{token}', headers=headers)
+    flush_access_events()
+    top = client.get('/file/access-stats', headers=ops_headers).get_json()['top_files']
+    assert top[0]['file_id'] == file_id
+    assert top[0]['downloads'] == 3
+
+    assert client.get('/file/access-stats', headers=headers).status_code == 403
+
+def test_failed_flush_keeps_events(client, monkeypatch):
+    """Test that events of a failed write are retried and the buffer stays bounded"""
+    log = get_access_log()
+    now = datetime.utcnow()
+    log.record('download', 1, [10, 11], now)
+
+    def failing_commit():
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    with pytest.raises(RuntimeError):
+        flush_access_events()
+    monkeypatch.undo()
+
+    assert len(log) == 2
+    assert flush_access_events() == 2
+    assert AccessCounter.query.filter_by(subject='user', subject_id=1).one().count == 2
+
+    bounded = AccessLog(flush_size=10, max_buffer=3)
+    bounded.record('link', 1, [1, 2], now)
+    bounded.put_back([('link', 0, 1, now), ('link', 9, 1, now)])
+    assert [event[1] for event in bounded.take()] == [9, 1, 2]
+    assert bounded.dropped == 1
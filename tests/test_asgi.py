@@ -0,0 +1,200 @@
+import asyncio
+import json
+from app.asgi import AsgiBridge
+from tests.helpers import upload_and_get_download_token
+
+def _scope(method, path, headers=None, query_string=b''):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string,
+        'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 5000)
+    }
+
+async def _call(bridge, method, path, headers=None, chunks=(b'',), send=None):
+    """Drive the bridge like an ASGI server, returning status, headers and body"""
+    incoming = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    disconnect = asyncio.Event()
+    messages = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        await disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def collect(message):
+        messages.append(message)
+        if send is not None:
+            await send(message)
+
+    await bridge(_scope(method, path, headers), receive, collect)
+    disconnect.set()
+    start = messages[0]
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), body
+
+def test_asgi_streams_part_upload_and_ranged_download(client, ops_token, client_token):
+    """Test a chunked part upload and range downloads through the ASGI bridge"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    bridge = AsgiBridge(client.application, max_threads=2, spool_size=16)
+    ops_auth = {'Authorization': f'Bearer {ops_token}'}
+
+    async def scenario():
+        status, _, body = await _call(bridge, 'POST', '/file/uploads', {
+            **ops_auth, 'Content-Type': 'application/json'
+        }, [json.dumps({'filename': 'streamed.docx'}).encode()])
+        assert status == 201
+        upload_id = json.loads(body)['upload_id']
+
+        # Larger than the spool size, so the body is spooled to disk before the view runs
+        chunks = [b'PK\x03\x04' + b'part-one-' * 4, b'part-two-' * 4, b'end']
+        status, _, body = await _call(bridge, 'PUT', f'/file/uploads/{upload_id}/parts/1', ops_auth, chunks)
+        assert status == 200
+        assert json.loads(body)['size'] == len(b''.join(chunks))
+
+        # A spooled multipart upload is parsed into storage
+        document = b'PK\x03\x04' + b'form-body-' * 8
+        form = [
+            b'--x\r\nContent-Disposition: form-data; name="file"; filename="form.docx"\r\n\r\n',
+            document[:20], document[20:], b'\r\n--x--\r\n'
+        ]
+        status, _, body = await _call(bridge, 'POST', '/file/upload', {
+            **ops_auth, 'Content-Type': 'multipart/form-data; boundary=x'
+        }, form)
+        assert status == 201, body
+
+        status, _, body = await _call(bridge, 'POST', f'/file/uploads/{upload_id}/complete', {
+            **ops_auth, 'Content-Type': 'application/json'
+        }, [json.dumps({'total_parts': 1}).encode()])
+        assert status == 201
+        return b''.join(chunks)
+
+    content = asyncio.run(scenario())
+    token = upload_and_get_download_token(client, ops_token, client_token, content)
+    client_auth = {'Authorization': f'Bearer {client_token}'}
+    url = f'/file/download-file/{token}'
+
+    status, headers, body = asyncio.run(_call(bridge, 'GET', url, client_auth))
+    assert status == 200
+    assert body == content
+    assert int(headers['content-length']) == len(content)
+
+    # Multipart ranges are generated lazily, after the view has returned
+    status, headers, body = asyncio.run(_call(bridge, 'GET', url, {**client_auth, 'Range': 'bytes=4-7,-3'}))
+    assert status == 206
+    assert int(headers['content-length']) == len(body)
+    assert b'\r\n\r\npart\r\n' in body
+    assert b'\r\n\r\nend\r\n' in body
+
+def test_asgi_slow_download_does_not_hold_a_thread(client, ops_token, client_token):
+    """Test that a stalled download leaves the only worker thread free for other requests"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    client.application.config['UPLOAD_CHUNK_SIZE'] = 4
+    content = b'PK\x03\x04' + b'0123456789' * 10
+    token = upload_and_get_download_token(client, ops_token, client_token, content)
+    bridge = AsgiBridge(client.application, max_threads=1, spool_size=1024)
+    auth = {'Authorization': f'Bearer {client_token}'}
+
+    async def scenario():
+        resume = asyncio.Event()
+        first_chunk = asyncio.Event()
+
+        async def stalled_client(message):
+            if message.get('body'):
+                first_chunk.set()
+                await resume.wait()
+
+        download = asyncio.ensure_future(
+            _call(bridge, 'GET', f'/file/download-file/{token}', auth, send=stalled_client)
+        )
+        await first_chunk.wait()
+        status, _, body = await asyncio.wait_for(_call(bridge, 'GET', '/'), timeout=5)
+        assert status == 200
+        assert body.startswith(b'Welcome')
+        assert not download.done()
+
+        resume.set()
+        return await download
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 200
+    assert body == content
+
+def test_asgi_rejects_oversized_body(client, ops_token):
+    """Test that a body over MAX_CONTENT_LENGTH is refused while it is received"""
+    ops_token, _ = ops_token
+    client.application.config['MAX_CONTENT_LENGTH'] = 10
+    bridge = AsgiBridge(client.application, max_threads=1, spool_size=1024)
+
+    status, _, body = asyncio.run(_call(
+        bridge, 'PUT', '/file/uploads/missing/parts/1',
+        {'Authorization': f'Bearer {ops_token}'}, [b'x' * 8, b'x' * 8]
+    ))
+    assert status == 413
+    assert json.loads(body)['message'] == 'Request body too large'
+
+    # Past the spool size the limit is still enforced while the body is received
+    bridge = AsgiBridge(client.application, max_threads=1, spool_size=4)
+    status, _, _ = asyncio.run(_call(
+        bridge, 'POST', '/file/upload',
+        {'Authorization': f'Bearer {ops_token}', 'Content-Type': 'multipart/form-data; boundary=x'},
+        [b'--x\r\n', b'x' * 8, b'x' * 8]
+    ))
+    assert status == 413
+
+def test_asgi_slow_upload_does_not_hold_a_thread(client, ops_token):
+    """Test that a stalled upload past the spool size leaves the only worker thread free"""
+    ops_token, _ = ops_token
+    bridge = AsgiBridge(client.application, max_threads=1, spool_size=8)
+    auth = {'Authorization': f'Bearer {ops_token}'}
+
+    async def scenario():
+        status, _, body = await _call(bridge, 'POST', '/file/uploads', {
+            **auth, 'Content-Type': 'application/json'
+        }, [json.dumps({'filename': 'slow.docx'}).encode()])
+        upload_id = json.loads(body)['upload_id']
+
+        resume = asyncio.Event()
+        stalled = asyncio.Event()
+        incoming = [b'PK\x03\x04' + b'a' * 12, b'b' * 16]
+
+        async def slow_receive():
+            if len(incoming) == 1:
+                stalled.set()
+                await resume.wait()
+            if incoming:
+                return {'type': 'http.request', 'body': incoming.pop(0), 'more_body': bool(incoming)}
+            await asyncio.Event().wait()
+
+        messages = []
+
+        async def collect(message):
+            messages.append(message)
+
+        upload = asyncio.ensure_future(bridge(
+            _scope('PUT', f'/file/uploads/{upload_id}/parts/1', auth), slow_receive, collect
+        ))
+        await stalled.wait()
+        status, _, body = await asyncio.wait_for(_call(bridge, 'GET', '/'), timeout=5)
+        assert status == 200
+        assert body.startswith(b'Welcome')
+        assert not upload.done()
+
+        resume.set()
+        await asyncio.wait_for(upload, timeout=5)
+        return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+    status, body = asyncio.run(scenario())
+    assert status == 200
+    assert json.loads(body)['size'] == 32
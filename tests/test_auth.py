@@ -1,8 +1,15 @@
 import pytest
 import json
 import os
+import threading
+import time
+from flask_jwt_extended import decode_token
 from app import create_app, db
-from app.models import User, UserRole
+from app.models import RevokedToken, User, UserRole
+from app.services.auth_service import (
+    PasswordHasher, PasswordHasherBusy, calibrate_log_rounds, get_hash_rounds, get_password_hasher
+)
+from app.services.blocklist_service import revoke_token
 
 @pytest.fixture
 def client():
@@ -151,4 +158,260 @@ def test_login_unverified_client(client):
     
     data = json.loads(response.data)
     assert response.status_code == 403
-    assert 'verify your email' in data['message'].lower()
\ No newline at end of file
+    assert 'verify your email' in data['message'].lower()
+def test_login_rehashes_outdated_password(client):
+    """Test that logging in upgrades a hash made with an older bcrypt cost"""
+    with client.application.app_context():
+        user = User(
+            email='rehash@example.com',
+            password='password123',
+            role=UserRole.OPS.value
+        )
+        db.session.add(user)
+        db.session.commit()
+        assert get_hash_rounds(user.password_hash) == 4
+
+    client.application.config['BCRYPT_LOG_ROUNDS'] = 5
+    response = client.post(
+        '/auth/login',
+        data=json.dumps({
+            'email': 'rehash@example.com',
+            'password': 'password123'
+        }),
+        content_type='application/json'
+    )
+
+    assert response.status_code == 200
+    with client.application.app_context():
+        user = User.query.filter_by(email='rehash@example.com').first()
+        assert get_hash_rounds(user.password_hash) == 5
+        assert user.check_password('password123')
+
+    # A lower configured cost never downgrades a stronger hash
+    client.application.config['BCRYPT_LOG_ROUNDS'] = 4
+    with client.application.app_context():
+        assert not User.query.filter_by(email='rehash@example.com').first().password_needs_rehash()
+
+def test_password_hasher_sheds_excess_work():
+    """Test that hashing beyond the worker and queue limits is rejected"""
+    hasher = PasswordHasher(max_workers=1, max_pending=0)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait(5)
+        return 'hash'
+
+    worker = threading.Thread(target=hasher.run, args=(slow_hash,))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(lambda: 'rejected')
+    release.set()
+    worker.join()
+    assert hasher.run(lambda: 'accepted') == 'accepted'
+
+def test_password_hash_timeout_is_shed(client, monkeypatch):
+    """Test that a hash waiting past BCRYPT_TIMEOUT gets the same 503 as a full queue"""
+    from app import models
+    with client.application.app_context():
+        db.session.add(User(email='slow@example.com', password='password123', role=UserRole.OPS.value))
+        db.session.commit()
+    release = threading.Event()
+    monkeypatch.setattr(models, 'verify_password', lambda *args: get_password_hasher().run(
+        release.wait, 5, timeout=0.01
+    ))
+    response = client.post(
+        '/auth/login',
+        data=json.dumps({'email': 'slow@example.com', 'password': 'password123'}),
+        content_type='application/json'
+    )
+    release.set()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_calibrate_log_rounds_respects_bounds(client):
+    """Test that calibration stays within the configured cost range"""
+    with client.application.app_context():
+        assert calibrate_log_rounds(0.001, 10, 15, probe_rounds=4) == 10
+        assert calibrate_log_rounds(10 ** 9, 10, 15, probe_rounds=4) == 15
+
+def test_login_rate_limited_before_hashing(client, monkeypatch):
+    """Test that login floods get 429 with Retry-After before any bcrypt work"""
+    from app import models
+    app = client.application
+    app.config['RATE_LIMITS'] = {'login_per_ip': (100, 60), 'login_per_email': (2, 60)}
+    db.session.add(User(email='victim@example.com', password='password123', role=UserRole.CLIENT.value))
+    db.session.commit()
+
+    hashes = []
+    monkeypatch.setattr(models, 'verify_password', lambda *args: hashes.append(args) or False)
+    payload = json.dumps({'email': 'victim@example.com', 'password': 'guess'})
+
+    statuses = [client.post('/auth/login', data=payload, content_type='application/json').status_code
+                for _ in range(3)]
+    assert statuses == [401, 401, 429]
+    assert len(hashes) == 2
+
+    response = client.post('/auth/login', data=json.dumps({'email': ' Victim@Example.com ', 'password': 'x'}),
+                           content_type='application/json')
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 30
+
+    response = client.post('/auth/login', data=json.dumps({'email': 'other@example.com', 'password': 'x'}),
+                           content_type='application/json')
+    assert response.status_code == 401
+
+def test_signup_rate_limited_per_ip(client):
+    """Test that signups from one address are limited"""
+    client.application.config['RATE_LIMITS'] = {'signup_per_ip': (1, 600)}
+    first = client.post('/auth/signup', data=json.dumps({'email': 'a@example.com', 'password': 'password123'}),
+                        content_type='application/json')
+    second = client.post('/auth/signup', data=json.dumps({'email': 'b@example.com', 'password': 'password123'}),
+                         content_type='application/json',
+                         environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    other_ip = client.post('/auth/signup', data=json.dumps({'email': 'c@example.com', 'password': 'password123'}),
+                           content_type='application/json',
+                           environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert (first.status_code, second.status_code, other_ip.status_code) == (201, 429, 201)
+    assert int(second.headers['Retry-After']) == 600
+
+def test_rejected_request_leaves_later_buckets_alone(client):
+    """Test that a request rejected per IP is not also charged to its email's bucket"""
+    client.application.config['RATE_LIMITS'] = {'login_per_ip': (1, 60), 'login_per_email': (2, 60)}
+    payload = json.dumps({'email': 'victim@example.com', 'password': 'guess'})
+
+    statuses = [
+        client.post('/auth/login', data=payload, content_type='application/json',
+                    environ_base={'REMOTE_ADDR': address}).status_code
+        for address in ('10.0.0.1', '10.0.0.1', '10.0.0.2')
+    ]
+    assert statuses == [401, 429, 401]
+
+def test_rate_limits_trust_configured_proxies(monkeypatch):
+    """Test that the client address comes from X-Forwarded-For only behind PROXY_FIX_X_FOR proxies"""
+    from app.config import TestingConfig
+    monkeypatch.setattr(TestingConfig, 'PROXY_FIX_X_FOR', 1)
+    app = create_app('testing')
+    app.config['RATE_LIMITS'] = {'signup_per_ip': (1, 600)}
+
+    with app.test_client() as client, app.app_context():
+        db.create_all()
+        try:
+            statuses = [
+                client.post('/auth/signup', data=json.dumps({'email': email, 'password': 'password123'}),
+                            content_type='application/json', headers={'X-Forwarded-For': forwarded}).status_code
+                for email, forwarded in (('a@example.com', '203.0.113.1'), ('b@example.com', '203.0.113.1'),
+                                         ('c@example.com', '203.0.113.2'))
+            ]
+        finally:
+            db.session.remove()
+            db.drop_all()
+    assert statuses == [201, 429, 201]
+
+def test_sqlite_bucket_store_is_shared(tmp_path):
+    """Test that two stores on one SQLite file (like two workers) share buckets"""
+    from app.services.rate_limit_service import SQLiteBucketStore, take_token
+
+    assert take_token(None, 2, 1.0, 100.0) == ((1, 100.0), 0.0)
+    assert take_token((0.5, 100.0), 2, 1.0, 100.0) == ((0.5, 100.0), 0.5)
+
+    path = str(tmp_path / 'buckets.sqlite')
+    first, second = SQLiteBucketStore(path, 3600), SQLiteBucketStore(path, 3600)
+    now = 1000.0
+    assert first.take('login_per_email:a', 2, 0.1, now) == 0
+    assert second.take('login_per_email:a', 2, 0.1, now) == 0
+    assert first.take('login_per_email:a', 2, 0.1, now) == pytest.approx(10)
+    assert second.take('login_per_email:a', 2, 0.1, now + 10) == 0
+
+def _login(client, email, role=UserRole.CLIENT.value):
+    db.session.add(User(email=email, password='password123', role=role))
+    db.session.commit()
+    response = client.post('/auth/login', data=json.dumps({'email': email, 'password': 'password123'}),
+                           content_type='application/json')
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+def test_logout_revokes_the_token(client):
+    """Test that a logged out token is rejected while a fresh login still works"""
+    headers = _login(client, 'reader@example.com')
+    assert client.get('/file/list', headers=headers).status_code == 200
+
+    assert client.post('/auth/logout', headers=headers).status_code == 200
+    response = client.get('/file/list', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()['message'] == 'Token has been revoked'
+
+    response = client.post('/auth/login', data=json.dumps({'email': 'reader@example.com', 'password': 'password123'}),
+                           content_type='application/json')
+    fresh = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    assert client.get('/file/list', headers=fresh).status_code == 200
+
+    # A logout sent twice, e.g. by two tabs at once, revokes the token once
+    assert client.post('/auth/logout', headers=fresh).status_code == 200
+    revoke_token(decode_token(fresh['Authorization'].split()[1])['jti'], time.time() + 60)
+    assert RevokedToken.query.count() == 2
+
+def test_revoking_every_token_covers_its_own_second(client):
+    """Test that tokens issued in the second of a user's revocation are revoked, and a later login works"""
+    ops = _login(client, 'ops@example.com', UserRole.OPS.value)
+    _login(client, 'reader@example.com')
+    reader_id = User.query.filter_by(email='reader@example.com').one().id
+    credentials = json.dumps({'email': 'reader@example.com', 'password': 'password123'})
+
+    time.sleep(1 - time.time() % 1)
+    response = client.post('/auth/login', data=credentials, content_type='application/json')
+    reader = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    assert client.post('/auth/revoke', json={'user_id': reader_id}, headers=ops).status_code == 200
+    response = client.post('/auth/login', data=credentials, content_type='application/json')
+    same_second = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    assert client.get('/file/list', headers=reader).status_code == 401
+    assert client.get('/file/list', headers=same_second).status_code == 401
+
+    # Fail closed: a client that logged in during that second just logs in again
+    time.sleep(1 - time.time() % 1)
+    response = client.post('/auth/login', data=credentials, content_type='application/json')
+    fresh = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    assert client.get('/file/list', headers=fresh).status_code == 200
+
+def test_revoking_a_user_reaches_other_workers(client):
+    """Test revoking every token of a user, seen by another app after its refresh"""
+    reader = _login(client, 'reader@example.com')
+    ops = _login(client, 'ops@example.com', UserRole.OPS.value)
+    reader_id = User.query.filter_by(email='reader@example.com').one().id
+
+    other_worker = create_app('testing')
+    other_client = other_worker.test_client()
+    assert other_client.get('/file/list', headers=reader).status_code == 200
+
+    assert client.post('/auth/revoke', json={'user_id': reader_id}, headers=reader).status_code == 403
+    assert client.post('/auth/revoke', json={'user_id': reader_id}, headers=ops).status_code == 200
+    assert client.get('/file/list', headers=reader).status_code == 401
+
+    # Still within the other worker's refresh interval
+    assert other_client.get('/file/list', headers=reader).status_code == 200
+    other_worker.extensions['token_blocklist'].refresh_interval = 0
+    assert other_client.get('/file/list', headers=reader).status_code == 401
+
+def test_blocklist_rereads_ids_that_commit_late():
+    """Test that ids skipped by the version counter are read once they commit"""
+    from datetime import datetime, timedelta
+    from app.services.blocklist_service import TokenBlocklist
+
+    blocklist = TokenBlocklist(refresh_interval=1, hole_grace=60)
+    now = datetime.utcnow()
+    later = now + timedelta(hours=1)
+
+    blocklist._apply([(1, 'a', None, now, later), (3, 'c', None, now, later)], now=0)
+    assert blocklist._low_water == 1
+    blocklist._apply([(2, 'b', None, now, later), (3, 'c', None, now, later)], now=1)
+    assert blocklist._low_water == 3
+    assert {'a', 'b', 'c'} <= set(blocklist.jtis)
+
+    blocklist._apply([(5, 'e', None, now, later)], now=2)
+    assert blocklist._low_water == 3
+    blocklist._apply([(5, 'e', None, now, later)], now=100)
+    assert blocklist._low_water == 5
+
+    blocklist._apply([(6, 'expired', None, now, now - timedelta(seconds=1))], now=101)
+    assert 'expired' not in blocklist.jtis
@@ -0,0 +1,47 @@
+import pytest
+from app import create_app, db
+from app.models import Blob, File, User
+from app.services.storage_service import get_storage
+from benchmarks.harness import benchmark, compare, percentile, summarize
+from benchmarks.seed import seed
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_seed_bulk_inserts_users_files_and_blobs(app):
+    """Test that the seeder writes consistent rows and stored blobs"""
+    ops_ids, client_ids = seed(users=200, files=1000, blobs=10)
+
+    assert User.query.count() == 200
+    assert len(ops_ids) == 2 and len(client_ids) == 198
+    assert File.query.count() == 1000
+    assert sum(blob.refcount for blob in Blob.query) == 1000
+    assert all(get_storage().exists(blob.sha256) for blob in Blob.query)
+
+def test_percentiles_and_regressions():
+    """Test the report figures and the baseline comparison"""
+    ordered = [i / 1000 for i in range(1, 101)]
+    assert percentile(ordered, 0.5) == 0.05
+    assert percentile(ordered, 0.99) == 0.099
+
+    baseline = {'results': {'list': summarize(ordered, 0, 1.0)}}
+    slower = {'results': {'list': summarize([t * 2 for t in ordered], 1, 2.0)}}
+    regressions = compare(slower, baseline, tolerance=0.2)
+    assert any('p50_ms' in r for r in regressions)
+    assert any('throughput' in r for r in regressions)
+    assert any('errors' in r for r in regressions)
+    assert compare(baseline, baseline) == []
+
+def test_benchmark_counts_errors_across_threads():
+    """Test that concurrent runs account for every request"""
+    calls = iter(range(1000))
+    result = benchmark(lambda _: next(calls) % 2 == 0, requests=100, concurrency=4, memory_requests=3)
+    assert result['requests'] == 100
+    assert result['errors'] == 50
+    assert result['peak_kib'] is not None
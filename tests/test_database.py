@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy import inspect, text
+from app import create_app, db
+from app.config import TestingConfig
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path}/migrated.sqlite')
+    return create_app('testing')
+
+def test_sqlite_pragmas_applied(app):
+    """Test that every SQLite connection is tuned for concurrent access"""
+    with app.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(text('PRAGMA synchronous')).scalar() == 1
+        assert db.session.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+
+def test_migrations_build_indexed_schema(app):
+    """Test that the migration history creates the schema and its lookup indexes"""
+    result = app.test_cli_runner().invoke(args=['db', 'upgrade'])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert set(db.metadata.tables) <= set(inspector.get_table_names())
+        file_indexes = {index['name'] for index in inspector.get_indexes('file')}
+        assert {'ix_file_user_id', 'ix_file_file_type', 'ix_file_created_at_id'} <= file_indexes
+        user_indexes = {index['name'] for index in inspector.get_indexes('user')}
+        assert 'ix_user_verification_token' in user_indexes
+        assert 'file_search' in inspector.get_table_names()
@@ -0,0 +1,115 @@
+import pytest
+import io
+import zipfile
+from datetime import datetime, timedelta
+from app import db
+from app.models import File, ProcessingJob, UserRole
+from app.services.document_service import analyze_document, extract_text, process_pending_documents
+from tests.helpers import docx, make_token, pptx, upload
+
+def _with_properties(document, title, pages=None):
+    """Add docProps/core.xml (and app.xml when pages is given) to a document"""
+    buffer = io.BytesIO(document)
+    with zipfile.ZipFile(buffer, 'a') as archive:
+        archive.writestr(
+            'docProps/core.xml',
+            '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            f'xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>{title}</dc:title></cp:coreProperties>'
+        )
+        if pages is not None:
+            archive.writestr(
+                'docProps/app.xml',
+                '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+                f'<Pages>{pages}</Pages></Properties>'
+            )
+    return buffer.getvalue()
+
+def _preview(client, token, file_id, **headers):
+    return client.get(f'/file/{file_id}/preview', headers={'Authorization': f'Bearer {token}', **headers})
+
+def test_extract_text_from_ooxml(tmp_path):
+    """Test that text runs are pulled out of docx and pptx parts in order"""
+    docx_path = tmp_path / 'report.docx'
+    docx_path.write_bytes(docx('Quarterly revenue', 'grew strongly'))
+    assert extract_text(str(docx_path), 'docx', 1000).split() == ['Quarterly', 'revenue', 'grew', 'strongly']
+
+    pptx_path = tmp_path / 'deck.pptx'
+    pptx_path.write_bytes(pptx(*[f'slide {n}' for n in range(1, 12)]))
+    text = extract_text(str(pptx_path), 'pptx', 1000)
+    assert text.index('slide 2\n') < text.index('slide 10\n')
+    assert len(extract_text(str(pptx_path), 'pptx', 5)) == 5
+
+def test_analyze_document_metadata(tmp_path):
+    """Test page counts, titles and previews for decks and documents"""
+    deck = tmp_path / 'deck.pptx'
+    deck.write_bytes(_with_properties(pptx('Welcome', 'Agenda', 'Results'), 'Annual review'))
+    result = analyze_document(str(deck), 'pptx', 1000, 100)
+    assert result['page_count'] == 3
+    assert result['title'] == 'Annual review'
+    assert result['preview'] == 'Welcome'
+    assert result['word_count'] == 3
+
+    report = tmp_path / 'report.docx'
+    report.write_bytes(_with_properties(docx('A long introduction'), 'Report', pages=7))
+    result = analyze_document(str(report), 'docx', 1000, 6)
+    assert result['page_count'] == 7
+    assert result['preview'] == 'A long'
+
+def test_upload_is_processed_in_background(client):
+    """Test that uploads only queue work, which the pool then completes"""
+    ops = make_token(UserRole.OPS.value, 'ops@example.com')
+    reader = make_token(UserRole.CLIENT.value, 'client@example.com')
+
+    file_id = upload(client, ops, 'deck.pptx', _with_properties(pptx('Intro', 'Numbers'), 'Kickoff'))
+    broken_id = upload(client, ops, 'broken.docx', b'PK\x03\x04 not a zip file')
+
+    response = _preview(client, reader, file_id)
+    assert response.status_code == 202
+    assert response.get_json()['processing_status'] == 'pending'
+
+    assert process_pending_documents() == 1
+    assert process_pending_documents() == 0
+
+    response = _preview(client, reader, file_id)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['processing_status'] == 'done'
+    assert (data['page_count'], data['title'], data['preview']) == (2, 'Kickoff', 'Intro')
+    assert 'max-age' in response.headers['Cache-Control']
+
+    cached = _preview(client, reader, file_id, **{'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+    # Malformed documents fail straight away instead of being retried
+    assert db.session.get(File, broken_id).processing_status == 'failed'
+    assert ProcessingJob.query.filter_by(file_id=broken_id).one().attempts == 1
+
+def test_processing_retries_with_backoff(client, monkeypatch):
+    """Test that transient failures are retried later and failures stay bounded"""
+    ops = make_token(UserRole.OPS.value, 'ops@example.com')
+    file_id = upload(client, ops, 'deck.pptx', pptx('Intro'))
+
+    storage = client.application.extensions['storage']
+    original = storage.local_file
+    monkeypatch.setattr(storage, 'local_file', lambda key: (_ for _ in ()).throw(OSError('storage offline')))
+
+    assert process_pending_documents() == 0
+    job = ProcessingJob.query.filter_by(file_id=file_id).one()
+    assert job.attempts == 1 and job.status == 'pending'
+    assert job.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+
+    monkeypatch.setattr(storage, 'local_file', original)
+    job.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    assert process_pending_documents() == 1
+    assert db.session.get(File, file_id).processing_status == 'done'
+
+def test_deleting_file_drops_its_job(client):
+    """Test that queued jobs go away with their file"""
+    ops = make_token(UserRole.OPS.value, 'ops@example.com')
+    file_id = upload(client, ops, 'deck.pptx', pptx('Intro'))
+
+    response = client.delete(f'/file/{file_id}', headers={'Authorization': f'Bearer {ops}'})
+    assert response.status_code == 200
+    assert ProcessingJob.query.count() == 0
+    assert process_pending_documents() == 0
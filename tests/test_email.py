@@ -0,0 +1,100 @@
+import pytest
+import json
+import socket
+from datetime import datetime, timedelta
+from app import create_app, db, mail
+from app.models import EmailOutbox
+from app.services.email_service import deliver_pending_emails
+
+@pytest.fixture
+def client():
+    app = create_app('testing')
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.session.remove()
+            db.drop_all()
+
+@pytest.fixture
+def smtp_server(client):
+    """Run a local aiosmtpd server and point the mail extension at it"""
+    controller_module = pytest.importorskip('aiosmtpd.controller')
+    handlers = pytest.importorskip('aiosmtpd.handlers')
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    handler = handlers.Sink()
+    received = []
+    async def handle_DATA(server, session, envelope):
+        received.append(envelope)
+        return '250 OK'
+    handler.handle_DATA = handle_DATA
+
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+
+    state = client.application.extensions['mail']
+    state.server, state.port = '127.0.0.1', port
+    state.use_tls = state.use_ssl = False
+    state.username = state.password = None
+    state.suppress = False
+
+    yield received, port
+    controller.stop()
+
+def _signup(client, email):
+    return client.post(
+        '/auth/signup',
+        data=json.dumps({'email': email, 'password': 'password123'}),
+        content_type='application/json'
+    )
+
+def test_signup_queues_verification_email(client):
+    """Test that signup only queues the email instead of sending it inline"""
+    with mail.record_messages() as outbox:
+        response = _signup(client, 'queued@example.com')
+        assert response.status_code == 201
+        assert outbox == []
+
+    email = EmailOutbox.query.one()
+    assert email.recipient == 'queued@example.com'
+    assert email.status == 'pending'
+    assert '/auth/verify/' in email.html
+
+def test_outbox_delivers_batch_over_smtp(client, smtp_server):
+    """Test that the worker sends a whole batch through the local SMTP server"""
+    received, _ = smtp_server
+    for i in range(3):
+        _signup(client, f'user{i}@example.com')
+
+    assert deliver_pending_emails() == 3
+
+    assert sorted(e.rcpt_tos[0] for e in received) == [f'user{i}@example.com' for i in range(3)]
+    assert {e.status for e in EmailOutbox.query.all()} == {'sent'}
+    assert deliver_pending_emails() == 0
+
+def test_outbox_retries_with_backoff(client, smtp_server):
+    """Test that a relay outage is recorded and retried later"""
+    _, port = smtp_server
+    _signup(client, 'retry@example.com')
+    client.application.extensions['mail'].port = 1  # nothing listens here
+
+    assert deliver_pending_emails() == 0
+    email = EmailOutbox.query.one()
+    assert email.status == 'pending'
+    assert email.attempts == 1
+    assert email.last_error
+    assert email.next_attempt_at > datetime.utcnow()
+
+    # Not due yet, so nothing is claimed even once the relay is back
+    client.application.extensions['mail'].port = port
+    assert deliver_pending_emails() == 0
+
+    email.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert deliver_pending_emails() == 1
+    assert EmailOutbox.query.one().status == 'sent'
@@ -2,72 +2,22 @@ import pytest
 import json
 import os
 import io
+import zipfile
+import gzip
+import hashlib
+import time
+from datetime import datetime
 from flask_jwt_extended import create_access_token
-from app import create_app, db
-from app.models import User, UserRole, File
-
-@pytest.fixture
-def client():
-    app = create_app('testing')
-    
-    # Create uploads folder for test
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    
-    with app.test_client() as client:
-        with app.app_context():
-            db.create_all()
-            yield client
-            
-            # Clean up files after test
-            for file in os.listdir(app.config['UPLOAD_FOLDER']):
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], file)
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            
-            db.session.remove()
-            db.drop_all()
-
-@pytest.fixture
-def ops_token(client):
-    """Create a token for operations user"""
-    with client.application.app_context():
-        user = User(
-            email='testops@example.com',
-            password='password123',
-            role=UserRole.OPS.value
-        )
-        user.is_verified = True
-        db.session.add(user)
-        db.session.commit()
-        
-        access_token = create_access_token(identity={
-            'user_id': user.id,
-            'email': user.email,
-            'role': user.role
-        })
-        
-        return access_token, user.id
-
-@pytest.fixture
-def client_token(client):
-    """Create a token for client user"""
-    with client.application.app_context():
-        user = User(
-            email='testclient@example.com',
-            password='password123',
-            role=UserRole.CLIENT.value
-        )
-        user.is_verified = True
-        db.session.add(user)
-        db.session.commit()
-        
-        access_token = create_access_token(identity={
-            'user_id': user.id,
-            'email': user.email,
-            'role': user.role
-        })
-        
-        return access_token, user.id
+from sqlalchemy import event
+from app import db
+from app.models import User, UserRole, File, Blob, CatalogVersion, LinkRevocation
+from app.services.storage_service import get_storage
+from app.services.blob_service import BlobMissing, acquire_blob, collect_blob, store_stream
+from app.services.token_service import RevocationSet, is_link_revoked
+from app.services.file_service import delete_files
+from app.services.download_service import unique_archive_names
+from app.services.ingest_service import OOXML_MAGIC
+from tests.helpers import count_statements, upload_and_get_download_token
 
 def test_file_upload_ops_user(client, ops_token):
     """Test file upload by operations user"""
@@ -75,7 +25,7 @@ def test_file_upload_ops_user(client, ops_token):
     
     # Create a test file
     data = {}
-    data['file'] = (io.BytesIO(b"test file content"), "test_file.docx")
+    data['file'] = (io.BytesIO(OOXML_MAGIC + b"test file content"), "test_file.docx")
     
     response = client.post(
         '/file/upload',
@@ -103,7 +53,7 @@ def test_file_upload_client_user(client, client_token):
     
     # Create a test file
     data = {}
-    data['file'] = (io.BytesIO(b"test file content"), "test_file.docx")
+    data['file'] = (io.BytesIO(OOXML_MAGIC + b"test file content"), "test_file.docx")
     
     response = client.post(
         '/file/upload',
@@ -122,7 +72,7 @@ def test_file_upload_invalid_extension(client, ops_token):
     
     # Create a test file with invalid extension
     data = {}
-    data['file'] = (io.BytesIO(b"test file content"), "test_file.txt")
+    data['file'] = (io.BytesIO(OOXML_MAGIC + b"test file content"), "test_file.txt")
     
     response = client.post(
         '/file/upload',
@@ -142,7 +92,7 @@ def test_list_files_client_user(client, client_token, ops_token):
     
     # Upload a file as ops user
     data = {}
-    data['file'] = (io.BytesIO(b"test file content"), "test_file.docx")
+    data['file'] = (io.BytesIO(OOXML_MAGIC + b"test file content"), "test_file.docx")
     
     client.post(
         '/file/upload',
@@ -183,7 +133,7 @@ def test_download_link_client_user(client, client_token, ops_token):
     
     # Upload a file as ops user
     data = {}
-    data['file'] = (io.BytesIO(b"test file content"), "test_file.docx")
+    data['file'] = (io.BytesIO(OOXML_MAGIC + b"test file content"), "test_file.docx")
     
     upload_response = client.post(
         '/file/upload',
@@ -213,7 +163,7 @@ def test_download_file_client_user(client, client_token, ops_token):
     client_token, _ = client_token
     
     # Upload a file as ops user
-    file_content = b"test file content"
+    file_content = OOXML_MAGIC + b"test file content"
     data = {}
     data['file'] = (io.BytesIO(file_content), "test_file.docx")
     
@@ -258,4 +208,782 @@ def test_download_file_ops_user(client, ops_token):
     
     assert response.status_code == 403
     data = json.loads(response.data)
-    assert 'Access denied' in data['message']
\ No newline at end of file
+    assert 'Access denied' in data['message']
+
+def test_list_files_keyset_pagination(client, client_token, ops_token):
+    """Test paging through files with a cursor and filtering them"""
+    _, ops_user_id = ops_token
+    client_token, client_user_id = client_token
+
+    with client.application.app_context():
+        for i in range(5):
+            db.session.add(File(
+                filename=f'stored_{i}.docx',
+                original_filename=f'doc_{i}.{"xlsx" if i % 2 else "docx"}',
+                file_type='xlsx' if i % 2 else 'docx',
+                user_id=client_user_id if i in (0, 4) else ops_user_id,
+                created_at=datetime(2024, 1, 1 + i)
+            ))
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {client_token}'}
+    seen = []
+    cursor = None
+    page_queries = []
+    while True:
+        url = '/file/list?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response, statements = count_statements(lambda: client.get(url, headers=headers).get_data())
+        data = json.loads(response)
+        seen.extend(f['filename'] for f in data['files'])
+        page_queries.append([s for s in statements if 'FROM file' in s or 'FROM user' in s])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == [f'doc_{i}.{"xlsx" if i % 2 else "docx"}' for i in range(5)]
+    # Uploaders come from the page's join, not a query per file; the first page also loads the identity
+    assert [len(queries) for queries in page_queries] == [2, 1, 1]
+    assert all('JOIN user' in queries[-1] for queries in page_queries)
+
+    response = client.get(
+        '/file/list?file_type=xlsx&uploaded_by=testops@example.com'
+        '&created_after=2024-01-03T00:00:00',
+        headers=headers
+    )
+    data = json.loads(response.data)
+    assert [f['filename'] for f in data['files']] == ['doc_3.xlsx']
+    assert data['files'][0]['uploaded_by'] == 'testops@example.com'
+
+    response = client.get('/file/list?cursor=not-a-cursor', headers=headers)
+    assert response.status_code == 400
+
+def test_chunked_upload_session(client, ops_token, client_token):
+    """Test uploading a file in out-of-order parts and assembling it"""
+    ops_token, ops_user_id = ops_token
+    client_token, _ = client_token
+    headers = {'Authorization': f'Bearer {ops_token}'}
+
+    response = client.post(
+        '/file/uploads',
+        data=json.dumps({'filename': 'big_deck.pptx'}),
+        headers=headers,
+        content_type='application/json'
+    )
+    assert response.status_code == 201
+    upload_id = json.loads(response.data)['upload_id']
+
+    parts = {1: b'first part, ', 2: b'second part, ', 3: b'third part'}
+    for number in (3, 1):
+        response = client.put(
+            f'/file/uploads/{upload_id}/parts/{number}',
+            data=parts[number],
+            headers=headers
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data)['size'] == len(parts[number])
+
+    response = client.get(f'/file/uploads/{upload_id}', headers=headers)
+    data = json.loads(response.data)
+    assert [p['part_number'] for p in data['parts']] == [1, 3]
+
+    response = client.post(
+        f'/file/uploads/{upload_id}/complete',
+        data=json.dumps({'total_parts': 3}),
+        headers=headers,
+        content_type='application/json'
+    )
+    assert response.status_code == 409
+    assert json.loads(response.data)['missing_parts'] == [2]
+    assert json.loads(response.data)['missing_count'] == 1
+
+    client.put(f'/file/uploads/{upload_id}/parts/2', data=parts[2], headers=headers)
+    response = client.post(
+        f'/file/uploads/{upload_id}/complete',
+        data=json.dumps({'total_parts': 3}),
+        headers=headers,
+        content_type='application/json'
+    )
+    assert response.status_code == 201
+    file_id = json.loads(response.data)['file_id']
+
+    with client.application.app_context():
+        file = File.query.get(file_id)
+        assert file.original_filename == 'big_deck.pptx'
+        assert file.user_id == ops_user_id
+        stored = b''.join(get_storage().read_range(file.filename))
+        assert stored == b''.join(parts[n] for n in (1, 2, 3))
+
+    response = client.get(f'/file/uploads/{upload_id}', headers=headers)
+    assert response.status_code == 404
+
+def test_chunked_upload_session_other_user(client, ops_token, client_token):
+    """Test that upload sessions are only reachable by the OPS user who started them"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+
+    response = client.post(
+        '/file/uploads',
+        data=json.dumps({'filename': 'big_deck.pptx'}),
+        headers={'Authorization': f'Bearer {client_token}'},
+        content_type='application/json'
+    )
+    assert response.status_code == 403
+
+    response = client.post(
+        '/file/uploads',
+        data=json.dumps({'filename': 'big_deck.pptx'}),
+        headers={'Authorization': f'Bearer {ops_token}'},
+        content_type='application/json'
+    )
+    upload_id = json.loads(response.data)['upload_id']
+
+    other_ops = User(email='otherops@example.com', password='password123', role=UserRole.OPS.value)
+    db.session.add(other_ops)
+    db.session.commit()
+    other_headers = {'Authorization': 'Bearer ' + create_access_token(identity={
+        'user_id': other_ops.id, 'email': other_ops.email, 'role': other_ops.role
+    })}
+
+    assert client.put(f'/file/uploads/{upload_id}/parts/1', data=b'intruder', headers=other_headers).status_code == 404
+    assert client.get(f'/file/uploads/{upload_id}', headers=other_headers).status_code == 404
+    response = client.post(
+        f'/file/uploads/{upload_id}/complete',
+        data=json.dumps({'total_parts': 1}),
+        headers=other_headers,
+        content_type='application/json'
+    )
+    assert response.status_code == 404
+    assert client.delete(f'/file/uploads/{upload_id}', headers=other_headers).status_code == 404
+
+    response = client.get(f'/file/uploads/{upload_id}', headers={'Authorization': f'Bearer {ops_token}'})
+    assert json.loads(response.data)['parts'] == []
+
+def test_chunked_upload_session_size_limit(client, ops_token):
+    """Test that parts are refused with 413 once the session would exceed its maximum size"""
+    ops_token, _ = ops_token
+    headers = {'Authorization': f'Bearer {ops_token}'}
+    client.application.config['UPLOAD_SESSION_MAX_SIZE'] = 20
+
+    response = client.post(
+        '/file/uploads',
+        data=json.dumps({'filename': 'big_deck.pptx'}),
+        headers=headers,
+        content_type='application/json'
+    )
+    upload_id = json.loads(response.data)['upload_id']
+
+    assert client.put(f'/file/uploads/{upload_id}/parts/1', data=b'x' * 12, headers=headers).status_code == 200
+    response = client.put(f'/file/uploads/{upload_id}/parts/2', data=b'x' * 12, headers=headers)
+    assert response.status_code == 413
+    # Re-sending a part replaces it, so its old size does not count twice
+    assert client.put(f'/file/uploads/{upload_id}/parts/1', data=b'x' * 15, headers=headers).status_code == 200
+
+    response = client.get(f'/file/uploads/{upload_id}', headers=headers)
+    assert [part['part_number'] for part in json.loads(response.data)['parts']] == [1]
+
+    response = client.post(
+        f'/file/uploads/{upload_id}/complete',
+        data=json.dumps({'total_parts': 10001}),
+        headers=headers,
+        content_type='application/json'
+    )
+    assert response.status_code == 400
+
+    response = client.post(
+        f'/file/uploads/{upload_id}/complete',
+        data=json.dumps({'total_parts': 10000}),
+        headers=headers,
+        content_type='application/json'
+    )
+    assert response.status_code == 409
+    data = json.loads(response.data)
+    assert data['missing_count'] == 9999
+    assert data['missing_parts'] == list(range(2, 102))
+
+    assert client.delete(f'/file/uploads/{upload_id}', headers=headers).status_code == 200
+    assert not os.path.exists(os.path.join(client.application.config['UPLOAD_STAGING_FOLDER'], upload_id))
+
+def test_duplicate_uploads_share_blob(client, ops_token):
+    """Test that identical uploads share one refcounted blob until the last delete"""
+    token, _ = ops_token
+    headers = {'Authorization': f'Bearer {token}'}
+
+    file_ids = []
+    for name in ('first.docx', 'second.docx'):
+        response = client.post(
+            '/file/upload',
+            data={'file': (io.BytesIO(OOXML_MAGIC + b"same deck content"), name)},
+            headers=headers,
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 201
+        file_ids.append(json.loads(response.data)['file_id'])
+
+    with client.application.app_context():
+        first, second = File.query.get(file_ids[0]), File.query.get(file_ids[1])
+        assert first.blob_sha256 == second.blob_sha256
+        blob = Blob.query.get(first.blob_sha256)
+        assert blob.refcount == 2
+        assert blob.size == len(OOXML_MAGIC + b"same deck content")
+        sha256 = blob.sha256
+
+    response = client.delete(f'/file/{file_ids[0]}', headers=headers)
+    assert response.status_code == 200
+    assert get_storage().exists(sha256)
+
+    response = client.delete(f'/file/{file_ids[1]}', headers=headers)
+    assert response.status_code == 200
+    assert not get_storage().exists(sha256)
+    with client.application.app_context():
+        assert Blob.query.get(sha256) is None
+
+def test_upload_racing_blob_collection(client, ops_token, monkeypatch):
+    """Test that an upload re-using bytes a delete just collected is retried, not committed"""
+    from app.services import blob_service
+    token, _ = ops_token
+    with client.application.app_context():
+        sha256, size, _ = store_stream(io.BytesIO(b"raced bytes"))
+        acquire_blob(sha256, size)
+        db.session.commit()
+        assert not collect_blob(sha256)
+        assert get_storage().exists(sha256)
+
+        # The upload found the bytes stored, then the last delete collected them
+        Blob.query.filter_by(sha256=sha256).delete()
+        db.session.commit()
+        assert collect_blob(sha256)
+        with pytest.raises(BlobMissing):
+            acquire_blob(sha256, size)
+        db.session.rollback()
+        assert Blob.query.get(sha256) is None
+
+    monkeypatch.setattr(blob_service, 'blob_exists', lambda sha256: False)
+    response = client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(OOXML_MAGIC + b"raced upload"), 'raced.docx')},
+        headers={'Authorization': f'Bearer {token}'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    with client.application.app_context():
+        assert File.query.count() == 0
+
+def test_download_file_conditional_and_ranges(client, client_token, ops_token):
+    """Test ETag revalidation and single/multi range downloads"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    content = OOXML_MAGIC + b"456789abcdefghij"
+    token = upload_and_get_download_token(client, ops_token, client_token, content)
+    url = f'/file/download-file/{token}'
+    auth = {'Authorization': f'Bearer {client_token}'}
+
+    response = client.get(url, headers=auth)
+    assert response.status_code == 200
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    etag = response.headers['ETag']
+    assert not etag.startswith('W/')
+
+    response = client.get(url, headers={**auth, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get(url, headers={**auth, 'Range': 'bytes=5-9'})
+    assert response.status_code == 206
+    assert response.data == b"56789"
+    assert response.headers['Content-Range'] == f'bytes 5-9/{len(content)}'
+
+    response = client.get(url, headers={**auth, 'Range': 'bytes=0-1,15-'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert b'Content-Range: bytes 0-1/20\r\n\r\nPK\r\n' in response.data
+    assert b'Content-Range: bytes 15-19/20\r\n\r\nfghij\r\n' in response.data
+
+    response = client.get(url, headers={**auth, 'Range': 'bytes=50-'})
+    assert response.status_code == 416
+
+    response = client.get(url, headers={**auth, 'Range': 'bytes=5-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == content
+
+def test_download_file_accel_redirect(client, client_token, ops_token):
+    """Test handing the download to the front proxy instead of streaming it"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    token = upload_and_get_download_token(client, ops_token, client_token, OOXML_MAGIC + b"offloaded")
+    client.application.config['DOWNLOAD_OFFLOAD'] = 'x-accel-redirect'
+
+    response = client.get(
+        f'/file/download-file/{token}',
+        headers={'Authorization': f'Bearer {client_token}'}
+    )
+
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'].startswith('/protected-uploads/')
+    assert 'test_file.docx' in response.headers['Content-Disposition']
+
+def test_identity_is_cached_and_invalidated(client, client_token):
+    """Test that repeated requests skip the user lookup until the user changes"""
+    token, user_id = client_token
+    headers = {'Authorization': f'Bearer {token}'}
+    statements = []
+
+    def count_user_queries(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM user' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count_user_queries)
+    try:
+        client.get('/file/list', headers=headers)
+        client.get('/file/list', headers=headers)
+        client.get('/file/list', headers=headers)
+        assert len(statements) == 1
+
+        user = db.session.get(User, user_id)
+        user.role = UserRole.OPS.value
+        db.session.flush()
+        cache = client.application.extensions['identity_cache']
+        assert cache.get(user_id) is not None
+        db.session.rollback()
+        assert cache.get(user_id) is not None
+
+        user.role = UserRole.OPS.value
+        db.session.flush()
+        assert cache.get(user_id) is not None
+        db.session.commit()
+        assert cache.get(user_id) is None
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_user_queries)
+
+    response = client.get('/file/list', headers=headers)
+    assert response.status_code == 403
+
+def test_batch_upload_files_and_archive(client, ops_token):
+    """Test uploading several files and a zip of files in one request"""
+    token, user_id = ops_token
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('decks/q1.pptx', OOXML_MAGIC + b"q1 deck")
+        zf.writestr('notes.txt', b"not allowed")
+        zf.writestr('report.docx', OOXML_MAGIC + b"report body")
+        zf.writestr('renamed.pptx', b"plain text")
+    archive.seek(0)
+
+    response = client.post(
+        '/file/upload/batch',
+        data={
+            'files': [
+                (io.BytesIO(OOXML_MAGIC + b"sheet"), 'budget.xlsx'),
+                (io.BytesIO(OOXML_MAGIC + b"report body"), 'report_copy.docx'),
+                (io.BytesIO(b"MZ executable"), 'payload.docx')
+            ],
+            'archive': (archive, 'bundle.zip')
+        },
+        headers={'Authorization': f'Bearer {token}'},
+        content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 201
+    results = {r['filename']: r for r in json.loads(response.data)['results']}
+    assert results['notes.txt']['status'] == 'error'
+    for name in ('renamed.pptx', 'payload.docx'):
+        assert results[name] == {
+            'filename': name, 'status': 'error', 'message': 'File content is not a valid Office document'
+        }
+    uploaded = {name for name, r in results.items() if r['status'] == 'uploaded'}
+    assert uploaded == {'budget.xlsx', 'report_copy.docx', 'q1.pptx', 'report.docx'}
+
+    with client.application.app_context():
+        files = File.query.filter_by(user_id=user_id).all()
+        assert len(files) == 4
+        shared = File.query.filter_by(original_filename='report.docx').one().blob_sha256
+        assert Blob.query.get(shared).refcount == 2
+
+def test_failed_batch_commit_releases_new_blobs(client, ops_token, monkeypatch):
+    """Test that a batch whose commit fails leaves no new bytes and no extra references behind"""
+    token, _ = ops_token
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(OOXML_MAGIC + b"kept deck"), 'kept.pptx')},
+        headers=headers,
+        content_type='multipart/form-data'
+    )
+    kept = File.query.get(json.loads(response.data)['file_id']).blob_sha256
+
+    commit = db.session.commit
+    commits = []
+
+    def fail_first_commit():
+        # Only the batch's own commit fails; collecting its new bytes commits normally
+        commits.append(1)
+        if len(commits) == 1:
+            raise RuntimeError('database is locked')
+        commit()
+    monkeypatch.setattr(db.session, 'commit', fail_first_commit)
+    with pytest.raises(RuntimeError):
+        client.post(
+            '/file/upload/batch',
+            data={'files': [
+                (io.BytesIO(OOXML_MAGIC + b"kept deck"), 'again.pptx'),
+                (io.BytesIO(OOXML_MAGIC + b"new deck"), 'new.pptx')
+            ]},
+            headers=headers,
+            content_type='multipart/form-data'
+        )
+    monkeypatch.undo()
+
+    assert Blob.query.get(kept).refcount == 1
+    assert get_storage().exists(kept)
+    assert [blob.sha256 for blob in Blob.query.all()] == [kept]
+    assert list(get_storage().iter_keys()) == [kept]
+
+def test_download_archive_streams_zip(client, client_token, ops_token):
+    """Test downloading several files as one stored ZIP archive"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+
+    file_ids = []
+    for content in (OOXML_MAGIC + b"first deck", OOXML_MAGIC + b"second deck"):
+        response = client.post(
+            '/file/upload',
+            data={'file': (io.BytesIO(content), 'deck.pptx')},
+            headers={'Authorization': f'Bearer {ops_token}'},
+            content_type='multipart/form-data'
+        )
+        file_ids.append(json.loads(response.data)['file_id'])
+
+    response = client.post(
+        '/file/download/archive',
+        data=json.dumps({'file_ids': file_ids}),
+        headers={'Authorization': f'Bearer {client_token}'},
+        content_type='application/json'
+    )
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.namelist() == ['deck.pptx', 'deck (1).pptx']
+        assert zf.read('deck.pptx') == OOXML_MAGIC + b"first deck"
+        assert zf.read('deck (1).pptx') == OOXML_MAGIC + b"second deck"
+        assert {info.compress_type for info in zf.infolist()} == {zipfile.ZIP_STORED}
+
+    response = client.post(
+        '/file/download/archive',
+        data=json.dumps({'file_ids': [file_ids[0], 9999]}),
+        headers={'Authorization': f'Bearer {client_token}'},
+        content_type='application/json'
+    )
+    assert response.status_code == 404
+    assert json.loads(response.data)['missing'] == [9999]
+
+    for bad in ({'file_ids': ['1', {}]}, {'file_ids': [[1]]}, {'tokens': [7]}):
+        response = client.post(
+            '/file/download/archive',
+            data=json.dumps(bad),
+            headers={'Authorization': f'Bearer {client_token}'},
+            content_type='application/json'
+        )
+        assert response.status_code == 400
+
+def test_unique_archive_names_skip_requested_names():
+    """Test that a generated ' (n)' name never repeats a name that was asked for"""
+    names = unique_archive_names(['a.docx', 'a (1).docx', 'a.docx', 'a.docx', 'notes', 'notes'])
+    assert names == ['a.docx', 'a (1).docx', 'a (2).docx', 'a (3).docx', 'notes', 'notes (1)']
+    assert len(set(names)) == len(names)
+
+def test_signed_download_link_needs_no_database(client, client_token, ops_token):
+    """Test that a signed link is served without any query on the file table"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    token = upload_and_get_download_token(client, ops_token, client_token, OOXML_MAGIC + b"signed content")
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(
+            f'/file/download-file/{token}',
+            headers={'Authorization': f'Bearer {client_token}'}
+        )
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 200
+    assert response.data == OOXML_MAGIC + b"signed content"
+    assert not [s for s in statements if 'FROM file' in s]
+
+def test_signed_download_link_rejections(client, client_token, ops_token):
+    """Test tampered, foreign, revoked and expired download links"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    token = upload_and_get_download_token(client, ops_token, client_token, OOXML_MAGIC + b"guarded")
+    url = f'/file/download-file/{token}'
+
+    response = client.get(url[:-2] + 'xx', headers={'Authorization': f'Bearer {client_token}'})
+    assert response.status_code == 404
+
+    with client.application.app_context():
+        other = User(email='other@example.com', password='password123', role=UserRole.CLIENT.value)
+        db.session.add(other)
+        db.session.commit()
+        other_token = create_access_token(identity={
+            'user_id': other.id, 'email': other.email, 'role': other.role
+        })
+    response = client.get(url, headers={'Authorization': f'Bearer {other_token}'})
+    assert response.status_code == 403
+
+    client.application.config['DOWNLOAD_LINK_TTL'] = -1
+    response = client.get(url, headers={'Authorization': f'Bearer {client_token}'})
+    assert response.status_code == 410
+    client.application.config['DOWNLOAD_LINK_TTL'] = 3600
+
+    file_id = File.query.one().id
+    response = client.post(
+        '/file/download-links/revoke',
+        data=json.dumps({'file_id': file_id}),
+        headers={'Authorization': f'Bearer {ops_token}'},
+        content_type='application/json'
+    )
+    assert response.status_code == 200
+    response = client.get(url, headers={'Authorization': f'Bearer {client_token}'})
+    assert response.status_code == 410
+    assert 'revoked' in json.loads(response.data)['message']
+
+def test_list_files_etag_follows_catalog_version(client, client_token, ops_token):
+    """Test that an unchanged catalog answers 304 without touching the database"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    client.application.config['CATALOG_VERSION_TTL'] = 60
+    headers = {'Authorization': f'Bearer {client_token}'}
+
+    for n in range(30):
+        client.post(
+            '/file/upload',
+            data={'file': (io.BytesIO(OOXML_MAGIC + f'content {n}'.encode()), f'report_{n}.docx')},
+            headers={'Authorization': f'Bearer {ops_token}'},
+            content_type='multipart/form-data'
+        )
+
+    response = client.get('/file/list', headers=headers)
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert len(response.get_json()['files']) == 30
+
+    response, statements = count_statements(
+        lambda: client.get('/file/list', headers={**headers, 'If-None-Match': etag})
+    )
+    assert response.status_code == 304
+    assert statements == []
+
+    response = client.get('/file/list', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data))['files'][0]['filename'] == 'report_0.docx'
+
+    client.delete(f'/file/{File.query.first().id}', headers={'Authorization': f'Bearer {ops_token}'})
+    response = client.get('/file/list', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.get_json()['files']) == 29
+
+def test_list_files_streams_and_bounds_cached_pages(client, client_token, ops_token):
+    """Test that a miss is streamed, only small pages are cached and updates keep the version"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    client.application.config['CATALOG_VERSION_TTL'] = 60
+    headers = {'Authorization': f'Bearer {client_token}'}
+    for n in range(3):
+        client.post(
+            '/file/upload',
+            data={'file': (io.BytesIO(OOXML_MAGIC + f'page {n}'.encode()), f'page_{n}.docx')},
+            headers={'Authorization': f'Bearer {ops_token}'},
+            content_type='multipart/form-data'
+        )
+
+    response = client.get('/file/list?limit=1', headers=headers)
+    assert response.is_streamed
+    assert len(response.get_json()['files']) == 1
+    _, statements = count_statements(lambda: client.get('/file/list?limit=1', headers=headers).get_data())
+    assert statements == []
+
+    client.application.config['RESPONSE_CACHE_MAX_BODY_SIZE'] = 100
+    assert len(client.get('/file/list', headers=headers).get_json()['files']) == 3
+    _, statements = count_statements(lambda: client.get('/file/list', headers=headers).get_data())
+    assert statements
+
+    version = CatalogVersion.query.get(1).version
+    for file in File.query.all():
+        file.processing_status = 'done'
+    db.session.commit()
+    assert CatalogVersion.query.get(1).version == version
+
+def test_download_link_is_reused_until_revoked(client, client_token, ops_token):
+    """Test that repeated link requests reuse one token and revalidate by ETag"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    client.application.config['CATALOG_VERSION_TTL'] = 60
+    headers = {'Authorization': f'Bearer {client_token}'}
+
+    client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(OOXML_MAGIC + b'linked'), 'linked.docx')},
+        headers={'Authorization': f'Bearer {ops_token}'},
+        content_type='multipart/form-data'
+    )
+    file_id = File.query.one().id
+
+    first = client.get(f'/file/download/{file_id}', headers=headers)
+    # Revocations are read from the database at most once per refresh interval
+    is_link_revoked(file_id, None, time.time())
+    second, statements = count_statements(lambda: client.get(f'/file/download/{file_id}', headers=headers))
+    assert second.get_json()['download_link'] == first.get_json()['download_link']
+    assert statements == []
+
+    cached = client.get(f'/file/download/{file_id}', headers={**headers, 'If-None-Match': first.headers['ETag']})
+    assert cached.status_code == 304
+
+    client.post(
+        '/file/download-links/revoke',
+        data=json.dumps({'file_id': file_id}),
+        headers={'Authorization': f'Bearer {ops_token}'},
+        content_type='application/json'
+    )
+    time.sleep(1)
+    renewed = client.get(f'/file/download/{file_id}', headers=headers)
+    assert renewed.get_json()['download_link'] != first.get_json()['download_link']
+    token = renewed.get_json()['download_link'].rsplit('/', 1)[1]
+    assert client.get(f'/file/download-file/{token}', headers=headers).status_code == 200
+
+def test_upload_is_streamed_into_storage(client, ops_token, monkeypatch):
+    """Test that uploads bypass Werkzeug's spooling and are checked while streamed"""
+    import werkzeug.formparser
+    from app.routes import file_routes
+    token, _ = ops_token
+    headers = {'Authorization': f'Bearer {token}'}
+    storage = get_storage()
+
+    def no_spooling(*args, **kwargs):
+        raise AssertionError('upload was spooled to a temporary file')
+    monkeypatch.setattr(werkzeug.formparser, 'default_stream_factory', no_spooling)
+
+    content = OOXML_MAGIC + b'streamed deck' * 1000
+    response = client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(content), 'deck.pptx')},
+        headers=headers,
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    blob = Blob.query.get(File.query.get(response.get_json()['file_id']).blob_sha256)
+    assert blob.size == len(content)
+    assert b''.join(storage.read_range(blob.sha256)) == content
+
+    response = client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(b'plain text, renamed'), 'notes.docx')},
+        headers=headers,
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 400
+    assert 'not a valid Office document' in response.get_json()['message']
+
+    def failing_enqueue(file):
+        raise RuntimeError('database went away')
+    monkeypatch.setattr(file_routes, 'enqueue_processing', failing_enqueue)
+    new_content = OOXML_MAGIC + b'never committed'
+    with pytest.raises(RuntimeError):
+        client.post(
+            '/file/upload',
+            data={'file': (io.BytesIO(new_content), 'lost.docx')},
+            headers=headers,
+            content_type='multipart/form-data'
+        )
+    assert File.query.count() == 1
+    assert Blob.query.count() == 1
+    assert not storage.exists(hashlib.sha256(new_content).hexdigest())
+
+def test_batch_download_links(client, client_token, ops_token):
+    """Test that links for many files are resolved with one file query"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    headers = {'Authorization': f'Bearer {client_token}'}
+    file_ids = []
+    for i in range(3):
+        response = client.post(
+            '/file/upload',
+            data={'file': (io.BytesIO(OOXML_MAGIC + f'batch {i}'.encode()), f'batch{i}.docx')},
+            headers={'Authorization': f'Bearer {ops_token}'},
+            content_type='multipart/form-data'
+        )
+        file_ids.append(response.get_json()['file_id'])
+
+    response, statements = count_statements(lambda: client.post(
+        '/file/download/links',
+        data=json.dumps({'file_ids': file_ids + [99999]}),
+        headers=headers,
+        content_type='application/json'
+    ))
+    assert response.status_code == 200
+    data = response.get_json()
+    assert set(data['links']) == {str(file_id) for file_id in file_ids}
+    assert data['errors'] == {'99999': 'File not found'}
+    assert len([s for s in statements if 'FROM file' in s]) == 1
+
+    token = data['links'][str(file_ids[1])]['download_link'].rsplit('/', 1)[1]
+    download = client.get(f'/file/download-file/{token}', headers=headers)
+    assert download.data == OOXML_MAGIC + b'batch 1'
+
+    for bad in (['x'], [[1]], [True]):
+        response = client.post(
+            '/file/download/links',
+            data=json.dumps({'file_ids': file_ids + bad}),
+            headers=headers,
+            content_type='application/json'
+        )
+        assert response.status_code == 400
+
+    too_many = client.post(
+        '/file/download/links',
+        data=json.dumps({'file_ids': list(range(client.application.config['DOWNLOAD_LINKS_MAX_FILES'] + 1))}),
+        headers=headers,
+        content_type='application/json'
+    )
+    assert too_many.status_code == 400
+
+    forbidden = client.post(
+        '/file/download/links',
+        data=json.dumps({'file_ids': file_ids}),
+        headers={'Authorization': f'Bearer {ops_token}'},
+        content_type='application/json'
+    )
+    assert forbidden.status_code == 403
+
+def test_deleted_file_link_is_revoked_on_every_worker(client, client_token, ops_token):
+    """Test that link revocations are shared through the database and survive restarts"""
+    ops_token, _ = ops_token
+    client_token, _ = client_token
+    headers = {'Authorization': f'Bearer {client_token}'}
+    token = upload_and_get_download_token(client, ops_token, client_token, OOXML_MAGIC + b"short lived")
+    app = client.application
+
+    delete_files(File.query.all())
+    assert LinkRevocation.query.filter_by(kind='file').count() == 1
+
+    # A worker that did not handle the delete, or one started afterwards
+    app.extensions['download_revocations'] = RevocationSet(app.config['DOWNLOAD_LINK_TTL'], 60, 60)
+    response = client.get(f'/file/download-file/{token}', headers=headers)
+    assert response.status_code == 410
+    assert response.get_json()['message'] == 'Download link has been revoked'
+
+    # Before it has seen the revocation, a missing blob is a 404 rather than an error
+    app.extensions['download_revocations'] = RevocationSet(app.config['DOWNLOAD_LINK_TTL'], 60, 60)
+    LinkRevocation.query.delete()
+    db.session.commit()
+    response = client.get(f'/file/download-file/{token}', headers=headers)
+    assert response.status_code == 404
@@ -0,0 +1,113 @@
+import pytest
+import io
+import json
+import os
+import subprocess
+import sys
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models import User, UserRole
+from app.config import TestingConfig
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'METRICS_ENABLED', True)
+    app = create_app('testing')
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.session.remove()
+            db.drop_all()
+
+def _sample(text, name, **labels):
+    """Read one sample value out of Prometheus text output"""
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f'{name}{{{wanted}}} ' if labels else f'{name} '
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+def test_metrics_record_requests_queries_and_bytes(client):
+    """Test that latency, SQL, bcrypt, byte and queue metrics are exported"""
+    client.post(
+        '/auth/signup',
+        data=json.dumps({'email': 'client@example.com', 'password': 'password123'}),
+        content_type='application/json'
+    )
+    response = client.post(
+        '/auth/login',
+        data=json.dumps({'email': 'client@example.com', 'password': 'password123'}),
+        content_type='application/json'
+    )
+    reader = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+    ops = User(email='ops@example.com', password='password123', role=UserRole.OPS.value)
+    db.session.add(ops)
+    db.session.commit()
+    token = create_access_token(identity={'user_id': ops.id, 'email': ops.email, 'role': ops.role})
+    client.post(
+        '/file/upload',
+        data={'file': (io.BytesIO(b'PK\x03\x04' + b'x' * 996), 'report.docx')},
+        headers={'Authorization': f'Bearer {token}'},
+        content_type='multipart/form-data'
+    )
+    link = client.get('/file/download/1', headers=reader).get_json()['download_link']
+    assert client.get(link, headers=reader).data == b'PK\x03\x04' + b'x' * 996
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+
+    assert _sample(text, 'http_request_duration_seconds_count',
+                   endpoint='file.upload_file', method='POST', status='201') == 1
+    assert _sample(text, 'http_request_db_queries_sum', endpoint='auth.signup') >= 2
+    assert _sample(text, 'http_request_db_seconds_count', endpoint='auth.login') == 1
+    assert _sample(text, 'file_upload_bytes_total') > 1000
+    assert _sample(text, 'file_download_bytes_total') == 1000
+    assert _sample(text, 'password_hash_duration_seconds_count', operation='hash') == 2
+    assert _sample(text, 'password_hash_duration_seconds_count', operation='verify') == 1
+    assert _sample(text, 'email_outbox_pending') == 1
+    assert _sample(text, 'document_jobs_pending') == 1
+
+def test_metrics_disabled_by_default():
+    """Test that /metrics only exists when METRICS_ENABLED is set"""
+    app = create_app('testing')
+    assert 'metrics' not in app.extensions
+    assert app.test_client().get('/metrics').status_code == 404
+
+WORKER = '''
+from app import create_app, db
+app = create_app('testing')
+with app.app_context():
+    db.create_all()
+client = app.test_client()
+for _ in range({requests}):
+    client.get('/')
+print(client.get('/metrics').get_data(as_text=True))
+'''
+
+def test_metrics_are_merged_across_processes(tmp_path):
+    """Test that every worker process contributes to the totals of any scrape"""
+    multiproc_dir = tmp_path / 'metrics'
+    multiproc_dir.mkdir()
+    env = {
+        **os.environ,
+        'METRICS_ENABLED': 'True',
+        'PROMETHEUS_MULTIPROC_DIR': str(multiproc_dir),
+        'TEST_DATABASE_URL': f'sqlite:///{tmp_path}/metrics.sqlite'
+    }
+
+    outputs = [
+        subprocess.run(
+            [sys.executable, '-c', WORKER.format(requests=requests)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        for requests in (2, 3)
+    ]
+
+    labels = {'endpoint': 'index', 'method': 'GET', 'status': '200'}
+    assert _sample(outputs[0], 'http_request_duration_seconds_count', **labels) == 2
+    assert _sample(outputs[1], 'http_request_duration_seconds_count', **labels) == 5
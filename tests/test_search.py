@@ -0,0 +1,69 @@
+from app import db
+from app.models import UserRole
+from app.services.document_service import process_pending_documents
+from tests.helpers import docx, make_token, pptx, upload
+
+def _search(client, token, query, **params):
+    return client.get(
+        '/file/search',
+        query_string={'q': query, **params},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+def test_search_by_content_and_name(client):
+    """Test that uploads are indexed by name and text, ranked and paginated"""
+    ops = make_token(UserRole.OPS.value, 'ops@example.com')
+    reader = make_token(UserRole.CLIENT.value, 'client@example.com')
+
+    contract_id = upload(client, ops, 'contract.docx', docx('Payment terms are net thirty days'))
+    upload(client, ops, 'roadmap.pptx', pptx('Product roadmap', 'Payment integration'))
+    named_id = upload(client, ops, 'payment_schedule.docx', docx('Nothing relevant here'))
+    upload(client, ops, 'broken.xlsx', b'PK\x03\x04 not a zip file')
+    assert _search(client, reader, 'payment').get_json()['results'] == []
+    assert process_pending_documents() == 3
+
+    response = _search(client, reader, 'payment')
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert len(results) == 3
+    assert results[0]['id'] == named_id
+    assert {r['id'] for r in results} >= {contract_id}
+    assert results[0]['uploaded_by'] == 'ops@example.com'
+
+    snippet = next(r['snippet'] for r in results if r['id'] == contract_id)
+    assert '[Payment]' in snippet
+
+    assert [r['id'] for r in _search(client, reader, 'thirty da').get_json()['results']] == [contract_id]
+    assert len(_search(client, reader, 'broken').get_json()['results']) == 1
+
+    second_page = _search(client, reader, 'payment', page=2, per_page=2).get_json()
+    assert len(second_page['results']) == 1
+
+    client.delete(f'/file/{contract_id}', headers={'Authorization': f'Bearer {ops}'})
+    assert _search(client, reader, 'thirty').get_json()['results'] == []
+
+def test_search_validation(client):
+    """Test search access control and query validation"""
+    ops = make_token(UserRole.OPS.value, 'ops@example.com')
+    reader = make_token(UserRole.CLIENT.value, 'client@example.com')
+
+    assert _search(client, ops, 'payment').status_code == 403
+    assert _search(client, reader, '   ').status_code == 400
+    assert _search(client, reader, 'x', page=0).status_code == 400
+    assert _search(client, reader, '"*)(').get_json()['results'] == []
+
+def test_reindex_command(client):
+    """Test that the reindex command rebuilds the index from stored files"""
+    ops = make_token(UserRole.OPS.value, 'ops@example.com')
+    reader = make_token(UserRole.CLIENT.value, 'client@example.com')
+    upload(client, ops, 'minutes.docx', docx('Board meeting minutes'))
+    process_pending_documents()
+
+    db.session.execute(db.text('DELETE FROM file_search'))
+    db.session.commit()
+    assert _search(client, reader, 'board').get_json()['results'] == []
+
+    runner = client.application.test_cli_runner()
+    assert 'Queued 1 files' in runner.invoke(args=['search', 'reindex', '--batch-size', '1']).output
+    assert 'Processed 1 documents' in runner.invoke(args=['process-documents']).output
+    assert len(_search(client, reader, 'board').get_json()['results']) == 1
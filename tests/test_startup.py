@@ -0,0 +1,67 @@
+import subprocess
+import sys
+from app import create_app, db
+from app.services.auth_service import hash_password, get_hash_rounds
+from app.services.startup_service import PROJECT_ROOT, parse_import_times
+
+def test_create_app_defers_migrations_and_dotenv():
+    """Test that building the app imports neither Alembic nor python-dotenv"""
+    result = subprocess.run(
+        [sys.executable, '-c',
+         "import sys; from app import create_app; create_app('testing'); "
+         "print(sorted(m for m in ('alembic', 'flask_migrate', 'dotenv') if m in sys.modules))"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '[]'
+
+def test_calibrate_bcrypt_command():
+    """Test that calibration runs from the CLI and leaves the configured cost alone"""
+    app = create_app('testing')
+    app.config.update(BCRYPT_MIN_ROUNDS=4, BCRYPT_MAX_ROUNDS=4)
+    result = app.test_cli_runner().invoke(args=['calibrate-bcrypt', '--target-ms', '1'])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip() == 'BCRYPT_LOG_ROUNDS=4'
+
+    with app.app_context():
+        password_hash = hash_password('password123')
+    assert get_hash_rounds(password_hash) == app.config['BCRYPT_LOG_ROUNDS']
+
+def test_services_and_workers_wait_for_first_use():
+    """Test that building the app starts no worker and builds no service until a request"""
+    app = create_app('testing')
+    app.config['EMAIL_OUTBOX_WORKER'] = True
+    assert not {'storage', 'catalog', 'rate_limits', 'email_worker'} & set(app.extensions)
+
+    with app.app_context():
+        db.create_all()
+    try:
+        client = app.test_client()
+        assert client.get('/').status_code == 200
+        worker = app.extensions['email_worker']
+        client.get('/')
+        assert app.extensions['email_worker'] is worker
+    finally:
+        worker.stop(5)
+        with app.app_context():
+            db.drop_all()
+
+def test_parse_import_times():
+    """Test summing importtime self times per top-level package"""
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       100 |        100 |   encodings',
+        'import time:      2000 |       2000 |     sqlalchemy.sql',
+        'import time:      1000 |       3000 |   sqlalchemy',
+        'import time:       500 |       3500 | app'
+    ])
+    assert parse_import_times(output, exclude={'encodings'}) == {'sqlalchemy': 0.003, 'app': 0.0005}
+
+def test_startup_profile_command():
+    """Test the startup-profile command on a cold interpreter"""
+    app = create_app('testing')
+    result = app.test_cli_runner().invoke(args=['startup-profile', '--config', 'testing', '--top', '3'])
+    assert result.exit_code == 0, result.output
+    assert 'create_app()' in result.output
+    assert 'Init time per component:' in result.output
+    assert 'sqlalchemy' in result.output
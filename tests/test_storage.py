@@ -0,0 +1,226 @@
+import pytest
+import os
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import Blob, EmailOutbox, File, UploadSession
+from app.services.ingest_service import OOXML_MAGIC
+from app.services.storage_service import LocalStorage, MemoryStorage, S3Storage, StorageBackend, get_storage
+from app.services.sweep_service import SweepAborted, SweepState, run_sweep
+from app.services.upload_service import part_path, session_dir
+from tests.helpers import upload
+
+@pytest.fixture
+def s3_storage():
+    """An S3Storage talking to moto's in-process stand-in for S3"""
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='uploads')
+        yield S3Storage('uploads', prefix='files/', client=client)
+
+@pytest.fixture(params=['local', 'memory', 's3'])
+def storage(request, tmp_path):
+    if request.param == 'local':
+        return LocalStorage(str(tmp_path))
+    if request.param == 'memory':
+        return MemoryStorage()
+    return request.getfixturevalue('s3_storage')
+
+def test_storage_round_trip(storage):
+    """Test the contract every storage driver implements"""
+    with storage.writer('deck.pptx') as out:
+        out.write(b"0123456789")
+
+    assert storage.exists('deck.pptx')
+    assert storage.size('deck.pptx') == 10
+    assert b''.join(storage.read_range('deck.pptx')) == b"0123456789"
+    assert b''.join(storage.read_range('deck.pptx', 2, 5, chunk_size=2)) == b"234"
+    assert list(storage.iter_keys()) == ['deck.pptx']
+
+    with storage.local_file('deck.pptx') as path:
+        with open(path, 'rb') as f:
+            assert f.read() == b"0123456789"
+
+    storage.delete('deck.pptx')
+    assert not storage.exists('deck.pptx')
+
+def test_storage_discards_failed_writes(storage):
+    """Test that nothing is published when a write is interrupted"""
+    with pytest.raises(RuntimeError):
+        with storage.writer('broken.docx') as out:
+            out.write(b"partial")
+            raise RuntimeError('connection dropped')
+
+    assert not storage.exists('broken.docx')
+    assert list(storage.iter_keys()) == []
+
+def test_incomplete_storage_driver_is_rejected():
+    """Test that a driver missing part of the contract fails when built, not on first use"""
+    class WriteOnlyStorage(StorageBackend):
+        def stage(self):
+            return None
+
+    with pytest.raises(TypeError):
+        WriteOnlyStorage()
+
+def test_local_storage_shards_keys(tmp_path):
+    """Test that local files land in hash-prefix subdirectories"""
+    storage = LocalStorage(str(tmp_path), shard_depth=2)
+    with storage.writer('report.docx') as out:
+        out.write(b"report")
+
+    relative = storage.relative_path('report.docx').split('/')
+    assert len(relative) == 3
+    assert all(len(part) == 2 for part in relative[:2])
+    assert relative[2] == 'report.docx'
+
+    with pytest.raises(ValueError):
+        storage.path_for('../escape.docx')
+
+def test_storage_migrate_command(tmp_path):
+    """Test moving a flat upload folder into the sharded layout"""
+    app = create_app('testing')
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    app.config['STORAGE_BACKEND'] = 'local'
+    app.extensions['storage'] = LocalStorage(str(tmp_path))
+    (tmp_path / 'legacy.docx').write_bytes(b"legacy bytes")
+
+    # Flat files stay readable before the migration runs
+    assert b''.join(app.extensions['storage'].read_range('legacy.docx')) == b"legacy bytes"
+
+    result = app.test_cli_runner().invoke(args=['storage', 'migrate'])
+
+    assert 'Moved 1 files' in result.output
+    assert not (tmp_path / 'legacy.docx').exists()
+    storage = app.extensions['storage']
+    assert os.path.exists(storage.shard_path('legacy.docx'))
+    assert b''.join(storage.read_range('legacy.docx')) == b"legacy bytes"
+
+@pytest.fixture
+def swept_client(client, tmp_path):
+    """The test client on local storage in tmp_path, with no grace period for orphans"""
+    app = client.application
+    app.config['UPLOAD_STAGING_FOLDER'] = str(tmp_path / '.sessions')
+    app.config['STORAGE_ORPHAN_GRACE'] = timedelta(0)
+    app.extensions['storage'] = LocalStorage(str(tmp_path))
+    return client
+
+def test_storage_sweep_command(swept_client, ops_token):
+    """Test that a sweep removes orphaned bytes and dangling rows but keeps live files"""
+    token, user_id = ops_token
+    kept_id = upload(swept_client, token, 'kept.docx', OOXML_MAGIC + b"kept")
+    storage = get_storage()
+
+    with storage.writer('orphan') as out:
+        out.write(b"0123456789")
+    with storage.writer('unreferenced') as out:
+        out.write(b"1234567")
+    db.session.add(Blob(sha256='unreferenced', size=7, refcount=1))
+    db.session.add(Blob(sha256='missing', size=3, refcount=1))
+    db.session.add(File(filename='missing', original_filename='lost.docx', file_type='docx',
+                        user_id=user_id, blob_sha256='missing'))
+    db.session.commit()
+
+    result = swept_client.application.test_cli_runner().invoke(args=['storage', 'sweep', '--batch-size', '2'])
+
+    assert result.exit_code == 0
+    assert 'Reclaimed 17 bytes' in result.output
+    assert not storage.exists('orphan')
+    assert not storage.exists('unreferenced')
+    assert Blob.query.get('unreferenced') is None
+    assert Blob.query.get('missing') is None
+    assert File.query.filter_by(filename='missing').first() is None
+
+    kept = File.query.get(kept_id)
+    assert storage.exists(kept.blob_sha256)
+    assert Blob.query.get(kept.blob_sha256).refcount == 1
+
+def test_storage_sweep_dry_run(swept_client, ops_token):
+    """Test that a dry run reports what a sweep would remove and removes nothing"""
+    token, user_id = ops_token
+    storage = get_storage()
+    with storage.writer('orphan') as out:
+        out.write(b"0123456789")
+    db.session.add(File(filename='missing', original_filename='lost.docx', file_type='docx', user_id=user_id))
+    db.session.commit()
+
+    result = swept_client.application.test_cli_runner().invoke(args=['storage', 'sweep', '--dry-run'])
+
+    assert result.exit_code == 0
+    assert 'Would reclaim 10 bytes' in result.output
+    assert storage.exists('orphan')
+    assert File.query.filter_by(filename='missing').count() == 1
+
+def test_storage_sweep_refuses_unavailable_storage(swept_client, ops_token, tmp_path):
+    """Test that files are kept when the store is unmounted or mostly missing"""
+    token, user_id = ops_token
+    kept_id = upload(swept_client, token, 'kept.docx', OOXML_MAGIC + b"kept")
+    app = swept_client.application
+    app.extensions['storage'] = LocalStorage(str(tmp_path / 'unmounted'))
+
+    with pytest.raises(SweepAborted):
+        run_sweep()
+    result = app.test_cli_runner().invoke(args=['storage', 'sweep'])
+    assert result.exit_code != 0
+    assert File.query.get(kept_id) is not None
+
+    app.extensions['storage'] = LocalStorage(str(tmp_path / 'empty'))
+    os.makedirs(tmp_path / 'empty')
+    app.config['STORAGE_SWEEP_MISSING_ALLOWANCE'] = 0
+    with pytest.raises(SweepAborted):
+        run_sweep()
+    assert File.query.get(kept_id) is not None
+
+    report = run_sweep(force=True)
+    assert report['dangling_blobs'] == 1
+    assert File.query.get(kept_id) is None
+
+def test_storage_sweep_applies_retention(swept_client, ops_token):
+    """Test that expired files, upload sessions and sent emails are removed"""
+    token, user_id = ops_token
+    app = swept_client.application
+    app.config['FILE_RETENTION_DAYS'] = 30
+    file_id = upload(swept_client, token, 'expiring.docx', OOXML_MAGIC + b"expiring")
+    fresh_id = upload(swept_client, token, 'fresh.docx', OOXML_MAGIC + b"fresh")
+    expired = File.query.get(file_id)
+    expired.created_at = datetime.utcnow() - timedelta(days=31)
+    sha256 = expired.blob_sha256
+
+    session = UploadSession(user_id=user_id, original_filename='big.docx', file_type='docx',
+                            created_at=datetime.utcnow() - timedelta(days=2))
+    db.session.add(session)
+    db.session.add(EmailOutbox(recipient='a@example.com', subject='Hi', html='<p>Hi</p>', status='sent',
+                               created_at=datetime.utcnow() - timedelta(days=60)))
+    db.session.commit()
+    os.makedirs(session_dir(session.id))
+    with open(part_path(session.id, 1), 'wb') as f:
+        f.write(b"part")
+    os.makedirs(session_dir('abandoned'))
+
+    report = run_sweep()
+
+    assert report['expired_files'] == 1
+    assert report['upload_sessions'] == 2
+    assert report['expired_emails'] == 1
+    assert report['bytes_reclaimed'] == len(OOXML_MAGIC + b"expiring") + len(b"part")
+    assert File.query.get(file_id) is None
+    assert File.query.get(fresh_id) is not None
+    assert not get_storage().exists(sha256)
+    assert UploadSession.query.count() == 0
+    assert not os.path.exists(session_dir('abandoned'))
+    assert EmailOutbox.query.count() == 0
+
+def test_storage_sweep_is_incremental(swept_client):
+    """Test that bounded passes resume where the previous one stopped"""
+    storage = get_storage()
+    for key in ('a', 'b', 'c'):
+        with storage.writer(key) as out:
+            out.write(b"x")
+
+    state = SweepState()
+    for remaining in (2, 1, 0):
+        report = run_sweep(state, batch_size=1, max_batches=1)
+        assert report['orphan_keys'] == 1
+        assert len(list(storage.iter_keys())) == remaining